@@ -0,0 +1 @@
+"""Замеры производительности сравнения табелей (синтетические данные)"""
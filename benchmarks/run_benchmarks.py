@@ -0,0 +1,144 @@
+"""
+ЗАМЕРЫ ПРОИЗВОДИТЕЛЬНОСТИ СРАВНЕНИЯ ТАБЕЛЕЙ
+Автор: VaSeBa
+
+Генерирует синтетические табели заданных размеров, выполняет на них
+сравнение и записывает время и пиковую память каждого этапа (загрузка,
+проверка, объединение, поиск различий, подсветка, отчет) по данным
+профилировщика конвейера в JSON-файл, чтобы результаты разных запусков
+можно было сравнить.
+
+Пример:
+    python -m benchmarks.run_benchmarks --employees 1000 10000 50000
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from benchmarks.synthetic import generate_pair
+from pipeline import ComparisonPipeline
+
+# Каталог результатов по умолчанию
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def run_case(base_path, compare_path, standalone_report=False, trace_memory=True,
+             chunk_rows=None):
+    """Прогон конвейера на одной паре файлов с профилированием этапов"""
+    pipeline = ComparisonPipeline(base_path, compare_path, 1, 2025,
+                                  standalone_report=standalone_report,
+                                  profile_memory=trace_memory, chunk_rows=chunk_rows)
+    pipeline.run()
+    profile = pipeline.profiler.to_dict()
+    return profile['stages'], profile['counters'], pipeline.report_counts
+
+
+def peak_rss_mb():
+    """Пиковый объем памяти процесса (если доступен на платформе)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS значение в байтах, в Linux - в килобайтах
+    return round(peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10, 2)
+
+
+def environment_info():
+    """Сведения об окружении для сопоставления результатов"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'openpyxl': openpyxl.__version__,
+    }
+
+
+def main(argv=None):
+    """Запуск замеров из командной строки"""
+    parser = argparse.ArgumentParser(description="Замеры производительности сравнения табелей")
+    parser.add_argument('--employees', type=int, nargs='+', default=[1000, 10000],
+                        help="размеры табелей (количество сотрудников)")
+    parser.add_argument('--discrepancy-rate', type=float, default=0.02,
+                        help="доля отличающихся отметок")
+    parser.add_argument('--missing-rate', type=float, default=0.005,
+                        help="доля сотрудников, отсутствующих в каждом из файлов")
+    parser.add_argument('--repeat', type=int, default=1, help="количество повторов на размер")
+    parser.add_argument('--seed', type=int, default=0, help="начальное значение генератора")
+    parser.add_argument('--standalone-report', action='store_true',
+                        help="отчет отдельным файлом (потоковая запись)")
+    parser.add_argument('--chunk-rows', type=int,
+                        help="сравнение по частям указанного размера (сортировка на диске)")
+    parser.add_argument('--no-tracemalloc', action='store_true',
+                        help="не отслеживать память (точнее время, без пиков по этапам)")
+    parser.add_argument('--data-dir', help="каталог для синтетических файлов (по умолчанию временный)")
+    parser.add_argument('--output', help="JSON-файл результатов")
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='timekeeper_bench_')
+    trace_memory = not args.no_tracemalloc
+    results = {
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment_info(),
+        'parameters': {key: value for key, value in vars(args).items()
+                       if key not in ('output', 'data_dir')},
+        'cases': [],
+    }
+
+    try:
+        for employees in args.employees:
+            source_base, source_compare, expected = generate_pair(
+                data_dir, employees, args.discrepancy_rate, args.missing_rate, args.seed)
+            for run in range(args.repeat):
+                # Каждый прогон работает с чистыми копиями (подсветка меняет файлы)
+                base_path = shutil.copy(source_base, os.path.join(data_dir, 'run_base.xlsx'))
+                compare_path = shutil.copy(source_compare,
+                                           os.path.join(data_dir, 'run_compare.xlsx'))
+                stages, counters, counts = run_case(base_path, compare_path,
+                                                    args.standalone_report, trace_memory,
+                                                    args.chunk_rows)
+                total = round(sum(stage['wall_seconds'] for stage in stages), 4)
+                results['cases'].append({
+                    'employees': employees,
+                    'run': run + 1,
+                    'file_mb': round(os.path.getsize(source_base) / 2 ** 20, 2),
+                    'total_seconds': total,
+                    'stages': stages,
+                    'counters': counters,
+                    'counts': counts,
+                    'expected': expected,
+                    'correct': counts == expected,
+                })
+                print(f"{employees:>8} сотр., прогон {run + 1}: {total:.2f} с  " +
+                      "  ".join(f"{stage['stage']} {stage['wall_seconds']:.2f}" for stage in stages) +
+                      ("" if counts == expected else "  [РАСХОЖДЕНИЕ С ОЖИДАЕМЫМ]"),
+                      flush=True)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    results['peak_rss_mb'] = peak_rss_mb()
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"bench_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Результаты: {output}")
+    return 0 if all(case['correct'] for case in results['cases']) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+ЗАМЕР ВРЕМЕНИ ЗАПУСКА ИНТЕРФЕЙСА
+Автор: VaSeBa
+
+Запускает приложение в отдельном процессе (каждый прогон - холодный
+импорт) и замеряет время импорта main.py, время до отображения окна и
+время до окончания фоновой загрузки модулей обработки. Дополнительно
+проверяется, что pandas, numpy и openpyxl не загружаются до открытия окна.
+
+Пример:
+    python -m benchmarks.startup --repeat 5 --budget 0.5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+from benchmarks.run_benchmarks import RESULTS_DIR, environment_info
+
+# Корень проекта (каталог main.py)
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Библиотеки, которые не должны загружаться до открытия окна
+HEAVY_MODULES = ['pandas', 'numpy', 'openpyxl']
+
+# Код, выполняемый в дочернем процессе
+CHILD_SCRIPT = r'''
+import json
+import sys
+import time
+
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+from PyQt6.QtWidgets import QApplication
+app = QApplication(sys.argv)
+window = main.ExcelComparator()
+window.show()
+# Фоновая загрузка начинается в цикле событий: проверка до него
+heavy = [name for name in %r if name in sys.modules]
+app.processEvents()
+shown = time.perf_counter()
+
+# Ожидание фоновой загрузки модулей обработки
+while window.preload_worker is None:
+    app.processEvents()
+window.preload_worker.wait()
+ready = time.perf_counter()
+window.close()
+
+print(json.dumps({
+    'import_seconds': imported - started,
+    'window_seconds': shown - started,
+    'ready_seconds': ready - started,
+    'heavy_before_window': heavy,
+}))
+''' % (HEAVY_MODULES,)
+
+
+def measure_once():
+    """Один холодный запуск приложения в дочернем процессе"""
+    completed = subprocess.run([sys.executable, '-c', CHILD_SCRIPT], cwd=PROJECT_DIR,
+                               capture_output=True, text=True, check=True)
+    # Последняя строка вывода - результат (Qt может выводить предупреждения)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    """Запуск замеров из командной строки"""
+    parser = argparse.ArgumentParser(description="Замер времени запуска интерфейса")
+    parser.add_argument('--repeat', type=int, default=5, help="количество запусков")
+    parser.add_argument('--budget', type=float,
+                        help="допустимое время до отображения окна (медиана, с)")
+    parser.add_argument('--output', help="JSON-файл результатов")
+    args = parser.parse_args(argv)
+
+    runs = []
+    for run in range(args.repeat):
+        result = measure_once()
+        runs.append(result)
+        print(f"Запуск {run + 1}: импорт {result['import_seconds']:.3f} с, "
+              f"окно {result['window_seconds']:.3f} с, "
+              f"модули обработки {result['ready_seconds']:.3f} с", flush=True)
+
+    summary = {key: round(statistics.median(run[key] for run in runs), 4)
+               for key in ('import_seconds', 'window_seconds', 'ready_seconds')}
+    heavy = sorted({name for run in runs for name in run['heavy_before_window']})
+    print(f"Медиана: импорт {summary['import_seconds']:.3f} с, "
+          f"окно {summary['window_seconds']:.3f} с, "
+          f"модули обработки {summary['ready_seconds']:.3f} с")
+    if heavy:
+        print(f"До открытия окна загружены: {', '.join(heavy)}")
+
+    results = {
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment_info(),
+        'budget_seconds': args.budget,
+        'median': summary,
+        'heavy_before_window': heavy,
+        'runs': runs,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"startup_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Результаты: {output}")
+
+    over_budget = args.budget is not None and summary['window_seconds'] > args.budget
+    if over_budget:
+        print(f"Превышено допустимое время запуска: {args.budget:.3f} с")
+    return 1 if heavy or over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
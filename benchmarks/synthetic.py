@@ -0,0 +1,118 @@
+"""
+ГЕНЕРАТОР СИНТЕТИЧЕСКИХ ТАБЕЛЕЙ
+Автор: VaSeBa
+
+Создает пару книг (базовый файл и файл сравнения) в формате табеля:
+id, ФИО, должность и дни 1-31. Доля расхождений, доля отсутствующих
+сотрудников с каждой стороны и состав кодов задаются параметрами.
+Ожидаемое количество расхождений по категориям считается при генерации
+и используется для проверки результата сравнения.
+
+Пример:
+    python -m benchmarks.synthetic out/ --employees 10000 --discrepancy-rate 0.02
+"""
+
+import argparse
+import os
+
+import numpy as np
+from openpyxl import Workbook
+
+# Коды отметок базового табеля и их доли
+BASE_CODES = ['Я', '8', 'В', 'Б', 'ОТ', 'ВВ', 'ДП', 'К', '']
+BASE_WEIGHTS = [0.55, 0.12, 0.15, 0.03, 0.05, 0.02, 0.02, 0.02, 0.04]
+
+# Коды, которыми заменяются отметки в файле сравнения
+DIFF_CODES = ['ВВ', 'ДП', 'Я', 'Б', 'ОТ', '7', 'В', '']
+DIFF_WEIGHTS = [0.25, 0.25, 0.15, 0.1, 0.1, 0.05, 0.05, 0.05]
+
+# Должности для заполнения
+POSITIONS = ['Инженер', 'Бухгалтер', 'Оператор', 'Мастер', 'Водитель', 'Экономист']
+
+DAYS = 31
+
+
+def generate_pair(output_dir, employees=1000, discrepancy_rate=0.02, missing_rate=0.005,
+                  seed=0, prefix='synthetic'):
+    """Создание пары табелей, возвращает пути и ожидаемые количества расхождений"""
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+
+    ids = np.array([f"{100000 + i}" for i in range(employees)], dtype=object)
+    base = rng.choice(np.array(BASE_CODES, dtype=object), size=(employees, DAYS),
+                      p=BASE_WEIGHTS)
+
+    # Расхождения: замена отметки на код, отличный от исходного
+    compare = base.copy()
+    diff_mask = rng.random((employees, DAYS)) < discrepancy_rate
+    replacement = rng.choice(np.array(DIFF_CODES, dtype=object), size=(employees, DAYS),
+                             p=DIFF_WEIGHTS)
+    fallback = np.where(base == 'Б', 'Я', 'Б')
+    replacement = np.where(replacement == base, fallback, replacement)
+    compare[diff_mask] = replacement[diff_mask]
+
+    # Пробелы по краям не считаются расхождением
+    padded = ~diff_mask & (rng.random((employees, DAYS)) < 0.01) & (base != '')
+    compare[padded] = ' ' + compare[padded] + ' '
+
+    # Сотрудники, отсутствующие в одном из файлов
+    side = rng.random(employees)
+    only_base = side < missing_rate
+    only_compare = (side >= missing_rate) & (side < 2 * missing_rate)
+    in_both = ~(only_base | only_compare)
+
+    # Ожидаемые результаты (только для сотрудников из обоих файлов)
+    counted = diff_mask & in_both[:, None]
+    old_values = base[counted]
+    new_values = compare[counted]
+    vv = (old_values == 'ВВ') | (new_values == 'ВВ')
+    dp = ~vv & ((old_values == 'ДП') | (new_values == 'ДП'))
+    expected = {
+        'vv': int(vv.sum()),
+        'dp': int(dp.sum()),
+        'other': int((~(vv | dp)).sum()),
+        'missing': int(only_base.sum() + only_compare.sum()),
+    }
+
+    base_path = os.path.join(output_dir, f"{prefix}_base_{employees}.xlsx")
+    compare_path = os.path.join(output_dir, f"{prefix}_compare_{employees}.xlsx")
+    positions = rng.integers(0, len(POSITIONS), size=employees)
+    write_timesheet(base_path, ids, base, positions, ~only_compare)
+    write_timesheet(compare_path, ids, compare, positions, ~only_base)
+
+    return base_path, compare_path, expected
+
+
+def write_timesheet(file_path, ids, days, positions, present):
+    """Потоковая запись табеля в книгу Excel"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Табель')
+    ws.append(['id', 'ФИО', 'должность'] + list(range(1, DAYS + 1)))
+    for idx in np.flatnonzero(present):
+        # Часы записываются числами, как в выгрузках учетной системы
+        values = [int(value) if value.isdigit() else value for value in days[idx]]
+        ws.append([ids[idx], f"Сотрудник {ids[idx]}", POSITIONS[positions[idx]]] + values)
+    wb.save(file_path)
+
+
+def main(argv=None):
+    """Создание пары табелей из командной строки"""
+    parser = argparse.ArgumentParser(description="Генерация синтетических табелей")
+    parser.add_argument('output_dir', help="каталог для файлов")
+    parser.add_argument('--employees', type=int, default=1000, help="количество сотрудников")
+    parser.add_argument('--discrepancy-rate', type=float, default=0.02,
+                        help="доля отметок, отличающихся в файле сравнения")
+    parser.add_argument('--missing-rate', type=float, default=0.005,
+                        help="доля сотрудников, отсутствующих в каждом из файлов")
+    parser.add_argument('--seed', type=int, default=0, help="начальное значение генератора")
+    args = parser.parse_args(argv)
+
+    base_path, compare_path, expected = generate_pair(
+        args.output_dir, args.employees, args.discrepancy_rate, args.missing_rate, args.seed)
+    print(f"Базовый файл: {base_path}")
+    print(f"Файл сравнения: {compare_path}")
+    print(f"Ожидаемые расхождения: {expected}")
+
+
+if __name__ == '__main__':
+    main()
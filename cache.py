@@ -0,0 +1,297 @@
+"""
+ДИСКОВЫЙ КЭШ РАЗОБРАННЫХ ТАБЕЛЕЙ
+Автор: VaSeBa
+
+Хранит нормализованные DataFrame табелей между запусками. Запись ищется
+сначала по быстрому отпечатку файла (путь + размер + время изменения),
+а при его промахе - по хэшу содержимого. Объем кэша ограничен, при
+превышении удаляются давно не использованные записи.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+
+# Предельный объем кэша по умолчанию (байт)
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+# Количество табелей, хранимых в памяти по умолчанию
+DEFAULT_MEMORY_ENTRIES = 8
+
+# Имя файла индекса быстрых отпечатков
+INDEX_NAME = 'index.json'
+
+# Расширение файлов с данными
+ENTRY_SUFFIX = '.pkl'
+
+
+def default_cache_dir():
+    """Каталог кэша пользователя с учетом платформы"""
+    override = os.environ.get('TIMEKEEPER_CACHE_DIR')
+    if override:
+        return override
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+        return os.path.join(base, 'Timekeeper', 'cache')
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'timekeeper')
+
+
+def file_fingerprint(file_path):
+    """Быстрый отпечаток файла: абсолютный путь, размер и время изменения"""
+    stat = os.stat(file_path)
+    return f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def content_hash(file_path, chunk_size=1024 * 1024):
+    """Хэш содержимого файла (SHA-256)"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TimesheetCache:
+    """Кэш нормализованных DataFrame, привязанный к содержимому файлов"""
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir or default_cache_dir()  # Каталог кэша
+        self.max_size = max_size  # Предельный объем кэша (байт)
+        self._hashes = {}  # Хэши содержимого, уже посчитанные по отпечаткам
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get(self, file_path, columns, sheet=None):
+        """Получение DataFrame из кэша или None при промахе (sheet - лист, None - первый)"""
+        columns_key = self._columns_key(columns, sheet)
+        index = self._read_index()
+        fast_key = self._fast_key(file_path, columns_key)
+
+        # Поиск по быстрому отпечатку
+        entry = index.get(fast_key, {}).get('entry')
+        df = self._load_entry(entry) if entry else None
+
+        # Поиск по содержимому файла (файл скопирован или сохранен без изменений)
+        if df is None:
+            entry = self._entry_name(self._content_hash(file_path), columns_key)
+            df = self._load_entry(entry)
+            if df is None:
+                return None
+            self._link(index, file_path, columns_key, entry)
+
+        return df
+
+    def put(self, file_path, columns, df, sheet=None):
+        """Сохранение DataFrame в кэш"""
+        columns_key = self._columns_key(columns, sheet)
+        entry = self._entry_name(self._content_hash(file_path), columns_key)
+        try:
+            self._atomic_write(entry, lambda f: pickle.dump(
+                df, f, protocol=pickle.HIGHEST_PROTOCOL))
+        except OSError:
+            return
+        self._link(self._read_index(), file_path, columns_key, entry)
+        self._evict()
+
+    def relink(self, file_path, columns, sheet=None):
+        """Привязка нового отпечатка файла к его последней записи в кэше.
+
+        Используется после сохранения файла с изменением только оформления
+        (подсветка различий): значения ячеек не меняются, поэтому разобранные
+        данные остаются действительными.
+        """
+        columns_key = self._columns_key(columns, sheet)
+        path = os.path.abspath(file_path)
+        index = self._read_index()
+        entry = None
+        for record in index.values():
+            if record.get('path') == path and record.get('columns') == columns_key:
+                entry = record.get('entry')
+        if entry and os.path.exists(self._entry_path(entry)):
+            self._link(index, file_path, columns_key, entry)
+
+    def clear(self):
+        """Удаление всех записей кэша"""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(ENTRY_SUFFIX) or name == INDEX_NAME:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def _link(self, index, file_path, columns_key, entry):
+        """Запись соответствия текущего отпечатка файла записи кэша"""
+        path = os.path.abspath(file_path)
+        # Устаревшие отпечатки того же файла больше не нужны
+        for key in [k for k, r in index.items()
+                    if r.get('path') == path and r.get('columns') == columns_key]:
+            del index[key]
+        index[self._fast_key(file_path, columns_key)] = {
+            'path': path, 'columns': columns_key, 'entry': entry}
+        self._write_index(index)
+
+    def _content_hash(self, file_path):
+        """Хэш содержимого с запоминанием по отпечатку файла"""
+        fingerprint = file_fingerprint(file_path)
+        if fingerprint not in self._hashes:
+            self._hashes[fingerprint] = content_hash(file_path)
+        return self._hashes[fingerprint]
+
+    def _load_entry(self, entry):
+        """Чтение записи кэша с отметкой времени использования"""
+        import pandas as pd  # Загружается при первом обращении (быстрый запуск интерфейса)
+        entry_path = self._entry_path(entry)
+        try:
+            with open(entry_path, 'rb') as f:
+                df = pickle.load(f)
+            os.utime(entry_path)  # Отметка для вытеснения давно не используемых
+        except Exception:  # Поврежденная или несовместимая запись считается промахом
+            return None
+        return df if isinstance(df, pd.DataFrame) else None
+
+    def _evict(self):
+        """Удаление давно не использованных записей сверх лимита объема"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_size:
+            return
+
+        removed = set()
+        for _, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            total -= size
+            removed.add(name[:-len(ENTRY_SUFFIX)])
+
+        # Очистка индекса от ссылок на удаленные записи
+        index = self._read_index()
+        self._write_index(
+            {k: r for k, r in index.items() if r.get('entry') not in removed})
+
+    def _read_index(self):
+        """Чтение индекса быстрых отпечатков"""
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_NAME), encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return index if isinstance(index, dict) else {}
+
+    def _write_index(self, index):
+        """Атомарная запись индекса"""
+        try:
+            self._atomic_write(INDEX_NAME, lambda f: f.write(
+                json.dumps(index, ensure_ascii=False).encode('utf-8')), suffix='')
+        except OSError:
+            pass
+
+    def _atomic_write(self, name, writer, suffix=ENTRY_SUFFIX):
+        """Запись файла кэша через временный файл и переименование"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                writer(f)
+            os.replace(tmp_path, os.path.join(self.cache_dir, name + suffix))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _entry_path(self, entry):
+        """Путь к файлу записи"""
+        return os.path.join(self.cache_dir, entry + ENTRY_SUFFIX)
+
+    @staticmethod
+    def _fast_key(file_path, columns_key):
+        """Ключ быстрого поиска: отпечаток файла и набор колонок"""
+        return f"{file_fingerprint(file_path)}|{columns_key}"
+
+    @staticmethod
+    def _entry_name(file_hash, columns_key):
+        """Имя записи: хэш содержимого и набор колонок"""
+        return f"{file_hash}_{columns_key}"
+
+    @staticmethod
+    def _columns_key(columns, sheet=None):
+        """Короткий ключ набора колонок (и листа, если он задан явно)"""
+        key = '\x1f'.join(columns)
+        if sheet is not None:
+            key += '\x1e' + sheet
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+
+
+class MemoryTimesheetCache:
+    """Разобранные табели в памяти процесса поверх дискового кэша.
+
+    Для долго работающих процессов (наблюдение за каталогом): недавно
+    использованные табели не читаются заново ни из Excel, ни из файлов
+    кэша. Запись действительна, пока не изменился отпечаток файла.
+    Конвейер изменяет полученный DataFrame (кодирование отметок), поэтому
+    в память кладется и из нее выдается копия.
+    """
+
+    def __init__(self, disk_cache=None, capacity=DEFAULT_MEMORY_ENTRIES, retain=None):
+        self.disk_cache = disk_cache  # Дисковый кэш (необязательный)
+        self.capacity = capacity  # Наибольшее количество табелей в памяти
+        # Отбор файлов, хранимых в памяти (None - все): разовые файлы
+        # не должны вытеснять часто используемые
+        self.retain = retain
+        self._entries = OrderedDict()  # Ключ -> (отпечаток файла, DataFrame)
+
+    def get(self, file_path, columns, sheet=None):
+        """DataFrame из памяти, затем из дискового кэша, или None при промахе"""
+        key = self._key(file_path, columns, sheet)
+        record = self._entries.get(key)
+        if record is not None and record[0] == file_fingerprint(file_path):
+            self._entries.move_to_end(key)
+            return record[1].copy()
+        df = None
+        if self.disk_cache is not None:
+            df = self.disk_cache.get(file_path, columns, sheet)
+        if df is not None:
+            self._remember(key, file_path, df.copy())
+        return df
+
+    def put(self, file_path, columns, df, sheet=None):
+        """Сохранение DataFrame в дисковый кэш и в память"""
+        if self.disk_cache is not None:
+            self.disk_cache.put(file_path, columns, df, sheet)
+        self._remember(self._key(file_path, columns, sheet), file_path, df.copy())
+
+    def relink(self, file_path, columns, sheet=None):
+        """Привязка нового отпечатка файла после подсветки (значения не менялись)"""
+        if self.disk_cache is not None:
+            self.disk_cache.relink(file_path, columns, sheet)
+        key = self._key(file_path, columns, sheet)
+        if key in self._entries:
+            self._entries[key] = (file_fingerprint(file_path), self._entries[key][1])
+
+    def _remember(self, key, file_path, df):
+        """Запись в память с вытеснением давно не использованных табелей"""
+        if self.retain is not None and not self.retain(file_path):
+            return
+        self._entries[key] = (file_fingerprint(file_path), df)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _key(file_path, columns, sheet):
+        """Ключ записи: путь к файлу, набор колонок и лист"""
+        return (os.path.normcase(os.path.abspath(file_path)), tuple(columns), sheet)
@@ -0,0 +1,353 @@
+"""
+КОМАНДНАЯ СТРОКА ДЛЯ ПАКЕТНОГО СРАВНЕНИЯ ТАБЕЛЕЙ
+Автор: VaSeBa
+
+Запуск сравнения без графического интерфейса. Пары файлов задаются
+явно, манифестом (CSV: base;compare[;month;year]) или парой масок,
+файлы которых сопоставляются по имени. Пары обрабатываются
+параллельно в пуле процессов. Книги с несколькими листами (месяцы,
+отделы) сравниваются по всем листам, сопоставленным по названию.
+Отдельный режим - сравнение одного базового файла с несколькими
+редакциями и сводный отчет. Режим наблюдения (--watch) сравнивает
+каждую новую выгрузку в каталоге с ее базовым табелем (см. watcher.py).
+
+Примеры:
+    python cli.py --pair база.xlsx правки.xlsx --month 3 --year 2025
+    python cli.py --base-glob "база/*.xlsx" --compare-glob "правки/*.xlsx" -j 8
+    python cli.py --manifest пары.csv
+    python cli.py --pair база.xlsx правки.xlsx --all-sheets --sheet-map "Март=03.2025"
+    python cli.py --base база.xlsx --revisions правки1.xlsx правки2.xlsx правки3.xlsx
+    python cli.py --watch выгрузки --base-dir база --match "(?P<base>.+)_\d{8}_\d{6}"
+"""
+
+import argparse
+import csv
+import glob
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+
+from cache import DEFAULT_MEMORY_ENTRIES, TimesheetCache
+from history import HistoryStore
+from jobs import run_job
+from multicompare import MultiComparisonPipeline
+from watcher import DEFAULT_POLL_SECONDS, DEFAULT_SETTLE_SECONDS, FolderWatcher, NamingRule
+
+
+def parse_args(argv=None):
+    """Разбор аргументов командной строки"""
+    today = date.today()
+    parser = argparse.ArgumentParser(
+        description="Пакетное сравнение Excel-табелей учета рабочего времени")
+    parser.add_argument('--pair', nargs=2, action='append', default=[],
+                        metavar=('BASE', 'COMPARE'),
+                        help="пара файлов: базовый и файл сравнения (можно повторять)")
+    parser.add_argument('--manifest',
+                        help="CSV-файл со столбцами base, compare и необязательными month, year")
+    parser.add_argument('--base-glob', help="маска базовых файлов")
+    parser.add_argument('--compare-glob', help="маска файлов сравнения (сопоставляются по имени)")
+    parser.add_argument('--base', help="базовый файл для сравнения с редакциями")
+    parser.add_argument('--revisions', nargs='+', metavar='REVISION',
+                        help="редакции базового файла (сводный отчет по всем редакциям)")
+    parser.add_argument('--watch', metavar='DIR',
+                        help="наблюдать за каталогом и сравнивать каждую новую выгрузку "
+                             "с ее базовым табелем (до Ctrl+C); базовый табель берется "
+                             "разобранным из памяти, поэтому отчет всегда записывается "
+                             "отдельным файлом, а подсвечивается только выгрузка")
+    parser.add_argument('--base-dir', metavar='DIR',
+                        help="каталог базовых табелей для --watch (по умолчанию - "
+                             "наблюдаемый каталог)")
+    parser.add_argument('--match', metavar='REGEX',
+                        help="шаблон имени выгрузки без расширения для --watch; группа "
+                             "base - имя базового файла (по умолчанию - то же имя)")
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE_SECONDS,
+                        metavar='SEC',
+                        help="сколько секунд файл не должен меняться, чтобы считаться "
+                             "дописанным (по умолчанию %(default)s)")
+    parser.add_argument('--poll', type=float, default=DEFAULT_POLL_SECONDS, metavar='SEC',
+                        help="интервал опроса каталога (по умолчанию %(default)s)")
+    parser.add_argument('--queue', type=int, metavar='N',
+                        help="наибольшее число ожидающих сравнений (по умолчанию "
+                             "вдвое больше процессов)")
+    parser.add_argument('--keep-bases', type=int, default=DEFAULT_MEMORY_ENTRIES,
+                        metavar='N',
+                        help="сколько базовых табелей хранить разобранными в памяти "
+                             "каждого процесса (по умолчанию %(default)s)")
+    parser.add_argument('--existing', action='store_true',
+                        help="сравнить и выгрузки, уже лежащие в каталоге при запуске")
+    parser.add_argument('--month', type=int, default=today.month, choices=range(1, 13),
+                        metavar='1-12', help="месяц табеля (по умолчанию текущий)")
+    parser.add_argument('--year', type=int, default=today.year,
+                        help="год табеля (по умолчанию текущий)")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                        help="количество процессов (по умолчанию число ядер)")
+    parser.add_argument('--standalone-report', action='store_true',
+                        help="записывать отчет отдельным файлом, а не копией базовой книги")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="не использовать кэш разобранных табелей")
+    parser.add_argument('--no-history', action='store_true',
+                        help="не сохранять расхождения в базу истории (см. history.py)")
+    parser.add_argument('--no-incremental', action='store_true',
+                        help="сравнивать все строки заново, не используя снимок "
+                             "предыдущего сравнения")
+    parser.add_argument('--chunk-rows', type=int,
+                        help="сравнивать по частям из указанного числа строк с сортировкой "
+                             "на диске (для табелей, не помещающихся в память); книги "
+                             "целиком не загружаются: отчет записывается отдельным файлом, "
+                             "исходные файлы не подсвечиваются")
+    parser.add_argument('--no-highlight', action='store_true',
+                        help="не подсвечивать различия в исходных файлах")
+    parser.add_argument('--highlight-copies', action='store_true',
+                        help="подсвечивать различия в копиях, не изменяя исходные файлы")
+    parser.add_argument('--all-sheets', action='store_true',
+                        help="сравнивать все листы книг, сопоставляя их по названию "
+                             "(период - по названию листа, иначе --month/--year)")
+    parser.add_argument('--sheet-map', action='append', default=[], metavar='BASE=COMPARE',
+                        help="явное соответствие листов базовой книги и книги сравнения "
+                             "(можно повторять, включает --all-sheets)")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="замерять пиковую память по этапам (замедляет обработку)")
+    args = parser.parse_args(argv)
+
+    if bool(args.base_glob) != bool(args.compare_glob):
+        parser.error("--base-glob и --compare-glob задаются вместе")
+    if bool(args.base) != bool(args.revisions):
+        parser.error("--base и --revisions задаются вместе")
+    if args.watch and (args.pair or args.manifest or args.base_glob or args.base):
+        parser.error("--watch не совмещается с --pair, --manifest, масками и --base")
+    if args.watch:
+        base_dir = args.base_dir or args.watch
+        if not os.path.isdir(args.watch) or not os.path.isdir(base_dir):
+            parser.error("каталоги --watch и --base-dir должны существовать")
+        if not args.match and os.path.samefile(args.watch, base_dir):
+            parser.error("для выгрузок в каталоге базовых табелей нужен шаблон --match")
+        if args.match:
+            try:
+                if not re.compile(args.match).groups:
+                    parser.error("в шаблоне --match нет группы с именем базового файла")
+            except re.error as e:
+                parser.error(f"некорректный шаблон --match: {e}")
+        if args.settle < 0 or args.poll <= 0 or args.keep_bases < 1 or \
+                (args.queue is not None and args.queue < 1):
+            parser.error("некорректные параметры наблюдения (--settle, --poll, --queue, "
+                         "--keep-bases)")
+    if args.base and (args.pair or args.manifest or args.base_glob):
+        parser.error("--base/--revisions не совмещаются с --pair, --manifest и масками")
+    if args.base and args.chunk_rows is not None:
+        parser.error("--chunk-rows не используется со сравнением редакций")
+    sheet_map = {}
+    for item in args.sheet_map:
+        base_sheet, sep, compare_sheet = item.partition('=')
+        if not sep:
+            parser.error("--sheet-map задается в виде ЛИСТ_БАЗЫ=ЛИСТ_СРАВНЕНИЯ")
+        sheet_map[base_sheet] = compare_sheet
+    args.sheet_map = sheet_map
+    args.all_sheets = args.all_sheets or bool(args.sheet_map)
+    if args.all_sheets and (args.base or args.chunk_rows is not None):
+        parser.error("--all-sheets не совмещается с --base/--revisions и --chunk-rows")
+    if not (args.pair or args.manifest or args.base_glob or args.base or args.watch):
+        parser.error("не заданы пары файлов (--pair, --manifest, --base-glob/--compare-glob, "
+                     "--base/--revisions или --watch)")
+    if args.workers < 1:
+        parser.error("--workers должно быть не меньше 1")
+    if args.chunk_rows is not None and args.chunk_rows < 1:
+        parser.error("--chunk-rows должно быть не меньше 1")
+    return args
+
+
+def load_manifest(manifest_path, month, year):
+    """Чтение пар из CSV-манифеста (относительные пути - от каталога манифеста)"""
+    root = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, encoding='utf-8-sig', newline='') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+        except csv.Error:
+            dialect = csv.excel
+        rows = [row for row in csv.reader(f, dialect)
+                if row and row[0].strip() and not row[0].lstrip().startswith('#')]
+
+    # Необязательная строка заголовка
+    if rows and rows[0][0].strip().lower() == 'base':
+        rows = rows[1:]
+
+    pairs = []
+    for row in rows:
+        if len(row) < 2:
+            raise ValueError(f"Некорректная строка манифеста: {';'.join(row)}")
+        base, compare = (os.path.join(root, value.strip()) for value in row[:2])
+        pair_month = int(row[2]) if len(row) > 2 and row[2].strip() else month
+        pair_year = int(row[3]) if len(row) > 3 and row[3].strip() else year
+        pairs.append((base, compare, pair_month, pair_year))
+    return pairs
+
+
+def glob_pairs(base_pattern, compare_pattern, month, year):
+    """Сопоставление файлов двух масок по имени файла"""
+    compare_files = {os.path.basename(path): path for path in glob.glob(compare_pattern)}
+    pairs = []
+    for base in sorted(glob.glob(base_pattern)):
+        compare = compare_files.get(os.path.basename(base))
+        if compare is not None and os.path.abspath(compare) != os.path.abspath(base):
+            pairs.append((base, compare, month, year))
+    return pairs
+
+
+def group_jobs(pairs):
+    """Объединение пар с общими файлами в последовательные задания.
+
+    Сравнение сохраняет подсветку в исходные файлы, поэтому пары,
+    затрагивающие один и тот же файл, нельзя выполнять одновременно.
+    """
+    parent = list(range(len(pairs)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    owner = {}
+    for idx, (base, compare, _, _) in enumerate(pairs):
+        for path in (base, compare):
+            key = os.path.normcase(os.path.abspath(path))
+            if key in owner:
+                parent[find(idx)] = find(owner[key])
+            else:
+                owner[key] = idx
+
+    jobs = {}
+    for idx, pair in enumerate(pairs):
+        jobs.setdefault(find(idx), []).append(pair)
+    return list(jobs.values())
+
+
+def format_result(result):
+    """Строка итога по одной паре"""
+    names = f"{os.path.basename(result['base'])} -> {os.path.basename(result['compare'])}"
+    if not result['ok']:
+        return f"[ОШИБКА] {names}: {result['error']}"
+    counts = result['counts']
+    return (f"[OK] {names}: ВВ {counts.get('vv', 0)}, ДП {counts.get('dp', 0)}, "
+            f"прочие {counts.get('other', 0)}, отсутствуют {counts.get('missing', 0)}; "
+            f"{result['seconds']:.1f} с; отчет: {result['output']}")
+
+
+def run_revisions(args):
+    """Сравнение базового файла со всеми редакциями, возвращает код завершения"""
+    pipeline = MultiComparisonPipeline(
+        args.base, args.revisions, args.month, args.year,
+        cache=None if args.no_cache else TimesheetCache(),
+        profile_memory=args.profile_memory, highlight_copies=args.highlight_copies,
+        highlight=not args.no_highlight, workers=args.workers,
+        history=None if args.no_history else HistoryStore())
+    try:
+        output_path = pipeline.run()
+    except Exception as e:
+        print(f"[ОШИБКА] {os.path.basename(args.base)}: {e}", file=sys.stderr)
+        return 1
+
+    base_name = os.path.basename(args.base)
+    for counts in pipeline.revision_counts:
+        print(f"[OK] {base_name} -> {os.path.basename(counts['file'])}: "
+              f"ВВ {counts['vv']}, ДП {counts['dp']}, прочие {counts['other']}, "
+              f"отсутствуют {counts['missing']}")
+    seconds = pipeline.profiler.to_dict()['total_wall_seconds']
+    print(f"Итого: редакций {len(pipeline.revision_counts)}, ячеек с различиями "
+          f"{pipeline.report_counts['summary']}; {seconds:.1f} с; отчет: {output_path}")
+    return 0
+
+
+def run_watch(args):
+    """Наблюдение за каталогом выгрузок до Ctrl+C, возвращает код завершения"""
+    def log(message):
+        print(f"[{datetime.now():%H:%M:%S}] {message}", flush=True)
+
+    watcher = FolderWatcher(
+        args.watch, NamingRule(args.base_dir or args.watch, args.match),
+        args.month, args.year, workers=args.workers, max_pending=args.queue,
+        settle=args.settle, keep_bases=args.keep_bases, use_cache=not args.no_cache,
+        process_existing=args.existing,
+        # Базовая книга целиком не загружается: отчет-копия и подсветка
+        # базового файла потребовали бы разбирать ее при каждой выгрузке
+        job_options={'standalone_report': True, 'highlight_base': False,
+                     'profile_memory': args.profile_memory,
+                     'highlight_copies': args.highlight_copies,
+                     'chunk_rows': args.chunk_rows, 'highlight': not args.no_highlight,
+                     'incremental': not args.no_incremental,
+                     'use_history': not args.no_history, 'all_sheets': args.all_sheets,
+                     'sheet_map': args.sheet_map, 'sheet_workers': 1,
+                     'parallel_highlight': False if args.workers > 1 else None},
+        on_result=lambda result: log(format_result(result)), on_message=log)
+    log(f"Наблюдение за каталогом {os.path.abspath(args.watch)} "
+        f"(процессов: {args.workers}; Ctrl+C - остановка)")
+    watcher.run(args.poll)
+    return 0
+
+
+def main(argv=None):
+    """Точка входа командной строки, возвращает код завершения"""
+    args = parse_args(argv)
+    if args.base:
+        return run_revisions(args)
+    if args.watch:
+        return run_watch(args)
+
+    # Сбор пар из всех источников
+    pairs = [(base, compare, args.month, args.year) for base, compare in args.pair]
+    try:
+        if args.manifest:
+            pairs.extend(load_manifest(args.manifest, args.month, args.year))
+    except (OSError, ValueError) as e:
+        print(f"Ошибка чтения манифеста: {e}", file=sys.stderr)
+        return 2
+    if args.base_glob:
+        pairs.extend(glob_pairs(args.base_glob, args.compare_glob, args.month, args.year))
+
+    if not pairs:
+        print("Не найдено ни одной пары файлов для сравнения", file=sys.stderr)
+        return 2
+
+    jobs = group_jobs(pairs)
+    options = {'standalone_report': args.standalone_report, 'use_cache': not args.no_cache,
+               'profile_memory': args.profile_memory,
+               'highlight_copies': args.highlight_copies,
+               'chunk_rows': args.chunk_rows, 'highlight': not args.no_highlight,
+               'incremental': not args.no_incremental, 'use_history': not args.no_history,
+               'all_sheets': args.all_sheets, 'sheet_map': args.sheet_map,
+               # Листы сравниваются параллельно, только если пары идут по одной
+               'sheet_workers': args.workers if len(jobs) == 1 else 1,
+               # Пары уже обрабатываются параллельно: без вложенных процессов подсветки
+               'parallel_highlight': False if args.workers > 1 else None}
+    results = []
+
+    if args.workers == 1:
+        for job in jobs:
+            for result in run_job(job, **options):
+                print(format_result(result), flush=True)
+                results.append(result)
+    else:
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(jobs))) as executor:
+            futures = {executor.submit(run_job, job, **options): job for job in jobs}
+            for future in as_completed(futures):
+                try:
+                    job_results = future.result()
+                except Exception as e:  # Аварийное завершение процесса пула
+                    job_results = [{'base': base, 'compare': compare, 'ok': False,
+                                    'error': str(e)}
+                                   for base, compare, _, _ in futures[future]]
+                for result in job_results:
+                    print(format_result(result), flush=True)
+                    results.append(result)
+
+    failed = sum(1 for result in results if not result['ok'])
+    print(f"Итого: пар {len(results)}, успешно {len(results) - failed}, "
+          f"с ошибками {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""
+СЛОВАРЬ КОДОВ ОТМЕТОК ТАБЕЛЯ
+Автор: VaSeBa
+
+Отметки в днях табеля (Я, ВВ, ДП, Б, ОТ, часы, пустые) образуют
+небольшой словарь. Колонки дней кодируются в целочисленную матрицу
+с общим для обоих файлов словарем, поэтому сравнение сводится к
+сравнению чисел, а строки восстанавливаются только для отчета.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class CodeDictionary:
+    """Общий словарь кодов: строка отметки (без пробелов по краям) <-> номер"""
+
+    def __init__(self):
+        self.codes = ['']  # Отметки по номерам (0 - пустая ячейка)
+        self._ids = {'': 0}  # Номера по отметкам
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def dtype(self):
+        """Наименьший целочисленный тип, вмещающий все номера словаря"""
+        return np.uint16 if len(self.codes) <= np.iinfo(np.uint16).max else np.int32
+
+    def id_of(self, code):
+        """Номер отметки или -1, если отметка не встречалась"""
+        return self._ids.get(code, -1)
+
+    def encode(self, values):
+        """Кодирование двумерного массива значений в матрицу номеров.
+
+        Пробелы по краям удаляются только у уникальных значений, которых
+        в табеле единицы, а не у каждой ячейки.
+        """
+        values = np.asarray(values, dtype=object)
+        labels, uniques = pd.factorize(values.ravel(), use_na_sentinel=False)
+        mapping = np.array([self._add(str(value).strip()) for value in uniques],
+                           dtype=np.int64)
+        return mapping[labels].astype(self.dtype).reshape(values.shape)
+
+    def decode(self, ids):
+        """Восстановление строк отметок по номерам"""
+        return np.array(self.codes, dtype=object)[np.asarray(ids, dtype=np.int64)]
+
+    def _add(self, code):
+        """Номер отметки с добавлением новой в словарь"""
+        code_id = self._ids.get(code)
+        if code_id is None:
+            code_id = len(self.codes)
+            self._ids[code] = code_id
+            self.codes.append(code)
+        return code_id
@@ -0,0 +1,60 @@
+"""
+ПОДСВЕТКА РАЗЛИЧИЙ В ИСХОДНЫХ КНИГАХ
+Автор: VaSeBa
+
+Заливка ячеек с расхождениями. Модуль не зависит от pandas, чтобы
+подсветку второй книги можно было быстро запустить в отдельном процессе
+параллельно с обработкой базовой книги.
+"""
+
+from openpyxl import load_workbook
+from openpyxl.styles import PatternFill
+from openpyxl.styles.cell_style import StyleArray
+
+from progress import CANCEL_CHECK_INTERVAL
+
+# Стиль подсветки различий
+HIGHLIGHT_FILL = PatternFill(
+    start_color='FFFF00',
+    end_color='FFFF00',
+    fill_type='solid'
+)
+
+
+def apply_highlight(ws, cells, cancel_token=None):
+    """Пакетная заливка ячеек листа.
+
+    Заливка регистрируется в книге один раз, а ячейкам присваивается
+    только ее номер. Присваивание cell.fill делает то же самое, но ищет
+    заливку в коллекции книги заново для каждой ячейки.
+    """
+    fill_id = ws.parent._fills.add(HIGHLIGHT_FILL)
+    for idx, (row, col) in enumerate(cells):
+        if cancel_token is not None and idx % CANCEL_CHECK_INTERVAL == 0:
+            cancel_token.check()
+        cell = ws.cell(row=row, column=col)
+        if not cell._style:  # Новая ячейка без оформления
+            cell._style = StyleArray()
+        cell._style.fillId = fill_id
+
+
+def highlight_file(file_path, cells, output_path):
+    """Подсветка книги целиком: загрузка, заливка и сохранение в output_path.
+
+    Используется для обработки книги в отдельном процессе.
+    """
+    highlight_sheets(file_path, {None: cells}, output_path)
+
+
+def highlight_sheets(file_path, cells_by_sheet, output_path):
+    """Подсветка нескольких листов книги за одну загрузку и сохранение.
+
+    cells_by_sheet - {название листа: ячейки}, None - первый лист.
+    """
+    wb = load_workbook(file_path)
+    try:
+        for sheet, cells in cells_by_sheet.items():
+            apply_highlight(wb.worksheets[0] if sheet is None else wb[sheet], cells)
+        wb.save(output_path)
+    finally:
+        wb.close()
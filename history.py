@@ -0,0 +1,304 @@
+"""
+ИСТОРИЯ РАСХОЖДЕНИЙ
+Автор: VaSeBa
+
+Локальная база SQLite с расхождениями и отсутствующими сотрудниками
+всех сравнений. Позволяет отвечать на вопросы по нескольким периодам
+(например, сколько различий ДП было у сотрудника за год) без открытия
+отчетов. Записи одного сравнения добавляются пакетно в одной транзакции;
+повторное сравнение тех же файлов за тот же период заменяет предыдущее.
+
+Просмотр из командной строки:
+    python history.py --id 1024 --year 2025 --counts
+    python history.py --category ДП --from 2025-01-01 --to 2025-03-31
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+from contextlib import closing
+from datetime import datetime
+
+# Категории расхождений по ключам данных отчета
+CATEGORIES = {'vv': 'ВВ', 'dp': 'ДП', 'other': 'Прочие'}
+
+# Колонки результата запроса расхождений
+DISCREPANCY_COLUMNS = ['emp_id', 'name', 'date', 'category', 'base_value', 'compare_value',
+                       'base_file', 'compare_file', 'base_sheet', 'compare_sheet',
+                       'recorded']
+
+# Колонки результата запроса отсутствующих сотрудников
+MISSING_COLUMNS = ['emp_id', 'name', 'status', 'month', 'year', 'base_file',
+                   'compare_file', 'base_sheet', 'compare_sheet', 'recorded']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    recorded TEXT NOT NULL,
+    base_file TEXT NOT NULL,
+    compare_file TEXT NOT NULL,
+    base_sheet TEXT NOT NULL DEFAULT '',
+    compare_sheet TEXT NOT NULL DEFAULT '',
+    month INTEGER NOT NULL,
+    year INTEGER NOT NULL,
+    report_path TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS runs_key
+    ON runs (base_file, compare_file, base_sheet, compare_sheet, year, month);
+CREATE INDEX IF NOT EXISTS runs_compare ON runs (compare_file);
+CREATE INDEX IF NOT EXISTS runs_period ON runs (year, month);
+
+CREATE TABLE IF NOT EXISTS discrepancies (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    emp_id TEXT NOT NULL,
+    name TEXT,
+    date TEXT NOT NULL,
+    category TEXT NOT NULL,
+    base_value TEXT,
+    compare_value TEXT
+);
+CREATE INDEX IF NOT EXISTS discrepancies_emp ON discrepancies (emp_id, date);
+CREATE INDEX IF NOT EXISTS discrepancies_date ON discrepancies (date);
+CREATE INDEX IF NOT EXISTS discrepancies_category ON discrepancies (category, date);
+CREATE INDEX IF NOT EXISTS discrepancies_run ON discrepancies (run_id);
+
+CREATE TABLE IF NOT EXISTS missing (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    emp_id TEXT NOT NULL,
+    name TEXT,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS missing_emp ON missing (emp_id);
+CREATE INDEX IF NOT EXISTS missing_run ON missing (run_id);
+"""
+
+
+def default_history_path():
+    """Файл базы истории с учетом платформы"""
+    override = os.environ.get('TIMEKEEPER_HISTORY')
+    if override:
+        return override
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+        return os.path.join(base, 'Timekeeper', 'history.sqlite3')
+    base = os.environ.get('XDG_DATA_HOME') or os.path.join(
+        os.path.expanduser('~'), '.local', 'share')
+    return os.path.join(base, 'timekeeper', 'history.sqlite3')
+
+
+def iso_date(report_date):
+    """Дата отчета (ДД.ММ.ГГГГ) в формате ISO для выборок по диапазону"""
+    day, month, year = report_date.split('.')
+    return f"{year}-{month}-{day}"
+
+
+class HistoryStore:
+    """База истории расхождений.
+
+    Соединение открывается на время каждой операции, поэтому хранилище
+    можно использовать из любого потока и процесса.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_history_path()  # Файл базы
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def record_runs(self, runs):
+        """Сохранение результатов сравнений в одной транзакции.
+
+        runs - словари с ключами base_file, compare_file, month, year,
+        report_data (данные отчета сравнения) и необязательными base_sheet,
+        compare_sheet, report_path. Возвращает номера записей сравнений.
+        """
+        recorded = datetime.now().isoformat(timespec='seconds')
+        run_ids = []
+        with closing(self._connect()) as conn, conn:
+            for run in runs:
+                key = (os.path.abspath(run['base_file']), os.path.abspath(run['compare_file']),
+                       run.get('base_sheet') or '', run.get('compare_sheet') or '',
+                       run['year'], run['month'])
+                # Повторное сравнение заменяет предыдущее (записи удаляются каскадно)
+                conn.execute('DELETE FROM runs WHERE base_file = ? AND compare_file = ? AND '
+                             'base_sheet = ? AND compare_sheet = ? AND year = ? AND month = ?',
+                             key)
+                run_id = conn.execute(
+                    'INSERT INTO runs (recorded, base_file, compare_file, base_sheet, '
+                    'compare_sheet, year, month, report_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (recorded,) + key + (run.get('report_path'),)).lastrowid
+
+                report_data = run['report_data']
+                conn.executemany(
+                    'INSERT INTO discrepancies VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    ((run_id, emp_id, name, iso_date(date), category, base_value,
+                      compare_value)
+                     for key_name, category in CATEGORIES.items()
+                     for emp_id, name, date, base_value, compare_value
+                     in report_data[key_name]))
+                conn.executemany(
+                    'INSERT INTO missing VALUES (?, ?, ?, ?)',
+                    ((run_id, emp_id, name, status)
+                     for emp_id, name, status in report_data['missing']))
+                run_ids.append(run_id)
+        with closing(self._connect()) as conn:
+            self._refresh_statistics(conn)
+        return run_ids
+
+    def record_run(self, base_file, compare_file, month, year, report_data, **extra):
+        """Сохранение результата одного сравнения, возвращает номер записи"""
+        return self.record_runs([dict(extra, base_file=base_file, compare_file=compare_file,
+                                      month=month, year=year, report_data=report_data)])[0]
+
+    def discrepancies(self, emp_id=None, category=None, date_from=None, date_to=None,
+                      year=None, base_file=None, compare_file=None, limit=None):
+        """Расхождения по фильтрам в порядке id и даты (словари DISCREPANCY_COLUMNS)"""
+        where, params = self._filters(emp_id, category, date_from, date_to, year,
+                                      base_file, compare_file)
+        sql = ('SELECT d.emp_id, d.name, d.date, d.category, d.base_value, d.compare_value, '
+               'r.base_file, r.compare_file, r.base_sheet, r.compare_sheet, r.recorded '
+               'FROM discrepancies d JOIN runs r ON r.id = d.run_id' + where +
+               ' ORDER BY d.emp_id, d.date')
+        return self._select(sql, params, DISCREPANCY_COLUMNS, limit)
+
+    def counts(self, emp_id=None, category=None, date_from=None, date_to=None, year=None,
+               base_file=None, compare_file=None, limit=None):
+        """Количество расхождений по сотрудникам и категориям.
+
+        Строки - словари с ключами emp_id, name, category, count,
+        first_date и last_date (первая и последняя дата расхождения).
+        """
+        where, params = self._filters(emp_id, category, date_from, date_to, year,
+                                      base_file, compare_file)
+        sql = ('SELECT d.emp_id, MAX(d.name), d.category, COUNT(*), MIN(d.date), MAX(d.date) '
+               'FROM discrepancies d JOIN runs r ON r.id = d.run_id' + where +
+               ' GROUP BY d.emp_id, d.category ORDER BY d.emp_id, d.category')
+        return self._select(sql, params, ['emp_id', 'name', 'category', 'count',
+                                          'first_date', 'last_date'], limit)
+
+    def missing(self, emp_id=None, year=None, base_file=None, compare_file=None, limit=None):
+        """Отсутствующие сотрудники по фильтрам (словари MISSING_COLUMNS)"""
+        where, params = self._filters(emp_id, None, None, None, None, base_file, compare_file,
+                                      table='m')
+        if year is not None:
+            where += (' AND ' if where else ' WHERE ') + 'r.year = ?'
+            params.append(year)
+        sql = ('SELECT m.emp_id, m.name, m.status, r.month, r.year, r.base_file, '
+               'r.compare_file, r.base_sheet, r.compare_sheet, r.recorded '
+               'FROM missing m JOIN runs r ON r.id = m.run_id' + where +
+               ' ORDER BY m.emp_id, r.year, r.month')
+        return self._select(sql, params, MISSING_COLUMNS, limit)
+
+    def _filters(self, emp_id, category, date_from, date_to, year, base_file, compare_file,
+                 table='d'):
+        """Условие WHERE и параметры выборки"""
+        conditions = []
+        params = []
+        if emp_id is not None:
+            conditions.append(f'{table}.emp_id = ?')
+            params.append(str(emp_id))
+        if category is not None:
+            conditions.append('d.category = ?')
+            params.append(category)
+        # Даты сравниваются как строки ISO (ГГГГ-ММ-ДД)
+        date_from = None if date_from is None else str(date_from)
+        date_to = None if date_to is None else str(date_to)
+        if year is not None:
+            date_from = max(date_from or '', f"{year:04d}-01-01")
+            date_to = min(date_to or '9999', f"{year:04d}-12-31")
+        if date_from is not None:
+            conditions.append('d.date >= ?')
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append('d.date <= ?')
+            params.append(date_to)
+        if base_file is not None:
+            conditions.append('r.base_file = ?')
+            params.append(os.path.abspath(base_file))
+        if compare_file is not None:
+            conditions.append('r.compare_file = ?')
+            params.append(os.path.abspath(compare_file))
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+    def _select(self, sql, params, columns, limit):
+        """Выполнение выборки, строки - словари с заданными ключами"""
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params = params + [int(limit)]
+        with closing(self._connect()) as conn:
+            return [dict(zip(columns, row)) for row in conn.execute(sql, params)]
+
+    def _refresh_statistics(self, conn):
+        """Обновление статистики индексов для планировщика запросов.
+
+        Без статистики SQLite может выбрать для выборки по id, категории и
+        году индекс категории и просмотреть все расхождения категории за год
+        (сотни миллисекунд на миллионах записей вместо единиц). Статистика
+        пересчитывается полностью (выборочная статистика analysis_limit
+        занижает избирательность индекса id), но только когда таблица
+        выросла вдвое с прошлого пересчета.
+        """
+        rows = conn.execute('SELECT MAX(rowid) FROM discrepancies').fetchone()[0] or 0
+        try:
+            stat = conn.execute("SELECT stat FROM sqlite_stat1 "
+                                "WHERE idx = 'discrepancies_emp'").fetchone()
+        except sqlite3.OperationalError:  # ANALYZE еще не выполнялся
+            stat = None
+        analyzed = int(stat[0].split()[0]) if stat else 0
+        if rows > 2 * analyzed:
+            conn.execute('ANALYZE')
+            conn.commit()
+
+    def _connect(self):
+        """Новое соединение с базой"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        return conn
+
+
+def main(argv=None):
+    """Просмотр истории из командной строки"""
+    parser = argparse.ArgumentParser(description="История расхождений табелей")
+    parser.add_argument('--db', help="файл базы истории")
+    parser.add_argument('--id', dest='emp_id', help="id сотрудника")
+    parser.add_argument('--category', choices=list(CATEGORIES.values()),
+                        help="категория расхождений")
+    parser.add_argument('--year', type=int, help="год")
+    parser.add_argument('--from', dest='date_from', help="начальная дата (ГГГГ-ММ-ДД)")
+    parser.add_argument('--to', dest='date_to', help="конечная дата (ГГГГ-ММ-ДД)")
+    parser.add_argument('--base', help="базовый файл")
+    parser.add_argument('--compare', help="файл сравнения")
+    parser.add_argument('--counts', action='store_true',
+                        help="количество расхождений по сотрудникам и категориям")
+    parser.add_argument('--missing', action='store_true', help="отсутствующие сотрудники")
+    parser.add_argument('--limit', type=int, default=1000, help="наибольшее число строк")
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.db)
+    if args.missing:
+        rows = store.missing(args.emp_id, args.year, args.base, args.compare, args.limit)
+        lines = [f"{row['emp_id']}\t{row['name']}\t{row['month']:02d}.{row['year']}\t"
+                 f"{row['status']}\t{os.path.basename(row['compare_file'])}" for row in rows]
+    else:
+        filters = (args.emp_id, args.category, args.date_from, args.date_to, args.year,
+                   args.base, args.compare, args.limit)
+        if args.counts:
+            rows = store.counts(*filters)
+            lines = [f"{row['emp_id']}\t{row['name']}\t{row['category']}\t{row['count']}\t"
+                     f"{row['first_date']} - {row['last_date']}" for row in rows]
+        else:
+            rows = store.discrepancies(*filters)
+            lines = [f"{row['emp_id']}\t{row['name']}\t{row['date']}\t{row['category']}\t"
+                     f"{row['base_value']} -> {row['compare_value']}\t"
+                     f"{os.path.basename(row['compare_file'])}" for row in rows]
+    for line in lines:
+        print(line)
+    print(f"Найдено строк: {len(rows)}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
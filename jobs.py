@@ -0,0 +1,60 @@
+"""
+ЗАДАНИЯ СРАВНЕНИЯ
+Автор: VaSeBa
+
+Последовательное сравнение пар файлов одного задания с итогом по каждой
+паре. Используется пакетным режимом командной строки (cli.py) и
+наблюдением за каталогом выгрузок (watcher.py), в том числе в процессах
+пула.
+"""
+
+from cache import TimesheetCache
+from history import HistoryStore
+from multisheet import SheetComparisonPipeline
+from pipeline import ComparisonPipeline
+from snapshot import SnapshotStore
+
+
+def run_job(job, standalone_report=False, use_cache=True, profile_memory=False,
+            highlight_copies=False, parallel_highlight=None, chunk_rows=None,
+            highlight=True, incremental=True, all_sheets=False, sheet_map=None,
+            sheet_workers=None, use_history=True, cache=None, highlight_base=True):
+    """Последовательное сравнение пар одного задания (выполняется в процессе пула).
+
+    cache - готовый кэш табелей (например, хранимый в памяти процесса
+    наблюдения за каталогом), иначе создается дисковый кэш. При
+    highlight_base=False подсвечивается только файл сравнения.
+    """
+    if cache is None and use_cache:
+        cache = TimesheetCache()
+    snapshots = SnapshotStore() if incremental else None
+    history = HistoryStore() if use_history else None
+    results = []
+    for base, compare, month, year in job:
+        result = {'base': base, 'compare': compare, 'ok': False}
+        try:
+            if all_sheets:
+                pipeline = SheetComparisonPipeline(base, compare, month, year,
+                                                   sheet_map=sheet_map, cache=cache,
+                                                   profile_memory=profile_memory,
+                                                   highlight_copies=highlight_copies,
+                                                   highlight=highlight, workers=sheet_workers,
+                                                   history=history,
+                                                   highlight_base=highlight_base)
+            else:
+                pipeline = ComparisonPipeline(base, compare, month, year,
+                                              standalone_report=standalone_report,
+                                              cache=cache, profile_memory=profile_memory,
+                                              highlight_copies=highlight_copies,
+                                              parallel_highlight=parallel_highlight,
+                                              chunk_rows=chunk_rows, highlight=highlight,
+                                              snapshots=snapshots, history=history,
+                                              highlight_base=highlight_base)
+            result['output'] = pipeline.run()
+            result['counts'] = pipeline.report_counts
+            result['seconds'] = pipeline.profiler.to_dict()['total_wall_seconds']
+            result['ok'] = True
+        except Exception as e:
+            result['error'] = str(e)
+        results.append(result)
+    return results
@@ -0,0 +1,255 @@
+"""
+ЗАГРУЗКА ТАБЕЛЕЙ ИЗ EXCEL-ФАЙЛОВ
+Автор: VaSeBa
+
+Потоковое чтение строк листа (python-calamine или openpyxl в режиме
+только для чтения; по умолчанию - первого листа) и ленивая загрузка
+полной книги для подсветки различий и отчетов. Книга, из которой
+читается несколько листов, открывается для чтения один раз
+(WorkbookReader).
+"""
+
+import importlib.util
+import pandas as pd
+from openpyxl import load_workbook
+
+from progress import CANCEL_CHECK_INTERVAL
+
+
+class WorkbookSource:
+    """Входной файл сравнения, разбираемый не более одного раза за запуск"""
+
+    def __init__(self, file_path, engine=None, column_index=None, sheet=None, reader=None):
+        self.file_path = file_path  # Путь к файлу
+        self.engine = engine  # Движок потокового чтения (None - выбор по умолчанию)
+        self.sheet = sheet  # Название листа табеля (None - первый лист)
+        self.reader = reader  # Открытая для чтения книга, общая для листов (необязательная)
+        self._workbook = None  # Разобранная книга (загружается при первом обращении)
+        self._column_index = column_index  # Номера колонок листа по заголовкам
+
+    @property
+    def workbook(self):
+        """Книга openpyxl, общая для подсветки и отчета"""
+        if self._workbook is None:
+            self._workbook = load_workbook(self.file_path)
+        return self._workbook
+
+    @property
+    def worksheet(self):
+        """Лист табеля в книге openpyxl"""
+        wb = self.workbook
+        return wb[self.sheet] if self.sheet is not None else wb.worksheets[0]
+
+    def iter_rows(self):
+        """Итератор значений строк листа табеля.
+
+        Файл всегда читается потоково со значениями формул (data_only),
+        даже если книга уже разобрана: в книге для подсветки вместо
+        значений формул хранится их текст.
+        """
+        if self.reader is not None:
+            yield from self.reader.iter_rows(self.sheet)
+        else:
+            yield from iter_sheet_rows(self.file_path, self.engine, self.sheet)
+
+    def column_index(self):
+        """Номера колонок листа (с 1) по названиям из строки заголовков.
+
+        При повторяющихся названиях берется первое вхождение, как и при
+        чтении данных.
+        """
+        if self._column_index is None:
+            rows = self.iter_rows()
+            try:
+                self._column_index = header_index(
+                    [cell_to_str(value) for value in next(rows, ())])
+            finally:
+                rows.close()
+        return self._column_index
+
+    def restore_column_index(self, index):
+        """Номера колонок, известные заранее (сохраненные в кэше вместе с данными)"""
+        if self._column_index is None and index:
+            self._column_index = index
+
+    def read_columns(self, columns, cancel_token=None):
+        """Чтение указанных колонок листа до первой пустой строки.
+
+        Все значения приводятся к строкам так же, как при чтении через
+        pandas с dtype=str и keep_default_na=False.
+        """
+        return next(self.iter_column_chunks(columns, cancel_token=cancel_token))
+
+    def iter_column_chunks(self, columns, chunk_rows=None, cancel_token=None):
+        """Чтение указанных колонок частями не более чем по chunk_rows строк.
+
+        Без chunk_rows все строки возвращаются одним DataFrame. Пустой лист
+        дает один пустой DataFrame с найденными колонками.
+        """
+        rows = self.iter_rows()
+        header = [cell_to_str(value) for value in next(rows, ())]
+        if self._column_index is None:
+            self._column_index = header_index(header)
+
+        # Позиции нужных колонок (при повторах берется первое вхождение)
+        positions = {}
+        for idx, name in enumerate(header):
+            if name in columns and name not in positions:
+                positions[name] = idx
+        names = list(positions)
+        indices = list(positions.values())
+        width = max(indices, default=-1) + 1
+
+        data = []
+        emitted = False
+        for row_num, row in enumerate(rows):
+            if cancel_token is not None and row_num % CANCEL_CHECK_INTERVAL == 0:
+                cancel_token.check()
+            # Чтение заканчивается на первой пустой строке
+            if all(value is None or value == '' for value in row):
+                break
+            if len(row) < width:
+                row = tuple(row) + (None,) * (width - len(row))
+            data.append([cell_to_str(row[idx]) for idx in indices])
+            if chunk_rows and len(data) >= chunk_rows:
+                yield pd.DataFrame(data, columns=names, dtype=object)
+                data = []
+                emitted = True
+
+        if data or not emitted:
+            yield pd.DataFrame(data, columns=names, dtype=object)
+
+    def close(self):
+        """Освобождение разобранной книги"""
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+
+
+def reader_engine():
+    """Выбор движка потокового чтения: calamine, если установлен, иначе openpyxl"""
+    if importlib.util.find_spec('python_calamine') is not None:
+        return 'calamine'
+    return 'openpyxl'
+
+
+class WorkbookReader:
+    """Книга, открытая для потокового чтения значений нескольких листов.
+
+    Книга (для openpyxl - с таблицей общих строк) разбирается при
+    открытии один раз, а не при чтении каждого листа.
+    """
+
+    def __init__(self, file_path, engine=None):
+        self.file_path = file_path  # Путь к файлу
+        self.engine = engine or reader_engine()  # Движок потокового чтения
+        if self.engine == 'calamine':
+            from python_calamine import CalamineWorkbook
+            self._workbook = CalamineWorkbook.from_path(file_path)
+        else:
+            self._workbook = load_workbook(file_path, read_only=True, data_only=True)
+
+    def sheet_names(self):
+        """Названия листов книги"""
+        if self.engine == 'calamine':
+            return list(self._workbook.sheet_names)
+        return list(self._workbook.sheetnames)
+
+    def iter_rows(self, sheet=None):
+        """Потоковое чтение значений строк листа (sheet=None - первый лист).
+
+        calamine быстрее, но разбирает лист в памяти целиком; openpyxl
+        в режиме только для чтения держит в памяти только текущую строку
+        (и таблицу общих строк книги).
+        """
+        wb = self._workbook
+        if self.engine == 'calamine':
+            data = wb.get_sheet_by_index(0) if sheet is None else wb.get_sheet_by_name(sheet)
+            # calamine пропускает пустые колонки слева: выравнивание по колонке A
+            lead = data.start[1] if data.start else 0
+            if lead:
+                padding = (None,) * lead
+                for row in data.iter_rows():
+                    yield padding + tuple(row)
+            else:
+                yield from data.iter_rows()
+            return
+
+        ws = wb.worksheets[0] if sheet is None else wb[sheet]
+        yield from stream_rows(ws)
+
+    def close(self):
+        """Закрытие книги"""
+        if self.engine != 'calamine':
+            self._workbook.close()
+
+
+def stream_rows(ws):
+    """Значения строк листа openpyxl в режиме только для чтения.
+
+    Некоторые выгрузки записывают размеры листа как одну ячейку (A1);
+    openpyxl ограничивает ими чтение, поэтому такие размеры сбрасываются
+    и лист читается до конца данных.
+    """
+    if not ws.max_row or ws.max_row <= 1:
+        ws.reset_dimensions()
+    return ws.iter_rows(values_only=True)
+
+
+def iter_sheet_rows(file_path, engine=None, sheet=None):
+    """Потоковое чтение значений строк листа файла (sheet=None - первый лист)"""
+    reader = WorkbookReader(file_path, engine)
+    try:
+        yield from reader.iter_rows(sheet)
+    finally:
+        reader.close()
+
+
+def header_index(header):
+    """Номера колонок (с 1) по названиям; при повторах - первое вхождение"""
+    index = {}
+    for idx, name in enumerate(header, 1):
+        index.setdefault(name, idx)
+    return index
+
+
+def probe_workbook(file_path):
+    """Быстрые сведения о файле: листы, заголовки и количество строк первого листа.
+
+    Количество строк данных берется из размеров листа, записанных в файле.
+    Если размеры не указаны (или указана одна ячейка, как пишут некоторые
+    выгрузки), строки считаются тем же потоком до первой пустой строки,
+    как их читает сравнение.
+    """
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        max_row = ws.max_row
+        rows = stream_rows(ws)
+        header = [cell_to_str(value) for value in next(rows, ())]
+        if max_row and max_row > 1:
+            data_rows = max_row - 1
+        else:
+            # Размеров листа нет: подсчет строк продолжением открытого потока
+            data_rows = 0
+            for row in rows:
+                if all(value is None or value == '' for value in row):
+                    break
+                data_rows += 1
+        return {
+            'sheets': wb.sheetnames,
+            'header': header,
+            'rows': data_rows,
+        }
+    finally:
+        wb.close()
+
+
+def cell_to_str(value):
+    """Приведение значения ячейки к строке по правилам pandas.read_excel(dtype=str)"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
@@ -7,17 +7,25 @@
 # Импорт необходимых библиотек
 import sys
 import os
-import pandas as pd
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill, Font
-from openpyxl.utils import get_column_letter
+import importlib
+import multiprocessing
+import time
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QPushButton, QFileDialog, QLabel,
                              QProgressBar, QTextEdit, QMessageBox, QComboBox,
-                             QSpinBox, QToolButton)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
+                             QSpinBox, QToolButton, QCheckBox, QDialog, QLineEdit,
+                             QTableWidget, QTableWidgetItem, QSplitter)
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal
 from PyQt6.QtGui import QIcon
 
+# Модули обработки (pandas, numpy, openpyxl) импортируются в фоновых
+# потоках после открытия окна, чтобы интерфейс появлялся сразу
+from cache import TimesheetCache
+from progress import CancelToken, ComparisonCancelled
+
+# Модули, загружаемые в фоне после открытия окна (вместе с зависимостями)
+PRELOAD_MODULES = ['pipeline']
+
 
 class ExcelComparator(QMainWindow):
     """Главное окно приложения, наследующее QMainWindow"""
@@ -29,7 +37,20 @@ class ExcelComparator(QMainWindow):
         self.current_worker = None  # Экземпляр рабочего потока
         self.selected_month = 1  # Выбранный месяц
         self.selected_year = 2025  # Выбранный год
+        self.cache = TimesheetCache()  # Кэш разобранных табелей
+        self.probe_workers = {}  # Текущие потоки проверки файлов по номеру файла
+        self.background_workers = []  # Все запущенные потоки проверки (до завершения)
+        self.probing = set()  # Номера файлов, проверка которых еще не завершена
+        self.preload_worker = None  # Поток фоновой загрузки модулей обработки
+        self.results_view = None  # Панель различий (создается после первого сравнения)
         self.init_ui()  # Инициализация интерфейса
+        # Загрузка модулей обработки после отображения окна
+        QTimer.singleShot(0, self.start_preload)
+
+    def start_preload(self):
+        """Фоновая загрузка модулей обработки"""
+        self.preload_worker = PreloadWorker(PRELOAD_MODULES)
+        self.preload_worker.start()
 
     def init_ui(self):
         """Инициализация пользовательского интерфейса"""
@@ -106,10 +127,26 @@ class ExcelComparator(QMainWindow):
         self.btn_about.setToolButtonStyle(Qt.ToolButtonStyle.ToolButtonTextBesideIcon)
         self.btn_about.clicked.connect(self.show_about_dialog)
 
+        # Просмотр истории расхождений по всем сравнениям
+        self.btn_history = QPushButton("История", self)
+        self.btn_history.clicked.connect(self.show_history_dialog)
+
         # Основная кнопка запуска сравнения
         self.btn_compare = QPushButton("Сравнить файлы", self)
         self.btn_compare.clicked.connect(self.start_comparison)
 
+        # Режим записи отчета: отдельный файл вместо копии базовой книги
+        self.chk_standalone = QCheckBox("Отчет отдельным файлом", self)
+
+        # Подсветка различий в копиях вместо исходных файлов
+        self.chk_highlight_copies = QCheckBox("Не изменять исходные файлы", self)
+
+        # Сравнение всех листов книг, сопоставленных по названию
+        self.chk_all_sheets = QCheckBox("Все листы", self)
+
+        # Замер пиковой памяти по этапам (замедляет обработку)
+        self.chk_profile_memory = QCheckBox("Замер памяти", self)
+
         # Кнопка прерывания процесса
         self.btn_abort = QPushButton("Прервать", self)
         self.btn_abort.clicked.connect(self.abort_processing)
@@ -118,6 +155,11 @@ class ExcelComparator(QMainWindow):
         # Компоновка элементов управления
         control_layout.addWidget(self.btn_compare)
         control_layout.addWidget(self.btn_abort)
+        control_layout.addWidget(self.chk_standalone)
+        control_layout.addWidget(self.chk_highlight_copies)
+        control_layout.addWidget(self.chk_all_sheets)
+        control_layout.addWidget(self.chk_profile_memory)
+        control_layout.addWidget(self.btn_history)
         control_layout.addWidget(self.btn_about)
         layout.addLayout(control_layout)
 
@@ -128,10 +170,12 @@ class ExcelComparator(QMainWindow):
         self.progress.setAlignment(Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(self.progress)
 
-        # Текстовое поле для лога
+        # Текстовое поле для лога и под ним панель различий
+        self.splitter = QSplitter(Qt.Orientation.Vertical, self)
         self.log = QTextEdit()
         self.log.setReadOnly(True)  # Режим только для чтения
-        layout.addWidget(self.log)
+        self.splitter.addWidget(self.log)
+        layout.addWidget(self.splitter)
 
     def show_about_dialog(self):
         """Отображение диалогового окна с информацией о программе"""
@@ -145,6 +189,15 @@ class ExcelComparator(QMainWindow):
         """
         QMessageBox.information(self, "О программе", about_text)
 
+    def show_history_dialog(self):
+        """Отображение окна истории расхождений"""
+        try:
+            dialog = HistoryDialog(self)
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось открыть историю: {str(e)}")
+            return
+        dialog.exec()
+
     def select_file(self, file_num):
         """Выбор файла через диалоговое окно"""
         file_path, _ = QFileDialog.getOpenFileName(
@@ -155,18 +208,60 @@ class ExcelComparator(QMainWindow):
         )
 
         if file_path:
-            try:
-                # Проверка читаемости файла
-                pd.read_excel(file_path, nrows=1)
-                if file_num == 1:
-                    self.file1_path = file_path
-                    self.label_file1.setText(os.path.basename(file_path))
-                else:
-                    self.file2_path = file_path
-                    self.label_file2.setText(os.path.basename(file_path))
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка",
-                                     f"Невозможно прочитать файл:\n{str(e)}")
+            self.start_probe(file_num, file_path)
+
+    def start_probe(self, file_num, file_path):
+        """Запуск фоновой проверки выбранного файла"""
+        # Проверка ранее выбранного файла больше не нужна
+        previous = self.probe_workers.get(file_num)
+        if previous is not None:
+            previous.cancel()
+        self.background_workers = [worker for worker in self.background_workers
+                                   if not worker.isFinished()]
+
+        self.set_file(file_num, None, f"{os.path.basename(file_path)}: проверка...")
+        worker = ProbeWorker(file_num, file_path, self.cache)
+        worker.probed.connect(self.on_probed)
+        worker.failed.connect(self.on_probe_failed)
+        self.probe_workers[file_num] = worker
+        self.background_workers.append(worker)
+        self.probing.add(file_num)
+        worker.start()
+
+    def on_probed(self, file_num, info):
+        """Результат проверки файла: листы, количество строк и состав колонок"""
+        if self.sender() is not self.probe_workers.get(file_num):
+            return  # Результат проверки ранее выбранного файла
+        self.probing.discard(file_num)
+        name = os.path.basename(info['path'])
+        if info['missing']:
+            self.set_file(file_num, None, "Файл не выбран")
+            QMessageBox.critical(self, "Ошибка",
+                                 f"В файле {name} отсутствуют колонки: "
+                                 f"{', '.join(info['missing'])}")
+            return
+
+        rows = info['rows']
+        self.set_file(file_num, info['path'], f"{name} (строк: {rows})")
+        self.log_message(f"{name}: листы {', '.join(info['sheets'])}; "
+                         f"строк на первом листе: {rows}")
+
+    def on_probe_failed(self, file_num, message):
+        """Файл не удалось прочитать"""
+        if self.sender() is not self.probe_workers.get(file_num):
+            return
+        self.probing.discard(file_num)
+        self.set_file(file_num, None, "Файл не выбран")
+        QMessageBox.critical(self, "Ошибка", f"Невозможно прочитать файл:\n{message}")
+
+    def set_file(self, file_num, file_path, text):
+        """Запоминание выбранного файла и отображение его названия"""
+        if file_num == 1:
+            self.file1_path = file_path
+            self.label_file1.setText(text)
+        else:
+            self.file2_path = file_path
+            self.label_file2.setText(text)
 
     def start_comparison(self):
         """Запуск процесса сравнения файлов"""
@@ -175,6 +270,10 @@ class ExcelComparator(QMainWindow):
         self.selected_year = self.year_spin.value()
 
         # Проверка выбранных файлов
+        if self.probing:
+            QMessageBox.warning(self, "Ошибка", "Проверка выбранных файлов еще не завершена")
+            return
+
         if not all([self.file1_path, self.file2_path]):
             QMessageBox.warning(self, "Ошибка", "Необходимо выбрать оба файла!")
             return
@@ -188,32 +287,48 @@ class ExcelComparator(QMainWindow):
             self.file1_path,
             self.file2_path,
             self.selected_month,
-            self.selected_year
+            self.selected_year,
+            standalone_report=self.chk_standalone.isChecked(),
+            cache=self.cache,
+            profile_memory=self.chk_profile_memory.isChecked(),
+            highlight_copies=self.chk_highlight_copies.isChecked(),
+            all_sheets=self.chk_all_sheets.isChecked(),
+            warmups=[worker for worker in self.probe_workers.values() if worker.isRunning()]
         )
 
         # Подключение сигналов потока
         self.current_worker.progress_updated.connect(self.update_progress)
         self.current_worker.message_received.connect(self.log_message)
+        self.current_worker.results_ready.connect(self.show_results)
         self.current_worker.finished.connect(self.on_completion)
         self.current_worker.error_occurred.connect(self.show_error)
+        self.current_worker.cancelled.connect(self.on_cancelled)
 
         # Запуск потока
-        self.current_worker.start()
         self.toggle_controls(False)
+        self.current_worker.start()
 
     def abort_processing(self):
         """Прерывание выполнения операции"""
         if self.current_worker and self.current_worker.isRunning():
-            self.current_worker.terminate()
-            self.log_message("Процесс прерван пользователем")
-            self.toggle_controls(True)
+            # Поток завершается сам: исходные файлы не остаются записанными частично
+            self.current_worker.cancel()
+            self.btn_abort.setEnabled(False)
+            self.log_message("Прерывание процесса...")
+
+    def on_cancelled(self):
+        """Действия после прерывания обработки"""
+        self.toggle_controls(True)
+        self.log_message("Процесс прерван пользователем")
 
     def toggle_controls(self, enable):
         """Переключение состояния элементов управления"""
         self.btn_compare.setEnabled(enable)
         self.btn_abort.setEnabled(not enable)
         self.progress.setValue(0)
-        self.log.clear()
+        # Лог очищается при запуске; по завершении в нем остается сводка профиля
+        if not enable:
+            self.log.clear()
 
     def update_progress(self, value):
         """Обновление значения прогресс-бара"""
@@ -230,6 +345,18 @@ class ExcelComparator(QMainWindow):
         QMessageBox.critical(self, "Критическая ошибка", message)
         self.toggle_controls(True)
 
+    def show_results(self, report_data):
+        """Отображение различий в панели окна"""
+        if report_data is None:
+            return
+        if self.results_view is None:
+            # Модуль панели импортируется после сравнения: pandas уже загружен
+            from results_view import ResultsView
+            self.results_view = ResultsView(self)
+            self.splitter.addWidget(self.results_view)
+            self.splitter.setSizes([1, 3])
+        self.results_view.show_results(report_data)
+
     def on_completion(self, output_path):
         """Действия по завершении обработки"""
         self.toggle_controls(True)
@@ -241,6 +368,16 @@ class ExcelComparator(QMainWindow):
             )
             self.progress.setValue(100)
 
+    def closeEvent(self, event):
+        """Остановка фоновой подготовки данных при закрытии окна"""
+        for worker in self.background_workers:
+            worker.cancel()
+        for worker in self.background_workers:
+            worker.wait()
+        if self.preload_worker is not None:
+            self.preload_worker.wait()
+        super().closeEvent(event)
+
 
 class CompareWorker(QThread):
     """Класс-поток для выполнения сравнения в фоновом режиме"""
@@ -248,279 +385,218 @@ class CompareWorker(QThread):
     # Объявление сигналов для взаимодействия с GUI
     progress_updated = pyqtSignal(int)  # Прогресс выполнения
     message_received = pyqtSignal(str)  # Сообщения в лог
+    results_ready = pyqtSignal(object)  # Данные различий для панели просмотра
     finished = pyqtSignal(str)  # Завершение работы
     error_occurred = pyqtSignal(str)  # Ошибки при выполнении
+    cancelled = pyqtSignal()  # Прерывание пользователем
 
-    def __init__(self, file1_path, file2_path, month, year):
+    def __init__(self, file1_path, file2_path, month, year, standalone_report=False,
+                 cache=None, profile_memory=False, highlight_copies=False, all_sheets=False,
+                 warmups=()):
         super().__init__()
-        # Инициализация параметров
-        self.file1_path = file1_path  # Путь к первому файлу
-        self.file2_path = file2_path  # Путь ко второму файлу
-        self.month = month  # Выбранный месяц
-        self.year = year  # Выбранный год
-        self._is_running = True  # Флаг выполнения потока
+        self.warmups = list(warmups)  # Потоки подготовки данных выбранных файлов
+        self.cancel_token = CancelToken()  # Признак отмены, общий с конвейером
+        # Параметры конвейера: он создается в потоке, где загружены модули обработки
+        self.pipeline_args = (file1_path, file2_path, month, year)
+        self.all_sheets = all_sheets  # Сравнение всех листов книг
+        self.pipeline_options = {
+            'standalone_report': standalone_report,
+            'cache': cache,
+            'profile_memory': profile_memory,
+            'highlight_copies': highlight_copies,
+        }
 
     def run(self):
         """Основная логика сравнения файлов"""
         try:
-            self.message_received.emit("Инициализация процесса сравнения...")
-
-            # Загрузка данных из файлов
-            df1 = self.load_data(self.file1_path)
-            df2 = self.load_data(self.file2_path)
-
-            # Проверка структуры данных
-            self.validate_data(df1, df2)
-
-            # Объединение данных и обработка различий
-            merged_df = self.merge_dataframes(df1, df2)
-            report_data, highlight_info = self.process_differences(merged_df)
-
-            # Генерация итогового отчета
-            output_path = self.generate_report(report_data, highlight_info)
+            # Данные, которые еще готовятся в фоне, будут взяты из кэша
+            if any(warmup.isRunning() for warmup in self.warmups):
+                self.message_received.emit("Ожидание подготовки данных...")
+            for warmup in self.warmups:
+                warmup.wait()
+            from history import HistoryStore
+            signals = {
+                'history': HistoryStore(),  # Расхождения сохраняются в базу истории
+                'cancel_token': self.cancel_token,
+                'on_progress': self.progress_updated.emit,
+                'on_message': self.message_received.emit,
+            }
+            if self.all_sheets:
+                from multisheet import SheetComparisonPipeline
+
+                # Все листы, сопоставленные по названию; отчет - отдельным файлом
+                options = dict(self.pipeline_options)
+                del options['standalone_report']
+                pipeline = SheetComparisonPipeline(*self.pipeline_args, **options, **signals)
+            else:
+                from pipeline import ComparisonPipeline
+                from snapshot import SnapshotStore
+
+                # Конвейер сравнения, сообщающий о ходе работы через сигналы;
+                # при повторном сравнении заново проверяются только измененные строки
+                pipeline = ComparisonPipeline(*self.pipeline_args, **self.pipeline_options,
+                                              snapshots=SnapshotStore(), **signals)
+            output_path = pipeline.run()
+            self.results_ready.emit(pipeline.report_data)
             self.finished.emit(output_path)
-
+        except ComparisonCancelled:
+            self.cancelled.emit()
         except Exception as e:
             self.error_occurred.emit(f"Ошибка обработки: {str(e)}")
-        finally:
-            self._is_running = False
-
-    def load_data(self, file_path):
-        """Загрузка данных из Excel-файла"""
-        self.message_received.emit(f"Загрузка {os.path.basename(file_path)}...")
-        try:
-            # Чтение файла с настройками
-            df = pd.read_excel(
-                file_path,
-                dtype=str,  # Чтение всех данных как строки
-                keep_default_na=False,  # Игнорирование NaN значений
-                engine='openpyxl'  # Используемый движок
-            )
-            df.columns = df.columns.astype(str)  # Приведение названий колонок к строке
-            return df
-        except Exception as e:
-            raise ValueError(f"Ошибка чтения файла {file_path}: {str(e)}")
-
-    def validate_data(self, df1, df2):
-        """Проверка структуры данных в файлах"""
-        required_columns = {'id', 'ФИО', 'должность'} | \
-                           {str(i) for i in range(1, 32)}  # Колонки дней
-
-        for df, num in zip([df1, df2], ['первом', 'втором']):
-            missing = required_columns - set(df.columns)
-            if missing:
-                raise ValueError(
-                    f"В {num} файле отсутствуют колонки: {', '.join(missing)}")
-
-    def merge_dataframes(self, df1, df2):
-        """Объединение данных из двух DataFrame"""
-        self.message_received.emit("Сопоставление данных...")
-        # Добавление индексов для отслеживания позиций
-        df1['original_index'] = df1.index
-        df2['original_index'] = df2.index
-
-        # Внешнее объединение по полю id
-        merged = pd.merge(
-            df1, df2,
-            on='id',
-            suffixes=('_base', '_compare'),
-            how='outer',
-            indicator=True)
-
-        # Сохранение отсутствующих записей
-        self.missing_in_base = merged[merged['_merge'] == 'right_only'][['id', 'ФИО_compare']]
-        self.missing_in_compare = merged[merged['_merge'] == 'left_only'][['id', 'ФИО_base']]
-
-        return merged[merged['_merge'] == 'both']
-
-    def process_differences(self, merged_df):
-        """Обработка и классификация расхождений"""
-        self.message_received.emit("Поиск различий...")
-        vv_diff = []  # Различия с меткой "ВВ"
-        dp_diff = []  # Различия с меткой "ДП"
-        other_diff = []  # Прочие различия
-        highlight_info = {'base': [], 'compare': []}  # Ячейки для подсветки
-        total_rows = len(merged_df)
-        day_columns = [str(i) for i in range(1, 32)]  # Колонки дней (1-31)
-
-        for idx, (_, row) in enumerate(merged_df.iterrows()):
-            if not self._is_running:  # Проверка флага прерывания
-                break
-
-            # Получение индексов строк в исходных файлах
-            base_index = row['original_index_base'] + 2  # +2 для Excel строк
-            compare_index = row['original_index_compare'] + 2
-
-            # Проверка различий по дням
-            for day in day_columns:
-                base_val = str(row[f'{day}_base']).strip()
-                compare_val = str(row[f'{day}_compare']).strip()
-
-                if base_val != compare_val:
-                    # Формирование даты для отчета
-                    try:
-                        date_str = f"{int(day):02d}.{self.month:02d}.{self.year}"
-                    except:
-                        date_str = day
-
-                    # Создание записи для отчета
-                    entry = [
-                        row['id'],
-                        row['ФИО_base'],
-                        date_str,
-                        base_val,
-                        compare_val
-                    ]
-
-                    # Классификация различий
-                    if "ВВ" in (base_val, compare_val):
-                        vv_diff.append(entry)
-                    elif "ДП" in (base_val, compare_val):
-                        dp_diff.append(entry)
-                    else:
-                        other_diff.append(entry)
-
-                    # Сохранение позиций для подсветки
-                    base_col = merged_df.columns.get_loc(f'{day}_base') + 1
-                    compare_col = merged_df.columns.get_loc(f'{day}_compare') + 1
-                    highlight_info['base'].append((base_index, base_col))
-                    highlight_info['compare'].append((compare_index, compare_col))
-
-            # Обновление прогресса выполнения
-            progress = int(20 + 70 * (idx + 1) / total_rows)
-            self.progress_updated.emit(progress)
-
-        # Обработка отсутствующих записей
-        missing_data = []
-        for _, row in self.missing_in_base.iterrows():
-            missing_data.append([row['id'], row['ФИО_compare'], "Отсутствует в БАЗОВОМ файле"])
-
-        for _, row in self.missing_in_compare.iterrows():
-            missing_data.append([row['id'], row['ФИО_base'], "Отсутствует в ФАЙЛЕ СРАВНЕНИЯ"])
-
-        return (
-            {'vv': vv_diff, 'dp': dp_diff, 'other': other_diff, 'missing': missing_data},
-            highlight_info
-        )
-
-    def generate_report(self, report_data, highlight_info):
-        """Генерация итогового отчета"""
-        self.message_received.emit("Формирование отчетов...")
-        try:
-            # Подсветка различий в исходных файлах
-            self.highlight_differences(self.file1_path, highlight_info['base'])
-            self.highlight_differences(self.file2_path, highlight_info['compare'])
 
-            # Создание файла отчета
-            output_path = self.create_report_file(report_data)
-            return output_path
-        except Exception as e:
-            raise ValueError(f"Ошибка создания отчетов: {str(e)}")
-
-    def highlight_differences(self, file_path, cells):
-        """Подсветка ячеек с различиями в файле"""
-        if not cells:
-            return
+    def cancel(self):
+        """Запрос на прерывание: этапы завершаются в ближайшей точке проверки"""
+        self.cancel_token.cancel()
+        for warmup in self.warmups:
+            warmup.cancel()
 
-        # Создание объекта книги и листа
-        wb = load_workbook(file_path)
-        ws = wb.active
 
-        # Настройка стиля подсветки
-        yellow_fill = PatternFill(
-            start_color='FFFF00',
-            end_color='FFFF00',
-            fill_type='solid'
-        )
+class ProbeWorker(QThread):
+    """Поток проверки выбранного файла и подготовки его данных к сравнению.
 
-        # Применение стиля к ячейкам
-        for row, col in cells:
-            ws.cell(row=row, column=col).fill = yellow_fill
-
-        # Сохранение изменений
-        wb.save(file_path)
-        wb.close()
-
-    def create_report_file(self, report_data):
-        """Создание файла отчета с несколькими листами"""
-        # Формирование пути для сохранения
-        output_dir = os.path.dirname(self.file1_path)
-        base_name = os.path.splitext(os.path.basename(self.file1_path))[0]
-        output_name = f"Сравнение_{base_name}.xlsx"
-        output_path = os.path.join(output_dir, output_name)
-
-        # Загрузка базового файла
-        wb = load_workbook(self.file1_path)
-
-        # Удаление существующих листов отчетов
-        for sheet in ['ВВ', 'ДП', 'Остальные', 'Отсутствующие']:
-            if sheet in wb.sheetnames:
-                del wb[sheet]
-
-        # Конфигурация листов отчета
-        sheets_config = {
-            'ВВ': {
-                'data': report_data['vv'],
-                'color': 'FF0000',  # Красный
-                'header': f'Различия с отметками ВВ ({self.month:02d}.{self.year})',
-                'columns': ['ID', 'ФИО', 'Дата', 'Базовый файл', 'Файл сравнения']
-            },
-            'ДП': {
-                'data': report_data['dp'],
-                'color': '0000FF',  # Синий
-                'header': f'Различия с отметками ДП ({self.month:02d}.{self.year})',
-                'columns': ['ID', 'ФИО', 'Дата', 'Базовый файл', 'Файл сравнения']
-            },
-            'Остальные': {
-                'data': report_data['other'],
-                'color': '008000',  # Зеленый
-                'header': f'Прочие различия ({self.month:02d}.{self.year})',
-                'columns': ['ID', 'ФИО', 'Дата', 'Базовый файл', 'Файл сравнения']
-            },
-            'Отсутствующие': {
-                'data': report_data['missing'],
-                'color': 'FFA500',  # Оранжевый
-                'header': 'Отсутствующие сотрудники',
-                'columns': ['ID', 'ФИО', 'Статус']
-            }
-        }
+    Читается только строка заголовков (и строки первого листа, если его
+    размеры не записаны в файле), поэтому результат проверки приходит
+    сразу. Затем данные табеля читаются в кэш, чтобы сравнение
+    не разбирало файл заново.
+    """
 
-        # Создание листов
-        for sheet_name, config in sheets_config.items():
-            ws = wb.create_sheet(sheet_name)
+    probed = pyqtSignal(int, dict)  # Номер файла и сведения о нем
+    failed = pyqtSignal(int, str)  # Номер файла и текст ошибки
 
-            # Заголовки столбцов
-            ws.append(config['columns'])
+    def __init__(self, file_num, file_path, cache=None):
+        super().__init__()
+        self.file_num = file_num  # Номер файла (1 - базовый, 2 - сравнения)
+        self.file_path = file_path  # Путь к файлу
+        self.cache = cache  # Кэш разобранных табелей
+        self.cancel_token = CancelToken()  # Признак отмены подготовки
 
-            # Настройка стиля заголовков
-            header_font = Font(bold=True, color=config['color'])
-            for cell in ws[1]:
-                cell.font = header_font
+    def run(self):
+        """Проверка заголовков и чтение данных в кэш"""
+        from loader import WorkbookSource, probe_workbook
+        from pipeline import REQUIRED_COLUMNS, read_timesheet
 
-            # Добавление данных
-            for row in config['data']:
-                ws.append(row)
+        try:
+            info = probe_workbook(self.file_path)
+        except Exception as e:
+            self.failed.emit(self.file_num, str(e))
+            return
+        header = set(info['header'])
+        info['path'] = self.file_path
+        info['missing'] = [column for column in REQUIRED_COLUMNS if column not in header]
+        self.probed.emit(self.file_num, info)
 
-            # Автоматическая настройка ширины столбцов
-            for col in ws.columns:
-                max_length = 0
-                column_letter = get_column_letter(col[0].column)
-                for cell in col:
-                    try:
-                        max_length = max(max_length, len(str(cell.value)))
-                    except:
-                        pass
-                adjusted_width = (max_length + 2) * 1.2
-                ws.column_dimensions[column_letter].width = adjusted_width
+        if self.cache is None or info['missing']:
+            return
+        try:
+            read_timesheet(WorkbookSource(self.file_path), self.cache, self.cancel_token)
+        except Exception:
+            pass  # Прерывание или ошибка чтения: файл будет прочитан при сравнении
+
+    def cancel(self):
+        """Прекращение подготовки данных"""
+        self.cancel_token.cancel()
+
+
+class HistoryDialog(QDialog):
+    """Просмотр истории расхождений с отбором по сотруднику, категории и году"""
+
+    # Наибольшее количество строк в таблице
+    ROW_LIMIT = 5000
+
+    # Заголовки колонок таблицы по ключам строк выборки
+    TITLES = {
+        'emp_id': 'ID', 'name': 'ФИО', 'date': 'Дата', 'category': 'Категория',
+        'base_value': 'Базовый файл', 'compare_value': 'Файл сравнения',
+        'compare_file': 'Сравнение', 'count': 'Количество',
+        'first_date': 'Первая дата', 'last_date': 'Последняя дата',
+    }
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        from history import HistoryStore
+        self.store = HistoryStore()  # База истории расхождений
+
+        self.setWindowTitle("История расхождений")
+        self.resize(900, 500)
+        layout = QVBoxLayout(self)
+
+        # Фильтры выборки
+        filters = QHBoxLayout()
+        self.edit_id = QLineEdit(self)
+        self.edit_id.setPlaceholderText("ID сотрудника")
+        self.edit_id.returnPressed.connect(self.run_query)
+        self.combo_category = QComboBox(self)
+        self.combo_category.addItems(["Все категории", "ВВ", "ДП", "Прочие"])
+        self.spin_year = QSpinBox(self)
+        self.spin_year.setRange(0, 2100)
+        self.spin_year.setSpecialValueText("Все годы")  # 0 - без отбора по году
+        self.chk_counts = QCheckBox("Итоги по сотрудникам", self)
+        self.btn_query = QPushButton("Найти", self)
+        self.btn_query.clicked.connect(self.run_query)
+        for widget in (self.edit_id, self.combo_category, self.spin_year, self.chk_counts,
+                       self.btn_query):
+            filters.addWidget(widget)
+        layout.addLayout(filters)
+
+        # Результаты выборки
+        self.table = QTableWidget(self)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        layout.addWidget(self.table)
+        self.label_status = QLabel(self)
+        layout.addWidget(self.label_status)
+
+    def run_query(self):
+        """Выборка из базы истории по заданным фильтрам"""
+        filters = {
+            'emp_id': self.edit_id.text().strip() or None,
+            'category': (self.combo_category.currentText()
+                         if self.combo_category.currentIndex() else None),
+            'year': self.spin_year.value() or None,
+            'limit': self.ROW_LIMIT,
+        }
+        started = time.perf_counter()
+        if self.chk_counts.isChecked():
+            rows = self.store.counts(**filters)
+            keys = ['emp_id', 'name', 'category', 'count', 'first_date', 'last_date']
+        else:
+            rows = self.store.discrepancies(**filters)
+            keys = ['emp_id', 'name', 'date', 'category', 'base_value', 'compare_value',
+                    'compare_file']
+        elapsed = (time.perf_counter() - started) * 1000
+
+        self.table.clear()
+        self.table.setColumnCount(len(keys))
+        self.table.setRowCount(len(rows))
+        self.table.setHorizontalHeaderLabels([self.TITLES[key] for key in keys])
+        for row_idx, row in enumerate(rows):
+            for col_idx, key in enumerate(keys):
+                value = row[key]
+                if key == 'compare_file':
+                    value = os.path.basename(value)
+                self.table.setItem(row_idx, col_idx, QTableWidgetItem(str(value)))
+        self.table.resizeColumnsToContents()
+        self.label_status.setText(f"Найдено строк: {len(rows)} ({elapsed:.0f} мс)")
+
+
+class PreloadWorker(QThread):
+    """Поток импорта модулей обработки, пока пользователь выбирает файлы"""
+
+    def __init__(self, modules):
+        super().__init__()
+        self.modules = modules  # Имена импортируемых модулей
 
-        # Сохранение и закрытие файла
-        wb.save(output_path)
-        wb.close()
-        return output_path
+    def run(self):
+        """Импорт модулей (повторный импорт в рабочих потоках мгновенный)"""
+        for name in self.modules:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                pass  # Ошибка импорта будет показана при сравнении
 
 
 if __name__ == '__main__':
     # Точка входа в приложение
+    multiprocessing.freeze_support()  # Дочерние процессы подсветки в собранном приложении
     app = QApplication(sys.argv)
     window = ExcelComparator()
     window.show()
@@ -0,0 +1,395 @@
+"""
+СРАВНЕНИЕ БАЗОВОГО ТАБЕЛЯ С НЕСКОЛЬКИМИ РЕДАКЦИЯМИ
+Автор: VaSeBa
+
+Базовый табель загружается и упорядочивается по id один раз, после чего
+с ним сопоставляется каждая редакция. Параллельно в пуле процессов
+выполняются загрузка и подсветка редакций; поиск различий идет по
+редакциям в основном процессе: он векторизован и занимает доли секунды
+на редакцию, а передача упорядоченного базового табеля и строк различий
+между процессами обходится дороже самого сравнения. Подсветка базовой
+книги выполняется за один проход по ячейкам, отличающимся хотя бы в
+одной редакции, а итог записывается в один сводный отчет: по каждому
+сотруднику и дню - значения редакций, отличающиеся от базового табеля.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from highlight import highlight_file
+from loader import WorkbookSource
+from pipeline import (DAY_COLUMNS, DIFF_CHUNK_ROWS, PARALLEL_MIN_BYTES, REQUIRED_COLUMNS,
+                      ComparisonPipeline, missing_records, read_timesheet)
+from progress import ComparisonCancelled, PendingWrites
+
+# Отображение пустой отметки редакции, отличающейся от базового табеля
+EMPTY_MARK = '(пусто)'
+
+
+class BaseIndex:
+    """Базовый табель, упорядоченный по id для сопоставления с редакциями"""
+
+    def __init__(self, df):
+        ids = df['id'].to_numpy(dtype=object)
+        # Устойчивая сортировка: строки с одинаковым id - в исходном порядке
+        self.order = np.argsort(ids, kind='stable')  # Номера строк листа по порядку id
+        self.ids = ids[self.order]
+        self.names = df['ФИО'].to_numpy(dtype=object)[self.order]
+        self.days = df[DAY_COLUMNS].to_numpy()[self.order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def match(self, ids):
+        """Сопоставление строк редакции со строками базового табеля.
+
+        Возвращает номера сопоставленных строк в упорядоченной базе и в
+        редакции (порядок как при внешнем объединении pandas: id, строка
+        базы, строка редакции), номера строк редакции без пары (по порядку
+        id) и номера строк упорядоченной базы без пары.
+        """
+        ids = np.asarray(ids, dtype=object)
+        revision_order = np.argsort(ids, kind='stable')
+        sorted_ids = ids[revision_order]
+        lo = np.searchsorted(self.ids, sorted_ids, side='left')
+        hi = np.searchsorted(self.ids, sorted_ids, side='right')
+        counts = hi - lo
+
+        # Каждой строке редакции - все строки базы с тем же id
+        revision_pos = np.repeat(revision_order, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        base_rank = np.repeat(lo, counts) + offsets
+        order = np.lexsort((revision_pos, base_rank))
+
+        # Строки базы, не покрытые ни одним диапазоном
+        cover = np.zeros(len(self.ids) + 1, dtype=np.int64)
+        np.add.at(cover, lo, 1)
+        np.add.at(cover, hi, -1)
+        unmatched_base = np.nonzero(np.cumsum(cover[:-1]) == 0)[0]
+
+        return base_rank[order], revision_pos[order], revision_order[counts == 0], unmatched_base
+
+
+def load_revision(file_path, cache=None):
+    """Загрузка редакции (выполняется в процессе пула)"""
+    source = WorkbookSource(file_path)
+    df, from_cache = read_timesheet(source, cache)
+    return df, from_cache, source.column_index()
+
+
+class MultiComparisonPipeline(ComparisonPipeline):
+    """Сравнение базового табеля с несколькими редакциями и сводный отчет"""
+
+    def __init__(self, base_path, revision_paths, month, year, cache=None,
+                 on_progress=None, on_message=None, cancel_token=None, profile_memory=False,
+                 highlight_copies=False, highlight=True, workers=None, history=None):
+        super().__init__(base_path, None, month, year, standalone_report=True, cache=cache,
+                         on_progress=on_progress, on_message=on_message,
+                         cancel_token=cancel_token, profile_memory=profile_memory,
+                         highlight_copies=highlight_copies, highlight=highlight,
+                         history=history)
+        self.compare_source = None  # Вместо одного файла сравнения - редакции
+        self.revision_paths = list(revision_paths)  # Пути к редакциям
+        self.revision_sources = [WorkbookSource(path) for path in self.revision_paths]
+        self.workers = workers  # Количество процессов пула (None - по числу ядер)
+        self.revision_counts = []  # Количество различий по каждой редакции
+
+    def run(self):
+        """Выполнение сравнения со всеми редакциями, возвращает путь к отчету"""
+        profiler = self.profiler
+        profiler.start()
+        try:
+            self.log(f"Сравнение с редакциями: {len(self.revision_paths)}")
+
+            # Базовый табель загружается и упорядочивается один раз
+            with profiler.stage('load_base'):
+                base_df = self.load_data(self.base_source)
+                self.check_columns(base_df, self.file1_path)
+                base = BaseIndex(base_df)
+            self.report_progress(10)
+            profiler.count('rows_base', len(base))
+
+            with profiler.stage('load_revisions'):
+                revisions = self.load_revisions()
+            profiler.count('revisions', len(revisions))
+            profiler.count('rows_revisions', sum(len(df) for df in revisions))
+
+            # Сравнение в основном процессе (векторизовано, см. описание модуля)
+            with profiler.stage('diff'):
+                results = [self.compare_revision(base, df, source)
+                           for df, source in zip(revisions, self.revision_sources)]
+            self.report_progress(80)
+            profiler.count('cells_compared', sum(result['merged'] for result in results) * 31)
+
+            report_data = self.summarize(base, results)
+            self.report_counts = {key: len(rows) for key, rows in report_data.items()}
+            output_path = self.generate_multi_report(report_data, results)
+            self.record_history([{
+                'base_file': self.file1_path, 'compare_file': result['source'].file_path,
+                'month': self.month, 'year': self.year, 'report_data': result['report_data'],
+                'report_path': output_path} for result in results])
+        finally:
+            profiler.stop()
+            self.base_source.close()
+            for source in self.revision_sources:
+                source.close()
+
+        self.write_profile(output_path, base_file=self.file1_path,
+                           revision_files=self.revision_paths,
+                           revision_counts=self.revision_counts,
+                           report_counts=self.report_counts)
+        return output_path
+
+    def check_columns(self, df, file_path):
+        """Проверка наличия необходимых колонок в загруженном табеле"""
+        missing = set(REQUIRED_COLUMNS) - set(df.columns)
+        if missing:
+            raise ValueError(f"В файле {os.path.basename(file_path)} отсутствуют колонки: "
+                             f"{', '.join(missing)}")
+
+    def use_pool(self, paths):
+        """Нужен ли пул процессов для обработки файлов"""
+        if len(paths) < 2 or (self.workers is not None and self.workers < 2):
+            return False
+        return sum(os.path.getsize(path) for path in paths) >= PARALLEL_MIN_BYTES
+
+    def pool_size(self, tasks):
+        """Количество процессов пула для заданного числа задач"""
+        return max(1, min(self.workers or os.cpu_count() or 1, tasks))
+
+    def load_revisions(self):
+        """Загрузка редакций: параллельно в пуле процессов или по очереди"""
+        total = len(self.revision_paths)
+        frames = [None] * total
+        if not self.use_pool(self.revision_paths):
+            for idx, source in enumerate(self.revision_sources):
+                frames[idx] = self.load_data(source)
+                self.check_columns(frames[idx], source.file_path)
+                self.report_progress(int(10 + 40 * (idx + 1) / total))
+            return frames
+
+        self.log("Параллельная загрузка редакций...")
+        executor = ProcessPoolExecutor(max_workers=self.pool_size(total),
+                                       mp_context=multiprocessing.get_context('spawn'))
+        try:
+            pending = {executor.submit(load_revision, path, self.cache): idx
+                       for idx, path in enumerate(self.revision_paths)}
+            while pending:
+                self.cancel_token.check()
+                done, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx = pending.pop(future)
+                    source = self.revision_sources[idx]
+                    try:
+                        df, from_cache, column_index = future.result()
+                    except Exception as e:
+                        raise ValueError(f"Ошибка чтения файла {source.file_path}: {str(e)}")
+                    if from_cache:
+                        self.log(f"{os.path.basename(source.file_path)}: данные взяты из кэша")
+                    # Заголовки уже прочитаны в процессе пула
+                    self.revision_sources[idx] = WorkbookSource(source.file_path,
+                                                                column_index=column_index)
+                    self.check_columns(df, source.file_path)
+                    # Кодирование в основном процессе: словарь отметок общий
+                    frames[idx] = self.encode_days(df)
+                    self.report_progress(int(10 + 40 * (total - len(pending)) / total))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return frames
+
+    def compare_revision(self, base, df, source):
+        """Сравнение одной редакции с упорядоченным базовым табелем"""
+        self.cancel_token.check()
+        self.log(f"Поиск различий: {os.path.basename(source.file_path)}...")
+        report_data = {'vv': [], 'dp': [], 'other': []}  # Различия по категориям
+        highlight_info = {'base': [], 'compare': []}  # Ячейки для подсветки
+        keys = []  # Ключи различий: номер строки упорядоченной базы * 31 + день
+        values = []  # Номера отметок редакции в ячейках с различиями
+        context = self.diff_context(source)
+
+        ids = df['id'].to_numpy(dtype=object)
+        names = df['ФИО'].to_numpy(dtype=object)
+        days = df[DAY_COLUMNS].to_numpy()
+        base_rank, revision_pos, unmatched_revision, unmatched_base = base.match(ids)
+
+        for start in range(0, len(base_rank), DIFF_CHUNK_ROWS):
+            self.cancel_token.check()  # Проверка запроса на прерывание
+            ranks = base_rank[start:start + DIFF_CHUNK_ROWS]
+            positions = revision_pos[start:start + DIFF_CHUNK_ROWS]
+            compare_block = days[positions]
+            rows, cols = self.diff_block(
+                context, report_data, highlight_info,
+                ids=base.ids[ranks], names=base.names[ranks],
+                base_block=base.days[ranks], compare_block=compare_block,
+                base_positions=base.order[ranks], compare_positions=positions)
+            keys.append(ranks[rows].astype(np.int64) * len(DAY_COLUMNS) + cols)
+            values.append(compare_block[rows, cols].astype(np.int64))
+
+        report_data['missing'] = missing_records(
+            zip(ids[unmatched_revision].tolist(), names[unmatched_revision].tolist()),
+            zip(base.ids[unmatched_base].tolist(), base.names[unmatched_base].tolist()))
+        self.revision_counts.append(
+            {'file': source.file_path, **{key: len(rows) for key, rows in report_data.items()}})
+        return {
+            'source': source,
+            'report_data': report_data,
+            'highlight_info': highlight_info,
+            'keys': np.concatenate(keys) if keys else np.empty(0, dtype=np.int64),
+            'values': np.concatenate(values) if values else np.empty(0, dtype=np.int64),
+            'merged': len(base_rank),
+        }
+
+    def summarize(self, base, results):
+        """Сводные данные отчета: различия по сотрудникам и дням во всех редакциях"""
+        self.log("Формирование сводки...")
+        day_count = len(DAY_COLUMNS)
+        keys = np.unique(np.concatenate([result['keys'] for result in results]))
+
+        # Отметки редакций в ячейках сводки (-1 - совпадает с базовым табелем)
+        marks = np.full((len(keys), len(results)), -1, dtype=np.int64)
+        for col, result in enumerate(results):
+            # При повторяющихся id в редакции берется первая сопоставленная строка
+            positions = np.searchsorted(keys, result['keys'][::-1])
+            marks[positions, col] = result['values'][::-1]
+
+        ranks, days = np.divmod(keys, day_count)
+        base_marks = base.days[ranks, days].astype(np.int64)
+        code_strings = np.array(self.codes.codes + [''], dtype=object)  # -1 - без различий
+        shown = code_strings[marks]
+        shown[marks == 0] = EMPTY_MARK
+
+        # Категория ячейки: ВВ имеет приоритет над ДП (как в отчете по паре файлов)
+        vv_id, dp_id = self.codes.id_of('ВВ'), self.codes.id_of('ДП')
+        is_vv = (base_marks == vv_id) | (marks == vv_id).any(axis=1)
+        is_dp = ~is_vv & ((base_marks == dp_id) | (marks == dp_id).any(axis=1))
+        categories = np.where(is_vv, 'ВВ', np.where(is_dp, 'ДП', 'Прочие')).astype(object)
+
+        dates = np.array([f"{int(day):02d}.{self.month:02d}.{self.year}"
+                          for day in DAY_COLUMNS], dtype=object)
+        summary = np.empty((len(keys), 6 + len(results)), dtype=object)
+        summary[:, 0] = base.ids[ranks]
+        summary[:, 1] = base.names[ranks]
+        summary[:, 2] = dates[days]
+        summary[:, 3] = code_strings[base_marks]
+        summary[:, 4:4 + len(results)] = shown
+        summary[:, 4 + len(results)] = (marks >= 0).sum(axis=1)
+        summary[:, 5 + len(results)] = categories
+
+        # Итоги и отсутствующие сотрудники по редакциям
+        totals = []
+        missing = []
+        for result in results:
+            name = os.path.basename(result['source'].file_path)
+            data = result['report_data']
+            missing_in_base = sum(1 for row in data['missing']
+                                  if row[2] == "Отсутствует в БАЗОВОМ файле")
+            totals.append([name, len(data['vv']), len(data['dp']), len(data['other']),
+                           missing_in_base, len(data['missing']) - missing_in_base])
+            missing.extend(row + [name] for row in data['missing'])
+
+        return {'summary': summary.tolist(), 'totals': totals, 'missing': missing}
+
+    def generate_multi_report(self, report_data, results):
+        """Общая подсветка всех книг и запись сводного отчета"""
+        self.log("Формирование отчетов...")
+        writes = PendingWrites()
+        pool = None
+        try:
+            with self.profiler.stage('highlight'):
+                pool = self.highlight_all(results, writes)
+            self.report_progress(95)
+
+            with self.profiler.stage('report'):
+                output_path = self.create_multi_report_file(report_data, results, writes)
+                self.cancel_token.check()
+                writes.commit()
+            self.profiler.count('report_rows', sum(len(rows) for rows in report_data.values()))
+        except ComparisonCancelled:
+            raise
+        except Exception as e:
+            raise ValueError(f"Ошибка создания отчетов: {str(e)}")
+        finally:
+            if pool is not None:
+                pool.terminate()
+            writes.discard()
+
+        # Подсветка не меняет значения ячеек: кэш перезаписанных файлов
+        # остается действительным (остальные файлы не сохранялись)
+        if self.cache is not None and self.highlight and not self.highlight_copies:
+            saved = [result['source'] for result in results
+                     if result['highlight_info']['compare']]
+            if any(result['highlight_info']['base'] for result in results):
+                saved.insert(0, self.base_source)
+            for source in saved:
+                self.cache.relink(source.file_path, REQUIRED_COLUMNS)
+
+        self.report_progress(100)
+        return output_path
+
+    def highlight_all(self, results, writes):
+        """Подсветка базовой книги за один проход и всех редакций"""
+        if not self.highlight:
+            return None
+
+        # Ячейки базовой книги, отличающиеся хотя бы в одной редакции
+        base_cells = list(dict.fromkeys(
+            cell for result in results for cell in result['highlight_info']['base']))
+        revisions = [(result['source'], result['highlight_info']['compare'])
+                     for result in results if result['highlight_info']['compare']]
+        self.profiler.count('cells_highlighted',
+                            len(base_cells) + sum(len(cells) for _, cells in revisions))
+
+        # Редакции - в пуле процессов параллельно с базовой книгой
+        pool, tasks = None, []
+        if self.use_pool([source.file_path for source, _ in revisions]):
+            pool = multiprocessing.get_context('spawn').Pool(self.pool_size(len(revisions)))
+            for source, cells in revisions:
+                target = writes.reserve(self.highlight_target(source.file_path))
+                tasks.append(pool.apply_async(highlight_file, (source.file_path, cells, target)))
+            pool.close()
+
+        self.highlight_differences(self.base_source, base_cells, writes)
+        if pool is None:
+            for source, cells in revisions:
+                self.highlight_differences(source, cells, writes)
+                source.close()  # Книга редакции больше не нужна
+        else:
+            for task in tasks:
+                while not task.ready():
+                    self.cancel_token.check()
+                    task.wait(0.1)
+                task.get()  # Передача ошибки из дочернего процесса
+            pool.join()
+        return pool
+
+    def create_multi_report_file(self, report_data, results, writes):
+        """Запись сводного отчета в отдельную книгу"""
+        output_dir = os.path.dirname(self.file1_path)
+        base_name = os.path.splitext(os.path.basename(self.file1_path))[0]
+        output_path = os.path.join(output_dir, f"Сводное_сравнение_{base_name}.xlsx")
+
+        revision_names = [os.path.basename(result['source'].file_path) for result in results]
+        sheets_config = {
+            'Сводка': {
+                'data': report_data['summary'],
+                'color': 'FF0000',  # Красный
+                'columns': (['ID', 'ФИО', 'Дата', 'Базовый файл'] + revision_names +
+                            ['Редакций с различиями', 'Категория']),
+            },
+            'По редакциям': {
+                'data': report_data['totals'],
+                'color': '0000FF',  # Синий
+                'columns': ['Редакция', 'ВВ', 'ДП', 'Прочие',
+                            'Отсутствуют в базовом', 'Отсутствуют в редакции'],
+            },
+            'Отсутствующие': {
+                'data': report_data['missing'],
+                'color': 'FFA500',  # Оранжевый
+                'columns': ['ID', 'ФИО', 'Статус', 'Редакция'],
+            },
+        }
+        self.write_standalone_report(output_path, sheets_config, writes)
+        return output_path
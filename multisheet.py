@@ -0,0 +1,424 @@
+"""
+СРАВНЕНИЕ КНИГ ПО ЛИСТАМ
+Автор: VaSeBa
+
+Выгрузки, в которых каждый месяц или отдел записан на отдельном листе.
+Листы двух книг сопоставляются по названию (или по явному соответствию),
+период табеля определяется по названию листа, а если он не указан -
+берется выбранный месяц и год. Каждая книга открывается для чтения
+один раз (в каждом процессе пула) и используется всеми парами листов.
+Пары листов сравниваются параллельно в пуле процессов, затем каждая
+книга подсвечивается за одну загрузку,
+а результат записывается в один отчет: сводка по листам с общим итогом
+и различия по категориям с указанием листа.
+"""
+
+import multiprocessing
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from highlight import apply_highlight, highlight_sheets
+from loader import WorkbookReader
+from pipeline import PARALLEL_MIN_BYTES, REQUIRED_COLUMNS, ComparisonPipeline
+from progress import ComparisonCancelled, PendingWrites
+from summary import summary_blocks
+
+# Названия месяцев в названиях листов (по порядку месяцев): отдельные слова
+# в именительном, родительном или предложном падеже, а не начала других
+# слов ("Мартынов", "Июлин")
+MONTH_PATTERNS = [re.compile(rf'(?<![а-яё]){form}(?![а-яё])', re.IGNORECASE) for form in (
+    'январ[ьяе]', 'феврал[ьяе]', 'март[ае]?', 'апрел[ьяе]', 'ма[йяе]', 'июн[ьяе]',
+    'июл[ьяе]', 'август[ае]?', 'сентябр[ьяе]', 'октябр[ьяе]', 'ноябр[ьяе]', 'декабр[ьяе]')]
+
+# Период цифрами: 03.2025, 3-2025, 2025_03 и т. п.
+MONTH_YEAR_PATTERN = re.compile(r'(?<!\d)(\d{1,2})[.\-_/ ](\d{4})(?!\d)')
+YEAR_MONTH_PATTERN = re.compile(r'(?<!\d)(\d{4})[.\-_/ ](\d{1,2})(?!\d)')
+YEAR_PATTERN = re.compile(r'(?<!\d)((?:19|20)\d{2})(?!\d)')
+
+# Книги, открытые для чтения в процессе пула (создаются инициализатором процесса)
+_worker_readers = None
+
+# Статусы листов без пары в сводке
+NO_COMPARE_SHEET = "Нет листа в файле сравнения"
+NO_BASE_SHEET = "Нет листа в базовом файле"
+
+
+def sheet_period(name, month, year):
+    """Период табеля по названию листа: (месяц, год).
+
+    Не указанные в названии месяц или год берутся из month и year.
+    """
+    for pattern, month_group, year_group in ((MONTH_YEAR_PATTERN, 1, 2),
+                                             (YEAR_MONTH_PATTERN, 2, 1)):
+        for match in pattern.finditer(name):
+            found = int(match.group(month_group))
+            if 1 <= found <= 12:
+                return found, int(match.group(year_group))
+
+    for idx, pattern in enumerate(MONTH_PATTERNS, 1):
+        if pattern.search(name):
+            month = idx
+            break
+    found_year = YEAR_PATTERN.search(name)
+    return month, int(found_year.group(1)) if found_year else year
+
+
+def pair_sheets(base_sheets, compare_sheets, sheet_map=None):
+    """Сопоставление листов двух книг.
+
+    Сначала применяется явное соответствие sheet_map (лист базовой книги:
+    лист книги сравнения), остальные листы сопоставляются по названию без
+    учета регистра и пробелов по краям. Если в каждой книге по одному
+    листу, они сопоставляются независимо от названий. Возвращает пары
+    в порядке листов базовой книги и листы без пары в каждой книге.
+    """
+    sheet_map = dict(sheet_map or {})
+    for base, compare in sheet_map.items():
+        if base not in base_sheets:
+            raise ValueError(f"Лист '{base}' не найден в базовом файле")
+        if compare not in compare_sheets:
+            raise ValueError(f"Лист '{compare}' не найден в файле сравнения")
+
+    mapped = set(sheet_map.values())
+    by_name = {}
+    for name in compare_sheets:
+        if name not in mapped:
+            by_name.setdefault(name.strip().casefold(), name)
+
+    pairs = []
+    for base in base_sheets:
+        compare = sheet_map.get(base) or by_name.pop(base.strip().casefold(), None)
+        if compare is not None:
+            pairs.append((base, compare))
+
+    if not pairs and len(base_sheets) == 1 and len(compare_sheets) == 1:
+        pairs.append((base_sheets[0], compare_sheets[0]))
+
+    paired_base = {base for base, _ in pairs}
+    paired_compare = {compare for _, compare in pairs}
+    return (pairs, [name for name in base_sheets if name not in paired_base],
+            [name for name in compare_sheets if name not in paired_compare])
+
+
+def init_sheet_worker(base_path, compare_path):
+    """Инициализация процесса пула: обе книги открываются для чтения один раз"""
+    global _worker_readers
+    _worker_readers = (WorkbookReader(base_path), WorkbookReader(compare_path))
+
+
+def compare_sheet_pair(base_path, compare_path, base_sheet, compare_sheet, month, year,
+                       cache=None, cancel_token=None, readers=None):
+    """Сравнение пары листов (выполняется в процессе пула или в основном процессе).
+
+    readers - открытые книги (базовая и сравнения), общие для всех пар
+    листов; в процессе пула - книги, открытые при его запуске. Возвращает
+    данные отчета, ячейки для подсветки и счетчики объема работы.
+    """
+    pipeline = ComparisonPipeline(base_path, compare_path, month, year, cache=cache,
+                                  cancel_token=cancel_token, base_sheet=base_sheet,
+                                  compare_sheet=compare_sheet)
+    readers = readers or _worker_readers
+    if readers is not None:
+        pipeline.base_source.reader, pipeline.compare_source.reader = readers
+    try:
+        report_data, highlight_info = pipeline.compare_in_memory()
+    finally:
+        pipeline.base_source.close()
+        pipeline.compare_source.close()
+    return report_data, highlight_info, pipeline.profiler.counters
+
+
+class SheetComparisonPipeline(ComparisonPipeline):
+    """Сравнение всех сопоставленных листов двух книг и общий отчет"""
+
+    def __init__(self, file1_path, file2_path, month, year, sheet_map=None, cache=None,
+                 on_progress=None, on_message=None, cancel_token=None, profile_memory=False,
+                 highlight_copies=False, highlight=True, workers=None, history=None,
+                 highlight_base=True):
+        super().__init__(file1_path, file2_path, month, year, standalone_report=True,
+                         cache=cache, on_progress=on_progress, on_message=on_message,
+                         cancel_token=cancel_token, profile_memory=profile_memory,
+                         highlight_copies=highlight_copies, highlight=highlight,
+                         parallel_highlight=False if workers == 1 else None,
+                         history=history, highlight_base=highlight_base)
+        self.sheet_map = dict(sheet_map or {})  # Явное соответствие листов
+        self.workers = workers  # Количество процессов пула (None - по числу ядер)
+        self.sheet_results = []  # Итоги по парам листов
+
+    def run(self):
+        """Сравнение всех пар листов, возвращает путь к отчету"""
+        profiler = self.profiler
+        profiler.start()
+        try:
+            # Книги открываются для чтения один раз на все пары листов и
+            # закрываются до подсветки
+            readers = []
+            try:
+                with profiler.stage('pair_sheets'):
+                    for path in (self.file1_path, self.file2_path):
+                        readers.append(WorkbookReader(path))
+                    pairs, base_only, compare_only = pair_sheets(
+                        readers[0].sheet_names(), readers[1].sheet_names(), self.sheet_map)
+                if not pairs:
+                    raise ValueError("В файлах нет листов с совпадающими названиями")
+                self.log(f"Сопоставлено листов: {len(pairs)}")
+                self.report_progress(10)
+                profiler.count('sheet_pairs', len(pairs))
+
+                with profiler.stage('compare_sheets'):
+                    results = self.compare_sheets(pairs, readers)
+            finally:
+                for reader in readers:
+                    reader.close()
+            self.report_progress(80)
+            for name in ('rows_base', 'rows_compare', 'rows_merged', 'cells_compared'):
+                profiler.count(name, sum(result['counters'].get(name, 0)
+                                         for result in results))
+
+            report_data = self.summarize(results, base_only, compare_only)
+            self.report_data = report_data
+            output_path = self.generate_sheets_report(report_data, results)
+            self.record_history([{
+                'base_file': self.file1_path, 'compare_file': self.file2_path,
+                'base_sheet': result['base_sheet'], 'compare_sheet': result['compare_sheet'],
+                'month': result['month'], 'year': result['year'],
+                'report_data': result['report_data'], 'report_path': output_path}
+                for result in results if not result['error']])
+        finally:
+            profiler.stop()
+            self.base_source.close()
+            self.compare_source.close()
+
+        self.write_profile(output_path, base_file=self.file1_path,
+                           compare_file=self.file2_path, sheet_results=self.sheet_results,
+                           report_counts=self.report_counts)
+        return output_path
+
+    def use_pool(self, tasks):
+        """Нужен ли пул процессов для сравнения пар листов"""
+        if tasks < 2 or (self.workers is not None and self.workers < 2):
+            return False
+        total_size = os.path.getsize(self.file1_path) + os.path.getsize(self.file2_path)
+        return total_size >= PARALLEL_MIN_BYTES
+
+    def compare_sheets(self, pairs, readers):
+        """Сравнение пар листов: параллельно в пуле процессов или по очереди.
+
+        readers - открытые книги для сравнения по очереди (процессы пула
+        открывают книги сами, по одному разу). Ошибка в одной паре
+        (например, лист без нужных колонок) не прерывает сравнение
+        остальных и попадает в сводку.
+        """
+        tasks = []
+        for base_sheet, compare_sheet in pairs:
+            # Период по названию листа базовой книги, затем книги сравнения
+            month, year = sheet_period(base_sheet,
+                                       *sheet_period(compare_sheet, self.month, self.year))
+            tasks.append({'base_sheet': base_sheet, 'compare_sheet': compare_sheet,
+                          'month': month, 'year': year, 'report_data': None,
+                          'highlight_info': None, 'counters': {}, 'error': None})
+        total = len(tasks)
+
+        if not self.use_pool(total):
+            for idx, task in enumerate(tasks):
+                self.log(f"Сравнение листа {task['base_sheet']}...")
+                try:
+                    self.store_result(task, compare_sheet_pair(
+                        self.file1_path, self.file2_path, task['base_sheet'],
+                        task['compare_sheet'], task['month'], task['year'],
+                        self.cache, self.cancel_token, readers))
+                except ComparisonCancelled:
+                    raise
+                except Exception as e:
+                    self.store_error(task, e)
+                self.report_progress(int(10 + 70 * (idx + 1) / total))
+            return tasks
+
+        self.log("Параллельное сравнение листов...")
+        executor = ProcessPoolExecutor(
+            max_workers=max(1, min(self.workers or os.cpu_count() or 1, total)),
+            mp_context=multiprocessing.get_context('spawn'), initializer=init_sheet_worker,
+            initargs=(self.file1_path, self.file2_path))
+        try:
+            pending = {executor.submit(compare_sheet_pair, self.file1_path, self.file2_path,
+                                       task['base_sheet'], task['compare_sheet'],
+                                       task['month'], task['year'], self.cache): task
+                       for task in tasks}
+            while pending:
+                self.cancel_token.check()
+                done, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = pending.pop(future)
+                    try:
+                        self.store_result(task, future.result())
+                    except Exception as e:
+                        self.store_error(task, e)
+                    self.report_progress(int(10 + 70 * (total - len(pending)) / total))
+            # Процессы пула держат книги открытыми: они завершаются до подсветки
+            executor.shutdown()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return tasks
+
+    def store_result(self, task, result):
+        """Сохранение результата сравнения пары листов"""
+        task['report_data'], task['highlight_info'], task['counters'] = result
+
+    def store_error(self, task, error):
+        """Сохранение ошибки сравнения пары листов"""
+        task['error'] = str(error)
+        self.log(f"Лист {task['base_sheet']}: {task['error']}")
+
+    def summarize(self, results, base_only, compare_only):
+        """Сводка по листам с общим итогом и различия по категориям с указанием листа"""
+        if all(result['error'] for result in results):
+            raise ValueError(f"Не удалось сравнить ни одну пару листов: "
+                             f"{results[0]['error']}")
+
+        report_data = {'summary': [], 'vv': [], 'dp': [], 'other': [], 'missing': []}
+        totals = [0] * 5
+        for result in results:
+            sheets = [result['base_sheet'], result['compare_sheet'],
+                      f"{result['month']:02d}.{result['year']}"]
+            if result['error']:
+                report_data['summary'].append(sheets + [''] * 5 + [result['error']])
+                continue
+
+            data = result['report_data']
+            for key in ('vv', 'dp', 'other', 'missing'):
+                report_data[key].extend([result['base_sheet']] + row for row in data[key])
+            missing_in_base = sum(1 for row in data['missing']
+                                  if row[2] == "Отсутствует в БАЗОВОМ файле")
+            counts = [len(data['vv']), len(data['dp']), len(data['other']),
+                      missing_in_base, len(data['missing']) - missing_in_base]
+            report_data['summary'].append(sheets + counts + [''])
+            totals = [total + count for total, count in zip(totals, counts)]
+            self.sheet_results.append({'base_sheet': result['base_sheet'],
+                                       'compare_sheet': result['compare_sheet'],
+                                       'vv': counts[0], 'dp': counts[1], 'other': counts[2],
+                                       'missing': counts[3] + counts[4]})
+
+        # Листы без пары и общий итог
+        report_data['summary'].extend([name, '', ''] + [''] * 5 + [NO_COMPARE_SHEET]
+                                      for name in base_only)
+        report_data['summary'].extend(['', name, ''] + [''] * 5 + [NO_BASE_SHEET]
+                                      for name in compare_only)
+        report_data['summary'].append(['Итого', '', ''] + totals + [''])
+
+        self.report_counts = {'vv': totals[0], 'dp': totals[1], 'other': totals[2],
+                              'missing': totals[3] + totals[4]}
+        return report_data
+
+    def generate_sheets_report(self, report_data, results):
+        """Подсветка листов обеих книг и запись общего отчета"""
+        self.log("Формирование отчетов...")
+        compared = [result for result in results if not result['error']]
+        cells = {'base': {}, 'compare': {}}  # Ячейки для подсветки по листам
+        if self.highlight:
+            for result in compared:
+                for side, sheet in (('base', result['base_sheet']),
+                                    ('compare', result['compare_sheet'])):
+                    if result['highlight_info'][side] and (side == 'compare'
+                                                           or self.highlight_base):
+                        cells[side][sheet] = result['highlight_info'][side]
+        writes = PendingWrites()
+        helper = None
+        try:
+            with self.profiler.stage('highlight'):
+                # Книга сравнения - в отдельном процессе параллельно с базовой
+                if self.use_parallel_highlight(cells):
+                    target = writes.reserve(self.highlight_target(self.file2_path))
+                    pool = multiprocessing.get_context('spawn').Pool(1)
+                    helper = pool, pool.apply_async(
+                        highlight_sheets, (self.file2_path, cells['compare'], target))
+                    pool.close()
+                self.highlight_book(self.base_source, cells['base'], writes)
+                if helper is None:
+                    self.highlight_book(self.compare_source, cells['compare'], writes)
+                else:
+                    self.wait_parallel_highlight(*helper)
+            self.report_progress(95)
+            self.profiler.count('cells_highlighted', sum(
+                len(sheet_cells) for side in cells.values() for sheet_cells in side.values()))
+
+            with self.profiler.stage('summary'):
+                summary = summary_blocks(report_data)
+            with self.profiler.stage('report'):
+                output_path = self.create_sheets_report_file(report_data, writes, summary)
+                self.cancel_token.check()
+                writes.commit()
+            self.profiler.count('report_rows', sum(len(rows) for rows in report_data.values()))
+        except ComparisonCancelled:
+            raise
+        except Exception as e:
+            raise ValueError(f"Ошибка создания отчетов: {str(e)}")
+        finally:
+            if helper is not None:
+                helper[0].terminate()
+            writes.discard()
+
+        # Подсветка не меняет значения ячеек: кэш всех листов книги остается действительным
+        if self.cache is not None and not self.highlight_copies:
+            for side, path, key in (('base', self.file1_path, 'base_sheet'),
+                                    ('compare', self.file2_path, 'compare_sheet')):
+                if cells[side]:
+                    for result in compared:
+                        self.cache.relink(path, REQUIRED_COLUMNS, result[key])
+
+        self.report_progress(100)
+        return output_path
+
+    def highlight_book(self, source, cells_by_sheet, writes):
+        """Подсветка листов книги за одну загрузку и сохранение"""
+        if not cells_by_sheet:
+            return
+        wb = source.workbook
+        for sheet, cells in cells_by_sheet.items():
+            self.cancel_token.check()
+            apply_highlight(wb[sheet], cells, self.cancel_token)
+        writes.save(wb, self.highlight_target(source.file_path))
+
+    def create_sheets_report_file(self, report_data, writes, summary=None):
+        """Запись общего отчета по всем листам в отдельную книгу"""
+        output_dir = os.path.dirname(self.file1_path)
+        base_name = os.path.splitext(os.path.basename(self.file1_path))[0]
+        output_path = os.path.join(output_dir, f"Сравнение_листов_{base_name}.xlsx")
+
+        diff_columns = ['Лист', 'ID', 'ФИО', 'Дата', 'Базовый файл', 'Файл сравнения']
+        sheets_config = {
+            'Сводка': {
+                'data': report_data['summary'],
+                'color': '000000',  # Черный
+                'columns': ['Лист базового файла', 'Лист файла сравнения', 'Период',
+                            'ВВ', 'ДП', 'Прочие', 'Отсутствуют в базовом',
+                            'Отсутствуют в сравнении', 'Примечание'],
+            },
+        }
+        if summary is not None:
+            # Итоги по всем листам (таблицы одна под другой)
+            sheets_config['Итоги'] = {'blocks': summary, 'color': '000000'}
+        sheets_config.update({
+            'ВВ': {
+                'data': report_data['vv'],
+                'color': 'FF0000',  # Красный
+                'columns': diff_columns,
+            },
+            'ДП': {
+                'data': report_data['dp'],
+                'color': '0000FF',  # Синий
+                'columns': diff_columns,
+            },
+            'Остальные': {
+                'data': report_data['other'],
+                'color': '008000',  # Зеленый
+                'columns': diff_columns,
+            },
+            'Отсутствующие': {
+                'data': report_data['missing'],
+                'color': 'FFA500',  # Оранжевый
+                'columns': ['Лист', 'ID', 'ФИО', 'Статус'],
+            },
+        })
+        self.write_standalone_report(output_path, sheets_config, writes)
+        return output_path
@@ -0,0 +1,877 @@
+"""
+КОНВЕЙЕР СРАВНЕНИЯ EXCEL-ТАБЕЛЕЙ
+Автор: VaSeBa
+
+Логика сравнения без зависимости от PyQt6: загрузка, проверка,
+объединение, поиск различий и формирование отчетов. Используется
+графическим интерфейсом (main.py) и командной строкой (cli.py).
+"""
+
+import multiprocessing
+import os
+import tempfile
+from itertools import chain
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+from codes import CodeDictionary
+from highlight import apply_highlight, highlight_sheets
+from loader import WorkbookSource
+from profiling import StageProfiler
+from progress import (CANCEL_CHECK_INTERVAL, CancelToken, ComparisonCancelled,
+                      PendingWrites, ProgressThrottle)
+from snapshot import (FINGERPRINT_COLUMNS, assemble_results, changed_ids, group_rows,
+                      highlight_is_current, highlight_record, row_fingerprints,
+                      split_results)
+from sortmerge import (iter_sorted_rows, merge_join, reduce_runs, run_block_rows,
+                       write_sorted_runs)
+from summary import summary_blocks, write_summary_sheet
+
+# Количество строк, сравниваемых за один векторизованный проход
+DIFF_CHUNK_ROWS = 10000
+
+# Суммарный размер файлов, начиная с которого их обработка (подсветка файла
+# сравнения, загрузка и подсветка редакций, сравнение листов) выполняется
+# в отдельных процессах (для небольших файлов запуск процесса дороже)
+PARALLEL_MIN_BYTES = 2 * 1024 * 1024
+
+# Суффикс имени подсвеченной копии исходного файла
+HIGHLIGHT_COPY_SUFFIX = '_подсветка'
+
+# Колонки дней табеля (1-31)
+DAY_COLUMNS = [str(i) for i in range(1, 32)]
+
+# Колонки табеля, необходимые для сравнения (остальные не загружаются)
+REQUIRED_COLUMNS = ['id', 'ФИО', 'должность'] + DAY_COLUMNS
+
+
+class ComparisonPipeline:
+    """Сравнение пары табелей: базового файла и файла сравнения"""
+
+    def __init__(self, file1_path, file2_path, month, year, standalone_report=False,
+                 cache=None, on_progress=None, on_message=None, cancel_token=None,
+                 profile_memory=False, highlight_copies=False, parallel_highlight=None,
+                 chunk_rows=None, highlight=True, snapshots=None, base_sheet=None,
+                 compare_sheet=None, history=None, highlight_base=True):
+        # Инициализация параметров
+        self.file1_path = file1_path  # Путь к первому файлу
+        self.file2_path = file2_path  # Путь ко второму файлу
+        self.month = month  # Выбранный месяц
+        self.year = year  # Выбранный год
+        # Сравнение по частям не загружает книги целиком: отчет записывается
+        # отдельным файлом, исходные книги не подсвечиваются
+        self.standalone_report = standalone_report or bool(chunk_rows)  # Отчет отдельным файлом
+        self.cache = cache  # Кэш разобранных табелей (необязательный)
+        self.highlight = highlight and not chunk_rows  # Подсветка различий в исходных книгах
+        self.highlight_base = highlight_base  # Подсветка и базовой книги, а не только файла сравнения
+        self.highlight_copies = highlight_copies  # Подсветка в копиях, а не в исходных файлах
+        self.parallel_highlight = parallel_highlight  # Подсветка в отдельном процессе (None - авто)
+        self.progress = ProgressThrottle(on_progress)  # Прогресс с ограничением частоты
+        self.on_message = on_message  # Обработчик сообщений в лог
+        self.cancel_token = cancel_token or CancelToken()  # Признак отмены
+        self.chunk_rows = chunk_rows  # Размер части при сравнении по частям (None - в памяти)
+        # Снимки для повторного сравнения (не используются при сравнении по частям)
+        self.snapshots = None if chunk_rows else snapshots
+        self.snapshot = None  # Снимок текущего сравнения (сохраняется после отчета)
+        self.fingerprints = {}  # Отпечатки строк загруженных табелей по пути файла
+        self.history = history  # База истории расхождений (необязательная)
+        self.report_counts = {}  # Количество записей по листам отчета
+        self.report_data = None  # Различия последнего сравнения (для просмотра в приложении)
+        self.profiler = StageProfiler(trace_memory=profile_memory)  # Показатели этапов
+        self.profile_path = None  # Путь к JSON-профилю последнего запуска
+        self.codes = CodeDictionary()  # Словарь отметок, общий для обоих файлов
+        # Книги разбираются один раз и используются всеми этапами
+        # (base_sheet и compare_sheet - листы табелей, None - первые листы)
+        self.base_source = WorkbookSource(file1_path, sheet=base_sheet)
+        self.compare_source = WorkbookSource(file2_path, sheet=compare_sheet)
+
+    def run(self):
+        """Выполнение всех этапов сравнения, возвращает путь к отчету"""
+        profiler = self.profiler
+        profiler.start()
+        try:
+            self.log("Инициализация процесса сравнения...")
+
+            # Поиск различий в памяти или по частям с использованием диска
+            if self.chunk_rows:
+                report_data, highlight_info = self.compare_chunked()
+            else:
+                report_data, highlight_info = self.compare_in_memory()
+            self.report_data = report_data
+            self.report_counts = {key: len(rows) for key, rows in report_data.items()}
+
+            # Генерация итогового отчета
+            output_path = self.generate_report(report_data, highlight_info)
+            self.record_history([{
+                'base_file': self.file1_path, 'compare_file': self.file2_path,
+                'base_sheet': self.base_source.sheet, 'compare_sheet': self.compare_source.sheet,
+                'month': self.month, 'year': self.year, 'report_data': report_data,
+                'report_path': output_path}])
+        finally:
+            profiler.stop()
+            self.base_source.close()
+            self.compare_source.close()
+
+        self.write_profile(output_path, base_file=self.file1_path,
+                           compare_file=self.file2_path, report_counts=self.report_counts)
+        return output_path
+
+    def record_history(self, runs):
+        """Сохранение расхождений в базу истории (ошибка не прерывает сравнение)"""
+        if self.history is None:
+            return
+        with self.profiler.stage('history'):
+            try:
+                self.history.record_runs(runs)
+            except Exception as e:
+                self.log(f"Не удалось сохранить историю: {str(e)}")
+
+    def write_profile(self, output_path, **extra):
+        """Сводка профиля в лог и JSON-профиль рядом с отчетом"""
+        for line in self.profiler.summary_lines():
+            self.log(line)
+        self.profile_path = os.path.splitext(output_path)[0] + '.profile.json'
+        try:
+            self.profiler.write_json(self.profile_path, **extra)
+        except OSError as e:
+            self.log(f"Не удалось сохранить профиль: {str(e)}")
+            self.profile_path = None
+
+    def compare_in_memory(self):
+        """Сравнение табелей, целиком загруженных в память"""
+        profiler = self.profiler
+
+        # Загрузка данных из файлов
+        with profiler.stage('load_base'):
+            df1 = self.load_data(self.base_source)
+        self.report_progress(10)
+        with profiler.stage('load_compare'):
+            df2 = self.load_data(self.compare_source)
+        self.report_progress(20)
+        profiler.count('rows_base', len(df1))
+        profiler.count('rows_compare', len(df2))
+
+        # Проверка структуры данных
+        with profiler.stage('validate'):
+            self.validate_data(df1, df2)
+
+        # Объединение данных и обработка различий
+        with profiler.stage('merge'):
+            merged_df = self.merge_dataframes(df1, df2)
+        profiler.count('rows_merged', len(merged_df))
+        with profiler.stage('diff'):
+            if self.snapshots is None:
+                report_data, highlight_info = self.process_differences(merged_df)
+                compared = len(merged_df)
+            else:
+                report_data, highlight_info, compared = self.process_incremental(
+                    df1, df2, merged_df)
+        profiler.count('cells_compared', compared * 31)
+        return report_data, highlight_info
+
+    def compare_chunked(self):
+        """Сравнение по частям: внешняя сортировка по id и совместный проход.
+
+        В памяти одновременно находится не более одной части каждого файла;
+        объем результатов (различия, ячейки для подсветки) зависит только
+        от количества различий. Части сливаются с ограниченным числом
+        одновременно открытых файлов (при необходимости - в несколько
+        проходов).
+        """
+        profiler = self.profiler
+        self.log("Сравнение по частям: отчет отдельным файлом, без подсветки исходных файлов")
+        # Потоковое чтение openpyxl: calamine разбирает лист в памяти целиком
+        self.base_source.engine = 'openpyxl'
+        self.compare_source.engine = 'openpyxl'
+
+        with tempfile.TemporaryDirectory(prefix='timekeeper_merge_') as run_dir:
+            with profiler.stage('load_base'):
+                base_runs, base_total = self.spill_sorted_runs(
+                    self.base_source, run_dir, 'base', 'первом')
+            self.report_progress(10)
+            with profiler.stage('load_compare'):
+                compare_runs, compare_total = self.spill_sorted_runs(
+                    self.compare_source, run_dir, 'compare', 'втором')
+            self.report_progress(20)
+            profiler.count('rows_base', base_total)
+            profiler.count('rows_compare', compare_total)
+            profiler.count('spill_runs', len(base_runs) + len(compare_runs))
+
+            with profiler.stage('merge_runs'):
+                base_runs, base_passes = reduce_runs(
+                    base_runs, run_dir, 'base', self.run_block_rows(),
+                    cancel_token=self.cancel_token)
+                compare_runs, compare_passes = reduce_runs(
+                    compare_runs, run_dir, 'compare', self.run_block_rows(),
+                    cancel_token=self.cancel_token)
+            profiler.count('merge_passes', max(base_passes, compare_passes))
+
+            with profiler.stage('sort_merge'):
+                report_data, highlight_info, merged = self.merge_sorted_runs(
+                    base_runs, compare_runs, base_total)
+        profiler.count('rows_merged', merged)
+        profiler.count('cells_compared', merged * 31)
+        return report_data, highlight_info
+
+    def spill_sorted_runs(self, source, run_dir, prefix, num):
+        """Чтение файла по частям в отсортированные по id временные части.
+
+        Состав колонок проверяется по первой части, до записи на диск.
+        """
+        self.log(f"Загрузка {os.path.basename(source.file_path)} по частям...")
+        try:
+            chunks = source.iter_column_chunks(REQUIRED_COLUMNS, self.chunk_rows,
+                                               self.cancel_token)
+            first = next(chunks)  # Строка заголовков и первая часть
+            missing = set(REQUIRED_COLUMNS) - set(first.columns)
+            if not missing:
+                return write_sorted_runs(chain([first], chunks), self.codes, DAY_COLUMNS,
+                                         run_dir, prefix, self.cancel_token,
+                                         self.run_block_rows())
+        except ComparisonCancelled:
+            raise
+        except Exception as e:
+            raise ValueError(f"Ошибка чтения файла {source.file_path}: {str(e)}")
+        raise ValueError(f"В {num} файле отсутствуют колонки: {', '.join(missing)}")
+
+    def run_block_rows(self):
+        """Размер блока временных частей (блоки сливаемых частей - не больше части)"""
+        return run_block_rows(self.chunk_rows)
+
+    def merge_sorted_runs(self, base_runs, compare_runs, base_total):
+        """Совместный проход отсортированных частей с поиском различий блоками"""
+        self.log("Сопоставление и поиск различий по частям...")
+        report_data = {'vv': [], 'dp': [], 'other': []}  # Различия по категориям
+        highlight_info = {'base': [], 'compare': []}  # Ячейки для подсветки
+        missing_in_base = []  # (id, ФИО) отсутствующих в базовом файле
+        missing_in_compare = []  # (id, ФИО) отсутствующих в файле сравнения
+        context = self.diff_context()
+        block_rows = min(self.chunk_rows, DIFF_CHUNK_ROWS)
+        pairs = []  # Сопоставленные строки текущего блока
+        merged = 0  # Всего сопоставленных строк
+        base_seen = 0  # Пройдено строк базового файла (для прогресса)
+        last_base = None
+
+        events = merge_join(iter_sorted_rows(base_runs), iter_sorted_rows(compare_runs))
+        for count, event in enumerate(events):
+            if count % CANCEL_CHECK_INTERVAL == 0:
+                self.cancel_token.check()  # Проверка запроса на прерывание
+                if base_total:
+                    self.report_progress(int(20 + 70 * min(base_seen, base_total) / base_total))
+
+            kind, row = event[0], event[1]
+            if kind == 'compare_only':
+                missing_in_base.append((row[0], row[2]))
+                continue
+            if row is not last_base:
+                base_seen += 1
+                last_base = row
+            if kind == 'base_only':
+                missing_in_compare.append((row[0], row[2]))
+                continue
+
+            pairs.append(event[1:])
+            if len(pairs) >= block_rows:
+                self.diff_pairs(context, report_data, highlight_info, pairs)
+                merged += len(pairs)
+                pairs = []
+
+        if pairs:
+            self.diff_pairs(context, report_data, highlight_info, pairs)
+            merged += len(pairs)
+        self.report_progress(90)
+
+        report_data['missing'] = missing_records(missing_in_base, missing_in_compare)
+        return report_data, highlight_info, merged
+
+    def diff_pairs(self, context, report_data, highlight_info, pairs):
+        """Поиск различий в списке пар строк (строка базового файла, строка сравнения)"""
+        self.diff_block(
+            context, report_data, highlight_info,
+            ids=np.array([base[0] for base, _ in pairs], dtype=object),
+            names=np.array([base[2] for base, _ in pairs], dtype=object),
+            base_block=np.stack([base[3] for base, _ in pairs]),
+            compare_block=np.stack([compare[3] for _, compare in pairs]),
+            base_positions=np.array([base[1] for base, _ in pairs], dtype=np.int64),
+            compare_positions=np.array([compare[1] for _, compare in pairs], dtype=np.int64))
+
+    def stop(self):
+        """Запрос на остановку обработки"""
+        self.cancel_token.cancel()
+
+    def log(self, message):
+        """Передача сообщения обработчику лога"""
+        if self.on_message is not None:
+            self.on_message(message)
+
+    def report_progress(self, value):
+        """Передача значения прогресса обработчику (не чаще заданного интервала)"""
+        self.progress.update(value)
+
+    def load_data(self, source):
+        """Загрузка данных из Excel-файла"""
+        file_path = source.file_path
+        self.log(f"Загрузка {os.path.basename(file_path)}...")
+        try:
+            df, from_cache = read_timesheet(source, self.cache, self.cancel_token)
+            if from_cache:
+                self.log(f"{os.path.basename(file_path)}: данные взяты из кэша")
+            # Отпечатки строк считаются до кодирования отметок
+            if self.snapshots is not None and set(FINGERPRINT_COLUMNS) <= set(df.columns):
+                self.fingerprints[file_path] = row_fingerprints(df)
+            return self.encode_days(df)
+        except ComparisonCancelled:
+            raise
+        except Exception as e:
+            raise ValueError(f"Ошибка чтения файла {file_path}: {str(e)}")
+
+    def encode_days(self, df):
+        """Замена строковых колонок дней номерами отметок из общего словаря"""
+        day_columns = [day for day in DAY_COLUMNS if day in df.columns]
+        if day_columns:
+            df[day_columns] = self.codes.encode(df[day_columns].to_numpy(dtype=object))
+        return df
+
+    def validate_data(self, df1, df2):
+        """Проверка структуры данных в файлах"""
+        self.validate_columns(df1.columns, df2.columns)
+
+    def validate_columns(self, columns1, columns2):
+        """Проверка наличия необходимых колонок в обоих файлах"""
+        required_columns = set(REQUIRED_COLUMNS)
+
+        for columns, num in zip([columns1, columns2], ['первом', 'втором']):
+            missing = required_columns - set(columns)
+            if missing:
+                raise ValueError(
+                    f"В {num} файле отсутствуют колонки: {', '.join(missing)}")
+
+    def merge_dataframes(self, df1, df2):
+        """Объединение данных из двух DataFrame"""
+        self.log("Сопоставление данных...")
+        self.cancel_token.check()
+        # Добавление индексов для отслеживания позиций
+        df1['original_index'] = df1.index
+        df2['original_index'] = df2.index
+
+        # Внешнее объединение по полю id
+        merged = pd.merge(
+            df1, df2,
+            on='id',
+            suffixes=('_base', '_compare'),
+            how='outer',
+            indicator=True)
+
+        # Сохранение отсутствующих записей
+        self.missing_in_base = merged[merged['_merge'] == 'right_only'][['id', 'ФИО_compare']]
+        self.missing_in_compare = merged[merged['_merge'] == 'left_only'][['id', 'ФИО_base']]
+
+        # Внешнее объединение приводит числовые колонки к float: возврат к номерам отметок
+        both = merged[merged['_merge'] == 'both']
+        code_dtype = self.codes.dtype
+        return both.astype({f'{day}_{side}': code_dtype
+                            for day in DAY_COLUMNS for side in ('base', 'compare')})
+
+    def process_differences(self, merged_df):
+        """Обработка и классификация расхождений.
+
+        Сравнение выполняется по блокам строк: колонки дней базового файла
+        и файла сравнения берутся целиком как матрицы номеров отметок общего
+        словаря и сравниваются за один проход средствами NumPy.
+        """
+        self.log("Поиск различий...")
+        report_data = {'vv': [], 'dp': [], 'other': []}  # Различия по категориям
+        highlight_info = {'base': [], 'compare': []}  # Ячейки для подсветки
+        total_rows = len(merged_df)
+        base_columns = [f'{day}_base' for day in DAY_COLUMNS]
+        compare_columns = [f'{day}_compare' for day in DAY_COLUMNS]
+        context = self.diff_context()
+
+        for start in range(0, total_rows, DIFF_CHUNK_ROWS):
+            self.cancel_token.check()  # Проверка запроса на прерывание
+
+            chunk = merged_df.iloc[start:start + DIFF_CHUNK_ROWS]
+            self.diff_block(
+                context, report_data, highlight_info,
+                ids=chunk['id'].to_numpy(dtype=object),
+                names=chunk['ФИО_base'].to_numpy(dtype=object),
+                base_block=chunk[base_columns].to_numpy(),
+                compare_block=chunk[compare_columns].to_numpy(),
+                base_positions=chunk['original_index_base'].to_numpy(dtype=np.int64),
+                compare_positions=chunk['original_index_compare'].to_numpy(dtype=np.int64))
+
+            # Обновление прогресса выполнения
+            done = min(start + DIFF_CHUNK_ROWS, total_rows)
+            progress = int(20 + 70 * done / total_rows)
+            self.report_progress(progress)
+
+        # Обработка отсутствующих записей
+        report_data['missing'] = missing_records(
+            zip(self.missing_in_base['id'].tolist(),
+                self.missing_in_base['ФИО_compare'].tolist()),
+            zip(self.missing_in_compare['id'].tolist(),
+                self.missing_in_compare['ФИО_base'].tolist()))
+        return report_data, highlight_info
+
+    def process_incremental(self, df1, df2, merged_df):
+        """Поиск различий с использованием снимка предыдущего сравнения.
+
+        Заново сравниваются только сотрудники, у которых изменился отпечаток
+        строк хотя бы в одном из файлов, различия остальных переносятся из
+        снимка. Возвращает данные отчета, ячейки для подсветки и количество
+        сравненных строк.
+        """
+        base_groups, base_positions = group_rows(
+            df1['id'].tolist(), self.fingerprints.pop(self.file1_path).tolist())
+        compare_groups, compare_positions = group_rows(
+            df2['id'].tolist(), self.fingerprints.pop(self.file2_path).tolist())
+        ids = list(dict.fromkeys(merged_df['id'].tolist()))  # Сопоставленные id по порядку
+        layout = self.column_layout()
+
+        # Снимок действителен только при том же расположении колонок дней
+        snapshot = self.snapshots.load(self.file1_path, self.month, self.year)
+        if snapshot is not None and snapshot['layout'] != layout:
+            self.log("Расположение колонок изменилось: полное сравнение")
+            snapshot = None
+
+        if snapshot is None:
+            report_data, highlight_info = self.process_differences(merged_df)
+            results = split_results(report_data, highlight_info,
+                                    base_positions, compare_positions)
+            compared = len(merged_df)
+        else:
+            changed = changed_ids(ids, snapshot, base_groups, compare_groups)
+            self.log(f"Повторное сравнение: изменились записи {len(changed)} "
+                     f"из {len(ids)} сотрудников")
+            subset = merged_df[merged_df['id'].isin(changed)]
+            partial, partial_highlight = self.process_differences(subset)
+            results = split_results(partial, partial_highlight,
+                                    base_positions, compare_positions)
+            # Перенос различий неизменившихся сотрудников из снимка
+            for emp_id in ids:
+                if emp_id not in changed and emp_id in snapshot['results']:
+                    results[emp_id] = snapshot['results'][emp_id]
+            report_data, highlight_info = assemble_results(
+                ids, results, base_positions, compare_positions)
+            report_data['missing'] = partial['missing']
+            compared = len(subset)
+        self.profiler.count('rows_rediffed', compared)
+
+        self.snapshot = {
+            'layout': layout,
+            'base_groups': base_groups,
+            'compare_groups': compare_groups,
+            'results': results,
+            'highlight': snapshot['highlight'] if snapshot is not None else {},
+        }
+        return report_data, highlight_info, compared
+
+    def column_layout(self):
+        """Номера колонок дней в обоих файлах (от них зависят ячейки подсветки)"""
+        base_index = self.base_source.column_index()
+        compare_index = self.compare_source.column_index()
+        return ([base_index[day] for day in DAY_COLUMNS],
+                [compare_index[day] for day in DAY_COLUMNS])
+
+    def diff_context(self, compare_source=None):
+        """Общие данные для сравнения блоков строк (по умолчанию - с файлом сравнения)"""
+        base_index = self.base_source.column_index()
+        compare_index = (compare_source or self.compare_source).column_index()
+        return {
+            # Даты для отчета
+            'dates': np.array(
+                [f"{int(day):02d}.{self.month:02d}.{self.year}" for day in DAY_COLUMNS],
+                dtype=object),
+            # Номера колонок дней в исходных листах для подсветки
+            'base_cols': np.array([base_index[day] for day in DAY_COLUMNS]),
+            'compare_cols': np.array([compare_index[day] for day in DAY_COLUMNS]),
+            # Строки отметок по номерам и номера отметок ВВ/ДП (-1, если не встречались)
+            'code_strings': np.array(self.codes.codes, dtype=object),
+            'vv_id': self.codes.id_of('ВВ'),
+            'dp_id': self.codes.id_of('ДП'),
+        }
+
+    def diff_block(self, context, report_data, highlight_info, ids, names,
+                   base_block, compare_block, base_positions, compare_positions):
+        """Поиск и классификация различий в блоке сопоставленных строк.
+
+        base_block и compare_block - матрицы номеров отметок (строки x дни),
+        base_positions и compare_positions - номера строк данных в исходных
+        листах (с 0). Возвращает координаты различий (номера строк блока и
+        номера дней).
+        """
+        # Координаты различий в порядке "строка, затем день"
+        rows, days = np.nonzero(base_block != compare_block)
+        if not len(rows):
+            return rows, days
+        base_ids = base_block[rows, days]
+        compare_ids = compare_block[rows, days]
+
+        # Маски категорий: ВВ имеет приоритет над ДП
+        vv_id, dp_id = context['vv_id'], context['dp_id']
+        vv_mask = (base_ids == vv_id) | (compare_ids == vv_id)
+        dp_mask = ~vv_mask & ((base_ids == dp_id) | (compare_ids == dp_id))
+        other_mask = ~(vv_mask | dp_mask)
+
+        # Формирование записей для отчета
+        code_strings = context['code_strings']
+        entries = np.empty((len(rows), 5), dtype=object)
+        entries[:, 0] = ids[rows]
+        entries[:, 1] = names[rows]
+        entries[:, 2] = context['dates'][days]
+        entries[:, 3] = code_strings[base_ids]
+        entries[:, 4] = code_strings[compare_ids]
+
+        report_data['vv'].extend(entries[vv_mask].tolist())
+        report_data['dp'].extend(entries[dp_mask].tolist())
+        report_data['other'].extend(entries[other_mask].tolist())
+
+        # Сохранение позиций для подсветки (+2 для Excel строк)
+        base_rows = base_positions[rows] + 2
+        compare_rows = compare_positions[rows] + 2
+        highlight_info['base'].extend(
+            zip(base_rows.tolist(), context['base_cols'][days].tolist()))
+        highlight_info['compare'].extend(
+            zip(compare_rows.tolist(), context['compare_cols'][days].tolist()))
+        return rows, days
+
+    def generate_report(self, report_data, highlight_info):
+        """Генерация итогового отчета"""
+        self.log("Формирование отчетов...")
+        all_cells = highlight_info  # Ячейки с различиями, включая уже подсвеченные
+        if not self.highlight:
+            # Исходные книги не загружаются и не изменяются
+            highlight_info = {'base': [], 'compare': []}
+        else:
+            if self.snapshot is not None:
+                highlight_info = self.skip_current_highlight(highlight_info)
+            if not self.highlight_base:
+                # Базовая книга не загружается и не изменяется
+                highlight_info = dict(highlight_info, base=[])
+        writes = PendingWrites()
+        helper = None
+        try:
+            # Подсветка различий в исходных файлах (файл сравнения - параллельно
+            # в отдельном процессе, если файлы достаточно большие)
+            with self.profiler.stage('highlight'):
+                if self.use_parallel_highlight(highlight_info):
+                    helper = self.start_parallel_highlight(highlight_info['compare'], writes)
+                self.highlight_differences(self.base_source, highlight_info['base'], writes)
+                self.report_progress(93)
+                if helper is None:
+                    self.highlight_differences(self.compare_source, highlight_info['compare'],
+                                               writes)
+                else:
+                    self.wait_parallel_highlight(*helper)
+            self.report_progress(96)
+            self.profiler.count('cells_highlighted',
+                                len(highlight_info['base']) + len(highlight_info['compare']))
+
+            # Итоги для руководства (подсчет кодов значений без циклов по строкам)
+            with self.profiler.stage('summary'):
+                summary = summary_blocks(report_data)
+
+            # Создание файла отчета
+            with self.profiler.stage('report'):
+                output_path = self.create_report_file(report_data, writes, summary)
+
+                # Файлы заменяются только после успешной записи всех копий
+                self.cancel_token.check()
+                writes.commit()
+            self.profiler.count('report_rows', sum(len(rows) for rows in report_data.values()))
+        except ComparisonCancelled:
+            raise
+        except Exception as e:
+            raise ValueError(f"Ошибка создания отчетов: {str(e)}")
+        finally:
+            if helper is not None:
+                helper[0].terminate()
+            writes.discard()
+
+        # Подсветка не меняет значения ячеек: кэш остается действительным
+        if self.cache is not None and not self.highlight_copies:
+            for source, cells in ((self.base_source, highlight_info['base']),
+                                  (self.compare_source, highlight_info['compare'])):
+                if cells:
+                    self.cache.relink(source.file_path, REQUIRED_COLUMNS, source.sheet)
+
+        if self.snapshot is not None:
+            self.save_snapshot(all_cells)
+        self.report_progress(100)
+        return output_path
+
+    def skip_current_highlight(self, highlight_info):
+        """Исключение файлов, уже подсвеченных теми же ячейками.
+
+        Книга не загружается и не сохраняется, если по снимку она была
+        подсвечена тем же набором ячеек и не менялась после этого.
+        """
+        records = self.snapshot['highlight']
+        result = dict(highlight_info)
+        for side, source_path in (('base', self.file1_path), ('compare', self.file2_path)):
+            # Отчет-копия базовой книги должен содержать подсветку, а исходный
+            # файл ее не содержит, если подсвечивается копия
+            if side == 'base' and self.highlight_copies and not self.standalone_report:
+                continue
+            cells = highlight_info[side]
+            if cells and highlight_is_current(records.get(side), source_path,
+                                              self.highlight_target(source_path), cells):
+                self.log(f"{os.path.basename(source_path)}: подсветка не изменилась")
+                result[side] = []
+        return result
+
+    def save_snapshot(self, all_cells):
+        """Сохранение снимка с состоянием подсвеченных файлов"""
+        records = dict(self.snapshot['highlight'])
+        try:
+            if self.highlight:
+                for side, source_path in (('base', self.file1_path),
+                                          ('compare', self.file2_path)):
+                    cells = all_cells[side]
+                    if cells and (side == 'compare' or self.highlight_base):
+                        records[side] = highlight_record(
+                            source_path, self.highlight_target(source_path), cells)
+                    else:
+                        records.pop(side, None)
+            self.snapshot['highlight'] = records
+            self.snapshots.save(self.file1_path, self.month, self.year, self.snapshot)
+        except Exception as e:
+            self.log(f"Не удалось сохранить снимок сравнения: {str(e)}")
+
+    def highlight_differences(self, source, cells, writes):
+        """Подсветка ячеек с различиями в файле"""
+        if not cells:
+            return
+        self.cancel_token.check()
+
+        # Использование уже загруженной книги
+        wb = source.workbook
+        apply_highlight(source.worksheet, cells, self.cancel_token)
+
+        # Сохранение изменений во временную копию
+        writes.save(wb, self.highlight_target(source.file_path))
+
+    def highlight_target(self, file_path):
+        """Файл для сохранения подсветки: исходный или его копия"""
+        if not self.highlight_copies:
+            return file_path
+        stem, ext = os.path.splitext(file_path)
+        return f"{stem}{HIGHLIGHT_COPY_SUFFIX}{ext}"
+
+    def use_parallel_highlight(self, highlight_info):
+        """Нужно ли подсвечивать файл сравнения в отдельном процессе"""
+        # Параллельность имеет смысл, только если базовая книга тоже обрабатывается
+        base_busy = bool(highlight_info['base']) or not self.standalone_report
+        if not (highlight_info['compare'] and base_busy):
+            return False
+        if self.parallel_highlight is not None:
+            return self.parallel_highlight
+        total_size = os.path.getsize(self.file1_path) + os.path.getsize(self.file2_path)
+        return total_size >= PARALLEL_MIN_BYTES
+
+    def start_parallel_highlight(self, cells, writes):
+        """Запуск подсветки файла сравнения в отдельном процессе"""
+        target = writes.reserve(self.highlight_target(self.file2_path))
+        pool = multiprocessing.get_context('spawn').Pool(1)
+        result = pool.apply_async(highlight_sheets, (
+            self.file2_path, {self.compare_source.sheet: cells}, target))
+        pool.close()
+        return pool, result
+
+    def wait_parallel_highlight(self, pool, result):
+        """Ожидание подсветки в отдельном процессе с проверкой запроса на отмену"""
+        while not result.ready():
+            self.cancel_token.check()
+            result.wait(0.1)
+        result.get()  # Передача ошибки из дочернего процесса
+        pool.join()
+
+    def create_report_file(self, report_data, writes, summary=None):
+        """Создание файла отчета с несколькими листами (summary - таблицы листа итогов)"""
+        # Формирование пути для сохранения
+        output_dir = os.path.dirname(self.file1_path)
+        base_name = os.path.splitext(os.path.basename(self.file1_path))[0]
+        output_name = f"Сравнение_{base_name}.xlsx"
+        output_path = os.path.join(output_dir, output_name)
+
+        sheets_config = self.report_sheets_config(report_data, summary)
+        if self.standalone_report:
+            self.write_standalone_report(output_path, sheets_config, writes)
+        else:
+            self.write_report_copy(output_path, sheets_config, writes)
+        return output_path
+
+    def report_sheets_config(self, report_data, summary=None):
+        """Конфигурация листов отчета"""
+        sheets_config = {}
+        if summary is not None:
+            # Лист итогов - таблицы одна под другой вместо строк данных
+            sheets_config['Итоги'] = {
+                'blocks': summary,
+                'color': '000000',  # Черный
+                'header': f'Итоги сравнения ({self.month:02d}.{self.year})',
+            }
+        sheets_config.update({
+            'ВВ': {
+                'data': report_data['vv'],
+                'color': 'FF0000',  # Красный
+                'header': f'Различия с отметками ВВ ({self.month:02d}.{self.year})',
+                'columns': ['ID', 'ФИО', 'Дата', 'Базовый файл', 'Файл сравнения']
+            },
+            'ДП': {
+                'data': report_data['dp'],
+                'color': '0000FF',  # Синий
+                'header': f'Различия с отметками ДП ({self.month:02d}.{self.year})',
+                'columns': ['ID', 'ФИО', 'Дата', 'Базовый файл', 'Файл сравнения']
+            },
+            'Остальные': {
+                'data': report_data['other'],
+                'color': '008000',  # Зеленый
+                'header': f'Прочие различия ({self.month:02d}.{self.year})',
+                'columns': ['ID', 'ФИО', 'Дата', 'Базовый файл', 'Файл сравнения']
+            },
+            'Отсутствующие': {
+                'data': report_data['missing'],
+                'color': 'FFA500',  # Оранжевый
+                'header': 'Отсутствующие сотрудники',
+                'columns': ['ID', 'ФИО', 'Статус']
+            }
+        })
+        return sheets_config
+
+    def write_report_copy(self, output_path, sheets_config, writes):
+        """Запись листов отчета в копию базовой книги"""
+        # Базовая книга (уже с подсветкой различий)
+        wb = self.base_source.workbook
+
+        # Удаление существующих листов отчетов (кроме листа итогов: лист
+        # с таким названием в книге может быть листом пользователя)
+        for sheet, config in sheets_config.items():
+            if sheet in wb.sheetnames and 'blocks' not in config:
+                del wb[sheet]
+
+        # Создание листов
+        for sheet_name, config in sheets_config.items():
+            if 'blocks' in config:
+                # Итоги - под свободным названием: "Итоги", "Итоги (2)", ...
+                ws = wb.create_sheet(free_sheet_name(wb.sheetnames, sheet_name))
+                write_summary_sheet(ws, config['blocks'], config['color'], self.cancel_token)
+                continue
+            ws = wb.create_sheet(sheet_name)
+
+            # Заголовки столбцов
+            ws.append(config['columns'])
+
+            # Настройка стиля заголовков
+            header_font = Font(bold=True, color=config['color'])
+            for cell in ws[1]:
+                cell.font = header_font
+
+            # Добавление данных
+            for idx, row in enumerate(config['data']):
+                if idx % CANCEL_CHECK_INTERVAL == 0:
+                    self.cancel_token.check()
+                ws.append(row)
+
+            # Настройка ширины столбцов
+            widths = report_column_widths(config['columns'], config['data'])
+            for idx, width in enumerate(widths, 1):
+                ws.column_dimensions[get_column_letter(idx)].width = width
+
+        # Сохранение файла во временную копию
+        writes.save(wb, output_path)
+
+    def write_standalone_report(self, output_path, sheets_config, writes):
+        """Потоковая запись отчета в отдельную книгу (write-only режим openpyxl)
+
+        Строки сразу сбрасываются на диск, поэтому расход памяти не зависит
+        от количества расхождений.
+        """
+        wb = Workbook(write_only=True)
+
+        for sheet_name, config in sheets_config.items():
+            ws = wb.create_sheet(sheet_name)
+            if 'blocks' in config:
+                write_summary_sheet(ws, config['blocks'], config['color'], self.cancel_token)
+                continue
+
+            # Ширина столбцов задается до записи первой строки листа
+            widths = report_column_widths(config['columns'], config['data'])
+            for idx, width in enumerate(widths, 1):
+                ws.column_dimensions[get_column_letter(idx)].width = width
+
+            # Заголовки столбцов
+            header_font = Font(bold=True, color=config['color'])
+            header = []
+            for title in config['columns']:
+                cell = WriteOnlyCell(ws, value=title)
+                cell.font = header_font
+                header.append(cell)
+            ws.append(header)
+
+            # Потоковая запись данных
+            for idx, row in enumerate(config['data']):
+                if idx % CANCEL_CHECK_INTERVAL == 0:
+                    self.cancel_token.check()
+                ws.append(row)
+
+        # Сохранение файла во временную копию
+        writes.save(wb, output_path)
+        wb.close()
+
+
+def free_sheet_name(sheet_names, name):
+    """Название листа, не совпадающее с существующими (без учета регистра)"""
+    taken = {sheet.casefold() for sheet in sheet_names}
+    candidate, number = name, 1
+    while candidate.casefold() in taken:
+        number += 1
+        candidate = f"{name} ({number})"
+    return candidate
+
+
+def missing_records(missing_in_base, missing_in_compare):
+    """Записи листа отсутствующих сотрудников из пар (id, ФИО)"""
+    missing_data = [[emp_id, name, "Отсутствует в БАЗОВОМ файле"]
+                    for emp_id, name in missing_in_base]
+    missing_data.extend([emp_id, name, "Отсутствует в ФАЙЛЕ СРАВНЕНИЯ"]
+                        for emp_id, name in missing_in_compare)
+    return missing_data
+
+
+def read_timesheet(source, cache=None, cancel_token=None):
+    """Чтение колонок табеля, необходимых для сравнения, с использованием кэша.
+
+    Возвращает DataFrame строковых значений и признак того, что данные
+    взяты из кэша. Используется конвейером и фоновой подготовкой данных
+    при выборе файла.
+    """
+    # Повторно используемые данные из кэша
+    if cache is not None:
+        df = cache.get(source.file_path, REQUIRED_COLUMNS, source.sheet)
+        if df is not None:
+            # Заголовки не перечитываются: calamine разбирает для этого весь лист
+            source.restore_column_index(df.attrs.get('column_index'))
+            return df, True
+
+    # Потоковое чтение только нужных колонок листа табеля
+    df = source.read_columns(REQUIRED_COLUMNS, cancel_token=cancel_token)
+    if cache is not None:
+        df.attrs['column_index'] = source.column_index()
+        cache.put(source.file_path, REQUIRED_COLUMNS, df, source.sheet)
+    return df, False
+
+
+def report_column_widths(columns, rows):
+    """Расчет ширины столбцов листа отчета по заголовкам и строкам данных"""
+    max_lengths = [len(str(title)) for title in columns]
+    for row in rows:
+        for idx, value in enumerate(row):
+            length = len(str(value))
+            if length > max_lengths[idx]:
+                max_lengths[idx] = length
+    return [(length + 2) * 1.2 for length in max_lengths]
@@ -0,0 +1,128 @@
+"""
+ПРОФИЛИРОВАНИЕ ЭТАПОВ СРАВНЕНИЯ
+Автор: VaSeBa
+
+Замер времени, процессорного времени и пиковой памяти по этапам
+конвейера, а также счетчиков объема работы (строки, ячейки, записи
+отчета). Итог выводится в лог и сохраняется в JSON рядом с отчетом.
+"""
+
+import json
+import platform
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# Названия этапов и счетчиков для лога
+STAGE_TITLES = {
+    'load_base': 'Загрузка базового файла',
+    'load_compare': 'Загрузка файла сравнения',
+    'load_revisions': 'Загрузка редакций',
+    'validate': 'Проверка структуры',
+    'merge': 'Сопоставление',
+    'diff': 'Поиск различий',
+    'merge_runs': 'Предварительное слияние частей',
+    'sort_merge': 'Слияние частей и поиск различий',
+    'pair_sheets': 'Сопоставление листов',
+    'compare_sheets': 'Сравнение листов',
+    'highlight': 'Подсветка',
+    'summary': 'Итоги отчета',
+    'report': 'Запись отчета',
+    'history': 'Запись истории',
+}
+COUNTER_TITLES = {
+    'rows_base': 'строк в базовом файле',
+    'rows_compare': 'строк в файле сравнения',
+    'revisions': 'редакций',
+    'sheet_pairs': 'пар листов',
+    'rows_revisions': 'строк в редакциях',
+    'rows_merged': 'сопоставлено сотрудников',
+    'rows_rediffed': 'строк сравнено заново',
+    'spill_runs': 'временных частей на диске',
+    'merge_passes': 'проходов предварительного слияния',
+    'cells_compared': 'сравнено ячеек',
+    'cells_highlighted': 'подсвечено ячеек',
+    'report_rows': 'записано строк отчета',
+}
+
+
+class StageProfiler:
+    """Сбор показателей по этапам обработки"""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory  # Отслеживание памяти (замедляет работу)
+        self.stages = []  # Показатели завершенных этапов
+        self.counters = {}  # Счетчики объема работы
+        self.started = datetime.now()
+        self._own_tracing = False
+
+    def start(self):
+        """Начало профилирования"""
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._own_tracing = True
+
+    def stop(self):
+        """Окончание профилирования"""
+        if self._own_tracing:
+            tracemalloc.stop()
+            self._own_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        """Замер одного этапа"""
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        wall_started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            yield
+        finally:
+            record = {
+                'stage': name,
+                'wall_seconds': round(time.perf_counter() - wall_started, 4),
+                'cpu_seconds': round(time.thread_time() - cpu_started, 4),
+            }
+            if tracing:
+                record['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+            self.stages.append(record)
+
+    def count(self, name, value):
+        """Запись счетчика объема работы"""
+        self.counters[name] = int(value)
+
+    def summary_lines(self):
+        """Сводка по этапам для лога"""
+        lines = ["Профиль выполнения:"]
+        for record in self.stages:
+            title = STAGE_TITLES.get(record['stage'], record['stage'])
+            line = (f"  {title}: {record['wall_seconds']:.2f} с "
+                    f"(ЦП {record['cpu_seconds']:.2f} с")
+            if 'peak_mb' in record:
+                line += f", память {record['peak_mb']:.1f} МБ"
+            lines.append(line + ")")
+        total = sum(record['wall_seconds'] for record in self.stages)
+        lines.append(f"  Всего: {total:.2f} с")
+        for name, value in self.counters.items():
+            lines.append(f"  {COUNTER_TITLES.get(name, name)}: {value}")
+        return lines
+
+    def to_dict(self):
+        """Показатели в виде словаря для JSON"""
+        return {
+            'started': self.started.isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'total_wall_seconds': round(sum(r['wall_seconds'] for r in self.stages), 4),
+            'stages': self.stages,
+            'counters': self.counters,
+        }
+
+    def write_json(self, file_path, **extra):
+        """Сохранение профиля в JSON-файл"""
+        data = self.to_dict()
+        data.update(extra)
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
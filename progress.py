@@ -0,0 +1,112 @@
+"""
+ПРОГРЕСС, ОТМЕНА И БЕЗОПАСНАЯ ЗАПИСЬ ФАЙЛОВ
+Автор: VaSeBa
+
+Общие для всех этапов сравнения средства: ограничение частоты
+сообщений о прогрессе, признак отмены, проверяемый этапами конвейера,
+и запись книг через временные файлы с атомарной заменой.
+"""
+
+import os
+import shutil
+import threading
+import time
+import uuid
+
+# Через сколько строк или ячеек циклы проверяют запрос на отмену
+CANCEL_CHECK_INTERVAL = 10000
+
+
+class ComparisonCancelled(Exception):
+    """Сравнение прервано пользователем"""
+
+    def __init__(self, message="Процесс прерван пользователем"):
+        super().__init__(message)
+
+
+class CancelToken:
+    """Признак отмены, общий для всех этапов сравнения"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        """Запрос на отмену"""
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        """Была ли запрошена отмена"""
+        return self._event.is_set()
+
+    def check(self):
+        """Прерывание этапа, если запрошена отмена"""
+        if self._event.is_set():
+            raise ComparisonCancelled()
+
+
+class ProgressThrottle:
+    """Передача прогресса не чаще заданного интервала и шага в процентах"""
+
+    def __init__(self, callback, min_interval=0.1, min_delta=1):
+        self.callback = callback  # Получатель значений прогресса
+        self.min_interval = min_interval  # Минимальный интервал между сообщениями (с)
+        self.min_delta = min_delta  # Минимальное изменение значения (%)
+        self._last_value = None
+        self._last_time = 0.0
+
+    def update(self, value, force=False):
+        """Новое значение прогресса; лишние значения отбрасываются"""
+        if self.callback is None:
+            return
+        value = int(value)
+        now = time.monotonic()
+        if not force and self._last_value is not None:
+            # Окончание работы передается всегда, остальное - с ограничением
+            if value < 100 and (abs(value - self._last_value) < self.min_delta
+                                or now - self._last_time < self.min_interval):
+                return
+        if value == self._last_value:
+            return
+        self._last_value = value
+        self._last_time = now
+        self.callback(value)
+
+
+class PendingWrites:
+    """Набор книг, сохраненных во временные файлы и заменяемых вместе.
+
+    Целевые файлы меняются только в commit() переименованием, поэтому
+    прерывание на любом этапе не оставляет частично записанных файлов.
+    """
+
+    def __init__(self):
+        self._pending = []  # Пары (временный файл, целевой файл)
+
+    def save(self, workbook, path):
+        """Сохранение книги во временный файл рядом с целевым"""
+        workbook.save(self.reserve(path))
+
+    def reserve(self, path):
+        """Временный файл для целевого; записать его может и другой процесс"""
+        directory, name = os.path.split(os.path.abspath(path))
+        tmp_path = os.path.join(directory, f".~{name}.{uuid.uuid4().hex}.tmp")
+        self._pending.append((tmp_path, path))
+        return tmp_path
+
+    def commit(self):
+        """Атомарная замена целевых файлов записанными копиями"""
+        while self._pending:
+            tmp_path, path = self._pending.pop(0)
+            if os.path.exists(path):
+                shutil.copymode(path, tmp_path)  # Сохранение прав исходного файла
+            os.replace(tmp_path, path)
+
+    def discard(self):
+        """Удаление незавершенных временных файлов"""
+        while self._pending:
+            tmp_path, _ = self._pending.pop()
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
@@ -0,0 +1,275 @@
+"""
+ПРОСМОТР РЕЗУЛЬТАТОВ СРАВНЕНИЯ
+Автор: VaSeBa
+
+Панель различий последнего сравнения в окне приложения. Модель таблицы
+не копирует строки отчета: представление запрашивает данные только
+видимых строк, а номер строки таблицы переводится в строку списка
+различий через массив порядка. Индексы для отбора и сортировки (коды
+значений колонки и перестановки) строятся по колонке при первом
+обращении к ней, поэтому панель открывается сразу при любом объеме
+результатов. Отсутствующие сотрудники показываются отдельной категорией:
+в колонке файла, где сотрудника нет, - отметка «(отсутствует)».
+"""
+
+from bisect import bisect_right
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt, QTimer
+from PyQt6.QtGui import QColor
+from PyQt6.QtWidgets import (QComboBox, QHBoxLayout, QHeaderView, QLabel, QLineEdit,
+                             QTableView, QVBoxLayout, QWidget)
+
+from summary import date_sort_key, sort_key, value_ranks
+
+# Категории различий: ключ данных отчета, название и цвет (как листы отчета)
+CATEGORIES = [('vv', 'ВВ', '#FF0000'), ('dp', 'ДП', '#0000FF'), ('other', 'Прочие', '#008000'),
+              ('missing', 'Отсутствующие', '#FFA500')]
+
+# Колонки строки различий (в отчете по всем листам перед ними идет лист)
+DIFF_COLUMNS = ['ID', 'ФИО', 'Дата', 'Базовый файл', 'Файл сравнения']
+
+# Отметка файла, в котором нет сотрудника
+MISSING_MARK = '(отсутствует)'
+
+
+def missing_row(row, with_sheet):
+    """Запись отсутствующего сотрудника ([лист,] id, ФИО, статус) в колонках различий"""
+    emp_id, name, status = row[-3:]
+    in_base = status == "Отсутствует в БАЗОВОМ файле"
+    return (list(row[:1]) if with_sheet else []) + [
+        emp_id, name, '', MISSING_MARK if in_base else '', '' if in_base else MISSING_MARK]
+
+
+class DiscrepancyModel(QAbstractTableModel):
+    """Модель таблицы различий поверх списков данных отчета"""
+
+    def __init__(self, report_data, parent=None):
+        super().__init__(parent)
+        # Списки различий по категориям (строки отчета без копирования)
+        self.parts = [report_data.get(key, []) for key, _, _ in CATEGORIES]
+        self.offsets = [0]  # Номер первой строки каждой категории в общей нумерации
+        for rows in self.parts:
+            self.offsets.append(self.offsets[-1] + len(rows))
+        self.total = self.offsets[-1]  # Всего различий
+
+        # В отчете по всем листам первое поле строки - название листа
+        first = next((rows[0] for rows in self.parts[:-1] if rows), None)
+        if first is not None:
+            with_sheet = len(first) > len(DIFF_COLUMNS)
+        else:
+            with_sheet = bool(self.parts[-1]) and len(self.parts[-1][0]) > 3
+        # Отсутствующих немного (не больше числа сотрудников): их записи
+        # приводятся к колонкам различий
+        self.parts[-1] = [missing_row(row, with_sheet) for row in self.parts[-1]]
+        self.columns = ['Категория'] + (['Лист'] if with_sheet else []) + DIFF_COLUMNS
+        self.field_offset = 1  # Колонка таблицы -> поле строки различий
+        self.id_field = 1 if with_sheet else 0
+        self.date_field = self.id_field + 2
+
+        self.order = None  # Номера видимых строк в порядке показа (None - все по порядку)
+        self.codes = {}  # Поле строки -> (коды значений, уникальные значения)
+        self.permutations = {}  # Колонка -> перестановка для сортировки по возрастанию
+        self.mask = None  # Строки, прошедшие отбор (None - без отбора)
+        self.sort_column = None  # Колонка сортировки
+        self.sort_order = Qt.SortOrder.AscendingOrder
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.total if self.order is None else len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self.columns[section]
+        return str(section + 1)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ForegroundRole):
+            return None
+        position = index.row() if self.order is None else int(self.order[index.row()])
+        category = bisect_right(self.offsets, position) - 1
+        if role == Qt.ItemDataRole.ForegroundRole:
+            return QColor(CATEGORIES[category][2]) if index.column() == 0 else None
+        if index.column() == 0:
+            return CATEGORIES[category][1]
+        row = self.parts[category][position - self.offsets[category]]
+        value = row[index.column() - self.field_offset]
+        return '' if value is None else str(value)
+
+    def field_codes(self, field):
+        """Коды значений поля по всем строкам и уникальные значения (строится один раз)"""
+        if field not in self.codes:
+            values = np.fromiter((row[field] for row in chain.from_iterable(self.parts)),
+                                 dtype=object, count=self.total)
+            self.codes[field] = pd.factorize(values, use_na_sentinel=False)
+        return self.codes[field]
+
+    def permutation(self, column):
+        """Порядок строк по возрастанию значений колонки (None - исходный порядок)"""
+        if column == 0:
+            return None  # Строки и так упорядочены по категориям
+        if column not in self.permutations:
+            field = column - self.field_offset
+            codes, uniques = self.field_codes(field)
+            key = date_sort_key if field == self.date_field else sort_key
+            # Сортируются только уникальные значения, строки - по рангу значения.
+            # Ранги в наименьшем целом типе: для 8- и 16-битных ключей
+            # устойчивая сортировка numpy поразрядная (в несколько раз быстрее)
+            ranks = value_ranks(uniques, key).astype(
+                np.min_scalar_type(max(len(uniques) - 1, 0)))
+            self.permutations[column] = np.argsort(ranks[codes], kind='stable')
+        return self.permutations[column]
+
+    def dates(self):
+        """Даты различий в хронологическом порядке (без пустой даты отсутствующих)"""
+        _, uniques = self.field_codes(self.date_field)
+        return sorted((date for date in uniques if date), key=date_sort_key)
+
+    def set_filter(self, category=None, employee='', date=None):
+        """Отбор строк по категории (номер), сотруднику (id или часть ФИО) и дате"""
+        mask = None
+        if category is not None:
+            mask = np.zeros(self.total, dtype=bool)
+            mask[self.offsets[category]:self.offsets[category + 1]] = True
+        employee = employee.strip()
+        if employee:
+            id_codes, ids = self.field_codes(self.id_field)
+            name_codes, names = self.field_codes(self.id_field + 1)
+            needle = employee.casefold()
+            matched = (np.isin(id_codes, np.flatnonzero(ids.astype(str) == employee))
+                       | np.isin(name_codes, [code for code, name in enumerate(names)
+                                              if needle in str(name).casefold()]))
+            mask = matched if mask is None else mask & matched
+        if date is not None:
+            date_codes, uniques = self.field_codes(self.date_field)
+            matched = np.isin(date_codes, np.flatnonzero(uniques == date))
+            mask = matched if mask is None else mask & matched
+        self.mask = mask
+        self.update_order()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        """Сортировка по колонке (вызывается представлением при щелчке по заголовку)"""
+        self.sort_column = column if column >= 0 else None  # -1 - без сортировки
+        self.sort_order = order
+        self.update_order()
+
+    def update_order(self):
+        """Пересчет номеров видимых строк по отбору и сортировке"""
+        self.beginResetModel()
+        permutation = None if self.sort_column is None else self.permutation(self.sort_column)
+        if permutation is None:
+            order = None if self.mask is None else np.flatnonzero(self.mask)
+        else:
+            # Перестановка фильтруется за один проход без повторной сортировки
+            order = permutation if self.mask is None else permutation[self.mask[permutation]]
+        if self.sort_order == Qt.SortOrder.DescendingOrder and self.sort_column is not None:
+            order = (np.arange(self.total) if order is None else order)[::-1]
+        self.order = order
+        self.endResetModel()
+
+
+class DateComboBox(QComboBox):
+    """Список дат, заполняемый при первом открытии"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.load_items = None  # Функция, возвращающая даты (вызывается один раз)
+
+    def showPopup(self):
+        if self.load_items is not None:
+            load_items, self.load_items = self.load_items, None
+            self.blockSignals(True)
+            self.addItems(load_items())
+            self.blockSignals(False)
+        super().showPopup()
+
+
+class ResultsView(QWidget):
+    """Панель различий с отбором по категории, сотруднику и дате"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.model = None  # Модель различий последнего сравнения
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        # Отбор строк
+        filters = QHBoxLayout()
+        self.combo_category = QComboBox(self)
+        self.combo_category.addItems(["Все категории"] + [name for _, name, _ in CATEGORIES])
+        self.combo_category.currentIndexChanged.connect(self.apply_filter)
+        self.edit_employee = QLineEdit(self)
+        self.edit_employee.setPlaceholderText("ID или ФИО сотрудника")
+        self.combo_date = DateComboBox(self)
+        self.combo_date.addItem("Все даты")
+        self.combo_date.currentIndexChanged.connect(self.apply_filter)
+        self.label_count = QLabel(self)
+        for widget in (self.combo_category, self.edit_employee, self.combo_date,
+                       self.label_count):
+            filters.addWidget(widget)
+        layout.addLayout(filters)
+
+        # Отбор по сотруднику применяется после паузы в наборе текста
+        self.employee_timer = QTimer(self)
+        self.employee_timer.setSingleShot(True)
+        self.employee_timer.setInterval(300)
+        self.employee_timer.timeout.connect(self.apply_filter)
+        self.edit_employee.textChanged.connect(self.employee_timer.start)
+
+        # Таблица: строки одной высоты, размеры не пересчитываются по содержимому
+        self.table = QTableView(self)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(
+            self.table.fontMetrics().height() + 6)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.setSortingEnabled(True)
+        layout.addWidget(self.table)
+
+    def show_results(self, report_data):
+        """Отображение различий сравнения (данные отчета не копируются)"""
+        # Без сортировки: новая модель показывается в исходном порядке сразу
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        previous, self.model = self.model, DiscrepancyModel(report_data, self)
+        self.table.setModel(self.model)
+        if previous is not None:
+            previous.deleteLater()  # Данные предыдущего сравнения освобождаются
+
+        # Сброс отбора; список дат заполняется при первом открытии
+        # (индекс дат строится по запросу)
+        filters = (self.combo_category, self.edit_employee, self.combo_date)
+        for widget in filters:
+            widget.blockSignals(True)
+        self.combo_category.setCurrentIndex(0)
+        self.edit_employee.clear()
+        self.combo_date.clear()
+        self.combo_date.addItem("Все даты")
+        self.combo_date.load_items = self.model.dates
+        for widget in filters:
+            widget.blockSignals(False)
+        self.update_count()
+
+    def apply_filter(self):
+        """Применение отбора к модели"""
+        if self.model is None:
+            return
+        category = self.combo_category.currentIndex()
+        date = self.combo_date.currentIndex()
+        self.model.set_filter(category=category - 1 if category else None,
+                              employee=self.edit_employee.text(),
+                              date=self.combo_date.currentText() if date else None)
+        self.update_count()
+
+    def update_count(self):
+        """Количество показанных строк"""
+        self.label_count.setText(f"Строк: {self.model.rowCount()} из {self.model.total}")
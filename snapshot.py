@@ -0,0 +1,181 @@
+"""
+СНИМКИ РЕЗУЛЬТАТОВ ДЛЯ ПОВТОРНОГО СРАВНЕНИЯ
+Автор: VaSeBa
+
+Снимок последнего сравнения базового файла за месяц: отпечатки строк
+обоих табелей по id, найденные различия по id и состояние подсвеченных
+файлов. При повторном сравнении (базовый файл или очередная редакция
+файла сравнения изменились частично) заново сравниваются только
+сотрудники с изменившимися отпечатками, результаты остальных переносятся
+из снимка. Подсветка файла пропускается, если набор ячеек не изменился и
+файл не менялся после предыдущей записи.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+import pandas as pd
+
+from cache import default_cache_dir, file_fingerprint
+
+# Версия формата снимка (снимки другой версии не используются)
+SNAPSHOT_VERSION = 1
+
+# Колонки, входящие в отпечаток строки
+FINGERPRINT_COLUMNS = ['id', 'ФИО'] + [str(i) for i in range(1, 32)]
+
+
+class SnapshotStore:
+    """Хранилище снимков сравнения в каталоге кэша"""
+
+    def __init__(self, snapshot_dir=None):
+        # Каталог снимков
+        self.snapshot_dir = snapshot_dir or os.path.join(default_cache_dir(), 'snapshots')
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+
+    def load(self, base_path, month, year):
+        """Снимок последнего сравнения базового файла за месяц или None"""
+        try:
+            with open(self._path(base_path, month, year), 'rb') as f:
+                snapshot = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            return None
+        if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+            return None
+        return snapshot
+
+    def save(self, base_path, month, year, snapshot):
+        """Атомарная запись снимка (ошибки записи не прерывают сравнение)"""
+        snapshot = dict(snapshot, version=SNAPSHOT_VERSION)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.snapshot_dir, suffix='.tmp')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(base_path, month, year))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _path(self, base_path, month, year):
+        """Файл снимка: хэш пути базового файла и периода"""
+        key = f"{os.path.normcase(os.path.abspath(base_path))}|{month}|{year}"
+        return os.path.join(self.snapshot_dir,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pkl')
+
+
+def row_fingerprints(df):
+    """Отпечатки строк табеля (64-битный хэш id, ФИО и отметок по дням).
+
+    Считаются по исходным строковым значениям до кодирования отметок:
+    номера отметок зависят от порядка их появления и различаются между
+    запусками.
+    """
+    return pd.util.hash_pandas_object(df[FINGERPRINT_COLUMNS], index=False).to_numpy()
+
+
+def group_rows(ids, fingerprints):
+    """Группировка строк по id.
+
+    Возвращает {id: кортеж отпечатков строк} и {id: список номеров строк
+    данных} в исходном порядке строк. Повторяющиеся id сравниваются всеми
+    сочетаниями строк, поэтому отпечаток группы - отпечатки всех ее строк.
+    """
+    groups = {}
+    positions = {}
+    for position, (emp_id, fingerprint) in enumerate(zip(ids, fingerprints)):
+        if emp_id in positions:
+            positions[emp_id].append(position)
+            groups[emp_id] += (fingerprint,)
+        else:
+            positions[emp_id] = [position]
+            groups[emp_id] = (fingerprint,)
+    return groups, positions
+
+
+def changed_ids(ids, snapshot, base_groups, compare_groups):
+    """Сопоставленные id, отпечатки которых изменились с прошлого сравнения"""
+    old_base = snapshot['base_groups']
+    old_compare = snapshot['compare_groups']
+    return {emp_id for emp_id in ids
+            if base_groups[emp_id] != old_base.get(emp_id)
+            or compare_groups[emp_id] != old_compare.get(emp_id)}
+
+
+def split_results(report_data, highlight_info, base_positions, compare_positions):
+    """Разбиение различий по id.
+
+    Возвращает {id: (ВВ, ДП, прочие, ячейки)}. Ячейка хранится без
+    привязки к номерам строк листа: (номер строки в группе id базового
+    файла, номер строки в группе файла сравнения, колонка базового файла,
+    колонка файла сравнения) - так результат остается верным, если строки
+    сотрудника сместились в файле.
+    """
+    results = {}
+
+    def entry(emp_id):
+        if emp_id not in results:
+            results[emp_id] = ([], [], [], [])
+        return results[emp_id]
+
+    for category, key in enumerate(('vv', 'dp', 'other')):
+        for row in report_data[key]:
+            entry(row[0])[category].append(row)
+
+    # Строка листа -> (id, номер строки в группе)
+    base_rows = {position + 2: (emp_id, rank)
+                 for emp_id, rows in base_positions.items()
+                 for rank, position in enumerate(rows)}
+    compare_rows = {position + 2: rank
+                    for rows in compare_positions.values()
+                    for rank, position in enumerate(rows)}
+    for (base_row, base_col), (compare_row, compare_col) in zip(highlight_info['base'],
+                                                                highlight_info['compare']):
+        emp_id, base_rank = base_rows[base_row]
+        entry(emp_id)[3].append((base_rank, compare_rows[compare_row], base_col, compare_col))
+    return results
+
+
+def assemble_results(ids, results, base_positions, compare_positions):
+    """Сборка различий по id в порядке сопоставления (как при полном сравнении)"""
+    report_data = {'vv': [], 'dp': [], 'other': []}
+    highlight_info = {'base': [], 'compare': []}
+    for emp_id in ids:
+        result = results.get(emp_id)
+        if result is None:
+            continue
+        vv, dp, other, cells = result
+        report_data['vv'].extend(vv)
+        report_data['dp'].extend(dp)
+        report_data['other'].extend(other)
+        base_rows = base_positions[emp_id]
+        compare_rows = compare_positions[emp_id]
+        for base_rank, compare_rank, base_col, compare_col in cells:
+            highlight_info['base'].append((base_rows[base_rank] + 2, base_col))
+            highlight_info['compare'].append((compare_rows[compare_rank] + 2, compare_col))
+    return report_data, highlight_info
+
+
+def cells_digest(cells):
+    """Отпечаток набора подсвечиваемых ячеек (без учета порядка и повторов)"""
+    return hashlib.sha1(repr(sorted(set(cells))).encode('ascii')).hexdigest()
+
+
+def highlight_record(source_path, target_path, cells):
+    """Состояние подсвеченного файла после записи"""
+    return {'source': file_fingerprint(source_path),
+            'target': file_fingerprint(target_path),
+            'cells': cells_digest(cells)}
+
+
+def highlight_is_current(record, source_path, target_path, cells):
+    """Файл уже подсвечен этими ячейками и не менялся после записи"""
+    if not record or not os.path.exists(target_path):
+        return False
+    return (record['cells'] == cells_digest(cells)
+            and record['source'] == file_fingerprint(source_path)
+            and record['target'] == file_fingerprint(target_path))
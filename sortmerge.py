@@ -0,0 +1,162 @@
+"""
+ВНЕШНЯЯ СОРТИРОВКА И СЛИЯНИЕ ТАБЕЛЕЙ
+Автор: VaSeBa
+
+Сравнение табелей, не помещающихся в память. Каждый файл читается
+частями, каждая часть сортируется по id и сохраняется во временный файл
+на диске. Затем отсортированные части сливаются и оба табеля проходятся
+одновременно в порядке id - так же, как при внешнем объединении pandas.
+За один проход сливается не более MERGE_FAN_IN частей: если частей
+больше, они предварительно сливаются группами в более длинные части
+(несколько проходов). В памяти одновременно находится одна часть или
+не более MERGE_FAN_IN блоков временных частей каждого табеля, а размер
+блока выбирается так, чтобы их сумма не превышала размер части.
+"""
+
+import heapq
+import os
+import pickle
+from itertools import groupby, islice
+from operator import itemgetter
+
+import numpy as np
+
+# Наибольшее количество строк в одном блоке временной части
+RUN_BLOCK_ROWS = 4096
+
+# Наибольшее количество временных частей, сливаемых за один проход
+# (и одновременно открытых файлов на один табель)
+MERGE_FAN_IN = 64
+
+# Ключ сортировки строк: id, затем порядок строки в исходном файле
+ROW_KEY = itemgetter(0, 1)
+
+
+def run_block_rows(chunk_rows, fan_in=MERGE_FAN_IN):
+    """Размер блока временной части: блоки всех сливаемых частей вместе
+    занимают не больше строк, чем одна часть"""
+    return max(1, min(RUN_BLOCK_ROWS, chunk_rows // fan_in))
+
+
+def write_sorted_runs(chunks, codes, day_columns, run_dir, prefix, cancel_token=None,
+                      block_rows=RUN_BLOCK_ROWS):
+    """Сортировка частей табеля по id и запись их во временные файлы.
+
+    chunks - итератор DataFrame строковых значений (id, ФИО, дни).
+    Отметки дней кодируются общим словарем codes. Возвращает пути
+    временных частей и количество прочитанных строк.
+    """
+    run_paths = []
+    offset = 0  # Номер первой строки части среди строк данных файла
+    for chunk in chunks:
+        if cancel_token is not None:
+            cancel_token.check()
+        if chunk.empty:
+            continue
+
+        # Устойчивая сортировка сохраняет исходный порядок строк с одинаковым id
+        ids = chunk['id'].to_numpy(dtype=object)
+        order = np.argsort(ids, kind='stable')
+        positions = np.arange(offset, offset + len(chunk), dtype=np.int64)[order]
+        names = chunk['ФИО'].to_numpy(dtype=object)[order]
+        days = codes.encode(chunk[day_columns].to_numpy(dtype=object))[order]
+        ids = ids[order]
+
+        run_path = os.path.join(run_dir, f"{prefix}_{len(run_paths):05d}.run")
+        with open(run_path, 'wb') as f:
+            for start in range(0, len(chunk), block_rows):
+                block = slice(start, start + block_rows)
+                write_block(f, ids[block].tolist(), positions[block], names[block].tolist(),
+                            days[block])
+        run_paths.append(run_path)
+        offset += len(chunk)
+    return run_paths, offset
+
+
+def write_block(f, ids, positions, names, days):
+    """Запись блока строк временной части"""
+    pickle.dump((ids, positions, names, days), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def iter_run(run_path):
+    """Строки временной части: (id, номер строки, ФИО, номера отметок по дням)"""
+    with open(run_path, 'rb') as f:
+        while True:
+            try:
+                ids, positions, names, days = pickle.load(f)
+            except EOFError:
+                return
+            yield from zip(ids, positions.tolist(), names, days)
+
+
+def iter_sorted_rows(run_paths):
+    """Слияние временных частей в один поток строк, упорядоченный по id.
+
+    Открываются все переданные части: их число ограничивается заранее
+    (см. reduce_runs).
+    """
+    return heapq.merge(*(iter_run(path) for path in run_paths), key=ROW_KEY)
+
+
+def reduce_runs(run_paths, run_dir, prefix, block_rows=RUN_BLOCK_ROWS,
+                fan_in=MERGE_FAN_IN, cancel_token=None):
+    """Предварительное слияние частей группами по fan_in, пока их больше fan_in.
+
+    Слитые части удаляются. Возвращает пути оставшихся частей и
+    количество выполненных проходов.
+    """
+    passes = 0
+    while len(run_paths) > fan_in:
+        passes += 1
+        merged_paths = []
+        for start in range(0, len(run_paths), fan_in):
+            group = run_paths[start:start + fan_in]
+            run_path = os.path.join(run_dir, f"{prefix}_p{passes}_{len(merged_paths):05d}.run")
+            with open(run_path, 'wb') as f:
+                rows = iter_sorted_rows(group)
+                while True:
+                    if cancel_token is not None:
+                        cancel_token.check()
+                    block = list(islice(rows, block_rows))
+                    if not block:
+                        break
+                    write_block(f, [row[0] for row in block],
+                                np.array([row[1] for row in block], dtype=np.int64),
+                                [row[2] for row in block], np.stack([row[3] for row in block]))
+            for path in group:
+                os.remove(path)
+            merged_paths.append(run_path)
+        run_paths = merged_paths
+    return run_paths, passes
+
+
+def merge_join(base_rows, compare_rows):
+    """Совместный проход двух потоков строк, упорядоченных по id.
+
+    Порождает ('both', строка базового файла, строка файла сравнения),
+    ('base_only', строка) и ('compare_only', строка). Порядок совпадает
+    с внешним объединением pandas: по возрастанию id, при повторяющихся
+    id - все сочетания строк в исходном порядке.
+    """
+    key = itemgetter(0)
+    base_groups = groupby(base_rows, key=key)
+    compare_groups = groupby(compare_rows, key=key)
+    base_id, base_group = next(base_groups, (None, None))
+    compare_id, compare_group = next(compare_groups, (None, None))
+
+    while base_group is not None or compare_group is not None:
+        if compare_group is None or (base_group is not None and base_id < compare_id):
+            for row in base_group:
+                yield 'base_only', row
+            base_id, base_group = next(base_groups, (None, None))
+        elif base_group is None or compare_id < base_id:
+            for row in compare_group:
+                yield 'compare_only', row
+            compare_id, compare_group = next(compare_groups, (None, None))
+        else:
+            compare_list = list(compare_group)
+            for base_row in base_group:
+                for compare_row in compare_list:
+                    yield 'both', base_row, compare_row
+            base_id, base_group = next(base_groups, (None, None))
+            compare_id, compare_group = next(compare_groups, (None, None))
@@ -0,0 +1,244 @@
+"""
+ИТОГИ ОТЧЕТА СРАВНЕНИЯ
+Автор: VaSeBa
+
+Лист «Итоги» для руководства: количество различий по категориям, по
+дням, по переходам отметок (например, Я → ВВ), сотрудники с наибольшим
+числом различий с тепловой картой по дням и итоги по всем сотрудникам.
+Значения колонок различий один раз переводятся в целочисленные коды,
+все итоги считаются подсчетом кодов (numpy.bincount) без циклов по
+строкам, поэтому лист строится за доли секунды и при сотнях тысяч
+различий.
+"""
+
+from bisect import bisect_right
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import ColorScaleRule
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+# Категории различий: ключи данных отчета и названия
+CATEGORY_KEYS = ['vv', 'dp', 'other']
+CATEGORY_NAMES = ['ВВ', 'ДП', 'Прочие']
+
+# Количество сотрудников в таблице с наибольшим числом различий
+TOP_EMPLOYEES = 20
+
+# Обозначение пустой ячейки в переходах отметок
+EMPTY_MARK = '(пусто)'
+
+# Наибольший размер таблицы встречаемости пар кодов (байт)
+PAIR_TABLE_LIMIT = 64 * 2 ** 20
+
+# Цвет наибольшего значения тепловой карты
+HEATMAP_COLOR = 'F8696B'
+
+
+def sort_key(value):
+    """Ключ сортировки значения ячейки: числа по величине, затем строки"""
+    if value is None or value == '':
+        return (2, 0, '')
+    if isinstance(value, (int, float)):
+        return (0, value, '')
+    text = str(value)
+    if text.isdigit():
+        return (0, int(text), '')
+    return (1, 0, text.casefold())
+
+
+def date_sort_key(value):
+    """Ключ сортировки даты отчета (ДД.ММ.ГГГГ) в хронологическом порядке"""
+    return tuple(reversed(str(value).split('.')))
+
+
+def value_ranks(uniques, key):
+    """Ранги уникальных значений в порядке сортировки по ключу"""
+    ranks = np.empty(len(uniques), dtype=np.int64)
+    ranks[sorted(range(len(uniques)), key=lambda code: key(uniques[code]))] = \
+        np.arange(len(uniques))
+    return ranks
+
+
+def pair_counts(major, minor, minor_size, major_size):
+    """Количество различных значений minor для каждого значения major"""
+    pairs = major.astype(np.int64) * minor_size + minor
+    if major_size * minor_size <= PAIR_TABLE_LIMIT:
+        # Таблица встречаемости пар: без сортировки, в десятки раз быстрее unique
+        seen = np.zeros(major_size * minor_size, dtype=bool)
+        seen[pairs] = True
+        return seen.reshape(major_size, minor_size).sum(axis=1)
+    return np.bincount(np.unique(pairs) // minor_size, minlength=major_size)
+
+
+def summary_blocks(report_data, top=TOP_EMPLOYEES):
+    """Таблицы листа итогов по данным отчета.
+
+    Возвращает список словарей: title (заголовок таблицы), columns,
+    rows и необязательный heatmap (номер первой колонки тепловой карты,
+    с 1). В отчете по всем листам первое поле строк различий - лист.
+    """
+    parts = [report_data[key] for key in CATEGORY_KEYS]
+    sizes = [len(rows) for rows in parts]
+    total = sum(sizes)
+    offsets = np.cumsum([0] + sizes).tolist()  # Номер первой строки каждой категории
+    first = next((rows[0] for rows in parts if rows), None)
+    shift = 1 if first is not None and len(first) > 5 else 0  # Поле листа перед id
+
+    def codes(field):
+        """Коды значений поля по всем строкам различий и уникальные значения"""
+        values = np.fromiter((row[shift + field] for row in chain.from_iterable(parts)),
+                             dtype=object, count=total)
+        return pd.factorize(values, use_na_sentinel=False)
+
+    categories = np.repeat(np.arange(len(CATEGORY_KEYS)), sizes)
+    emp_codes, emp_ids = codes(0)
+    date_codes, dates = codes(2)
+    base_codes, base_values = codes(3)
+    compare_codes, compare_values = codes(4)
+    n_emp, n_dates, n_cat = len(emp_ids), len(dates), len(CATEGORY_KEYS)
+
+    # Итоги по категориям
+    cat_counts = np.bincount(categories, minlength=n_cat)
+    cat_emps = pair_counts(categories, emp_codes, n_emp, n_cat)
+    cat_days = pair_counts(categories, date_codes, n_dates, n_cat)
+    blocks = [{
+        'title': 'Итоги по категориям',
+        'columns': ['Категория', 'Различий', 'Сотрудников', 'Дней'],
+        'rows': [[name, int(count), int(emps), int(days)] for name, count, emps, days
+                 in zip(CATEGORY_NAMES, cat_counts, cat_emps, cat_days)]
+                + [['Всего', total, n_emp, n_dates]],
+    }]
+    if not total:
+        return blocks
+
+    # Различия по дням в хронологическом порядке
+    date_order = np.argsort(value_ranks(dates, date_sort_key))
+    per_date = np.bincount(date_codes * n_cat + categories,
+                           minlength=n_dates * n_cat).reshape(n_dates, n_cat)
+    date_emps = pair_counts(date_codes, emp_codes, n_emp, n_dates)
+    blocks.append({
+        'title': 'Различия по дням',
+        'columns': ['Дата'] + CATEGORY_NAMES + ['Всего', 'Сотрудников'],
+        'rows': [[dates[code]] + per_date[code].tolist()
+                 + [int(per_date[code].sum()), int(date_emps[code])]
+                 for code in date_order.tolist()],
+    })
+
+    # Переходы отметок (значение в базовом файле -> в файле сравнения);
+    # категория перехода определяется самими отметками
+    n_compare = len(compare_values)
+    transitions = base_codes.astype(np.int64) * n_compare + compare_codes
+    keys, first_rows, inverse, counts = np.unique(
+        transitions, return_index=True, return_inverse=True, return_counts=True)
+    trans_emps = pair_counts(inverse, emp_codes, n_emp, len(keys))
+    order = np.lexsort((keys, -counts))
+    blocks.append({
+        'title': 'Переходы отметок',
+        'columns': ['Переход', 'Категория', 'Различий', 'Сотрудников', 'Доля, %'],
+        'rows': [[f"{base_values[key // n_compare] or EMPTY_MARK} → "
+                  f"{compare_values[key % n_compare] or EMPTY_MARK}",
+                  CATEGORY_NAMES[categories[first_rows[idx]]], int(counts[idx]),
+                  int(trans_emps[idx]), round(100 * int(counts[idx]) / total, 2)]
+                 for idx, key in zip(order.tolist(), keys[order].tolist())],
+    })
+
+    # Сотрудники по убыванию числа различий (при равенстве - по id)
+    per_emp = np.bincount(emp_codes * n_cat + categories,
+                          minlength=n_emp * n_cat).reshape(n_emp, n_cat)
+    emp_totals = per_emp.sum(axis=1)
+    emp_days = pair_counts(emp_codes, date_codes, n_dates, n_emp)
+    emp_order = np.lexsort((value_ranks(emp_ids, sort_key), -emp_totals))
+    # ФИО - из первой строки сотрудника (коды выдаются в порядке появления)
+    first_positions = np.flatnonzero(np.diff(np.maximum.accumulate(emp_codes),
+                                             prepend=-1) > 0)
+    names = []
+    for position in first_positions.tolist():
+        category = bisect_right(offsets, position) - 1
+        names.append(parts[category][position - offsets[category]][shift + 1])
+
+    # Тепловая карта: различия по дням у сотрудников с наибольшим их числом
+    leaders = emp_order[:top]
+    leader_rank = np.full(n_emp, -1)
+    leader_rank[leaders] = np.arange(len(leaders))
+    selected = leader_rank[emp_codes] >= 0
+    date_rank = np.empty(n_dates, dtype=np.int64)
+    date_rank[date_order] = np.arange(n_dates)
+    heatmap = np.bincount(
+        leader_rank[emp_codes[selected]] * n_dates + date_rank[date_codes[selected]],
+        minlength=len(leaders) * n_dates).reshape(len(leaders), n_dates)
+    # Дни подписываются без года (и месяца), если период один
+    sorted_dates = [dates[code] for code in date_order.tolist()]
+    same_year = len({date[-4:] for date in sorted_dates}) == 1
+    same_month = len({date[3:] for date in sorted_dates}) == 1
+    labels = [date[:2] if same_month else date[:5] if same_year else date
+              for date in sorted_dates]
+    columns = ['Место', 'ID', 'ФИО'] + CATEGORY_NAMES + ['Всего']
+    blocks.append({
+        'title': f'Сотрудники с наибольшим числом различий (первые {len(leaders)}) по дням',
+        'columns': columns + labels,
+        'rows': [[place, emp_ids[code], names[code]] + per_emp[code].tolist()
+                 + [int(emp_totals[code])] + [count or None for count in counts]
+                 for place, code, counts in zip(range(1, len(leaders) + 1),
+                                                leaders.tolist(), heatmap.tolist())],
+        'heatmap': len(columns) + 1,
+    })
+
+    blocks.append({
+        'title': 'Различия по сотрудникам',
+        'columns': ['ID', 'ФИО'] + CATEGORY_NAMES + ['Всего', 'Дней'],
+        'rows': [[emp_ids[code], names[code]] + per_emp[code].tolist()
+                 + [int(emp_totals[code]), int(emp_days[code])]
+                 for code in emp_order.tolist()],
+    })
+    return blocks
+
+
+def write_summary_sheet(ws, blocks, color, cancel_token=None):
+    """Запись таблиц итогов одну под другой.
+
+    Подходит и для обычного листа, и для листа write-only книги: ширина
+    колонок задается до первой строки, строки только добавляются.
+    """
+    # Ширина колонок по заголовкам и значениям таблиц (без названий таблиц)
+    widths = {}
+    for block in blocks:
+        for row in chain([block['columns']], block['rows']):
+            for idx, value in enumerate(row, 1):
+                widths[idx] = max(widths.get(idx, 0), len(str(value)))
+    for idx, width in widths.items():
+        ws.column_dimensions[get_column_letter(idx)].width = (width + 2) * 1.2
+
+    title_font = Font(bold=True, size=12, color=color)
+    header_font = Font(bold=True)
+    row_number = 0  # Номер последней записанной строки
+    for block in blocks:
+        if cancel_token is not None:
+            cancel_token.check()
+        title = WriteOnlyCell(ws, value=block['title'])
+        title.font = title_font
+        ws.append([title])
+        header = []
+        for name in block['columns']:
+            cell = WriteOnlyCell(ws, value=name)
+            cell.font = header_font
+            header.append(cell)
+        ws.append(header)
+        for row in block['rows']:
+            ws.append(row)
+        first_row, row_number = row_number + 3, row_number + 2 + len(block['rows'])
+
+        # Цветовая шкала от белого (0) до красного (наибольшее значение)
+        if block.get('heatmap') and block['rows']:
+            cells = (f"{get_column_letter(block['heatmap'])}{first_row}:"
+                     f"{get_column_letter(len(block['columns']))}{row_number}")
+            ws.conditional_formatting.add(cells, ColorScaleRule(
+                start_type='num', start_value=0, start_color='FFFFFF',
+                end_type='max', end_color=HEATMAP_COLOR))
+
+        # Пустая строка между таблицами
+        ws.append([])
+        row_number += 1
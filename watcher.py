@@ -0,0 +1,282 @@
+"""
+НАБЛЮДЕНИЕ ЗА КАТАЛОГОМ ВЫГРУЗОК
+Автор: VaSeBa
+
+Режим службы без графического интерфейса: каталог, в который учетная
+система выгружает табели, опрашивается с заданным интервалом, каждая
+новая (или перезаписанная) выгрузка сопоставляется с базовым табелем
+по правилу имен и сравнивается с ним.
+
+- Недописанные файлы пропускаются: выгрузка берется в работу, когда ее
+  размер и время изменения не менялись заданное время, файл открывается
+  на чтение и (для xlsx/xlsm) является целым zip-архивом.
+- Сравнения выполняются ограниченным пулом процессов. Выгрузки одного
+  базового табеля всегда идут в один и тот же процесс: сравнения,
+  записывающие подсветку в базовый файл, не выполняются одновременно,
+  а разобранный базовый табель остается в памяти процесса и не
+  читается заново.
+- Количество ожидающих сравнений ограничено: готовые выгрузки сверх
+  лимита остаются в каталоге до освобождения места в очереди.
+- Базовая книга целиком не загружается: отчет записывается отдельным
+  файлом, подсвечивается только выгрузка (см. cli.run_watch).
+"""
+
+import os
+import re
+import signal
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import DEFAULT_MEMORY_ENTRIES, MemoryTimesheetCache, TimesheetCache
+from jobs import run_job
+from multisheet import sheet_period
+from pipeline import HIGHLIGHT_COPY_SUFFIX
+
+# Расширения файлов табелей
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm', '.xls')
+
+# Префиксы имен отчетов, которые сравнение записывает рядом с файлами
+REPORT_PREFIXES = ('Сравнение_', 'Сводное_сравнение_')
+
+# Время неизменности файла, после которого он считается дописанным (с)
+DEFAULT_SETTLE_SECONDS = 2.0
+
+# Интервал опроса каталога (с)
+DEFAULT_POLL_SECONDS = 1.0
+
+# Кэш табелей процесса пула (создается инициализатором процесса)
+_worker_cache = None
+
+
+class NamingRule:
+    """Правило сопоставления выгрузки с базовым табелем по имени файла.
+
+    Без шаблона базовый табель - файл с тем же именем в каталоге базовых
+    файлов. Шаблон - регулярное выражение для имени выгрузки без
+    расширения; группа base (или первая группа) - имя базового файла без
+    расширения, например "(?P<base>.+)_\\d{8}_\\d{6}" для выгрузок
+    вида "Отдел1_20250314_093000.xlsx" и базового файла "Отдел1.xlsx".
+    """
+
+    def __init__(self, base_dir, pattern=None):
+        self.base_dir = os.path.normcase(os.path.abspath(base_dir))  # Каталог базовых файлов
+        self.pattern = re.compile(pattern) if pattern else None  # Шаблон имени выгрузки
+        if self.pattern is not None and not self.pattern.groups:
+            raise ValueError("В шаблоне имени выгрузки нет группы с именем базового файла")
+
+    def base_stem(self, file_path):
+        """Имя базового файла без расширения или None, если имя не подходит"""
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        if self.pattern is None:
+            return stem
+        match = self.pattern.fullmatch(stem)
+        if match is None:
+            return None
+        return match.group('base' if 'base' in self.pattern.groupindex else 1)
+
+    def base_for(self, file_path):
+        """Базовый табель выгрузки или None (расширение - как у выгрузки, затем любое)"""
+        stem = self.base_stem(file_path)
+        if not stem:
+            return None
+        ext = os.path.splitext(file_path)[1].lower()
+        for candidate_ext in (ext,) + EXCEL_EXTENSIONS:
+            candidate = os.path.join(self.base_dir, stem + candidate_ext)
+            if os.path.isfile(candidate) and not same_file(candidate, file_path):
+                return candidate
+        return None
+
+    def is_base(self, file_path):
+        """Файл лежит в каталоге базовых файлов и не является выгрузкой"""
+        directory = os.path.normcase(os.path.dirname(os.path.abspath(file_path)))
+        if directory != self.base_dir:
+            return False
+        # В общем каталоге выгрузки отличаются от базовых файлов шаблоном имени
+        return self.pattern is None or self.base_stem(file_path) is None
+
+
+def same_file(first, second):
+    """Пути указывают на один файл"""
+    return (os.path.normcase(os.path.abspath(first))
+            == os.path.normcase(os.path.abspath(second)))
+
+
+def is_candidate(name):
+    """Файл может быть выгрузкой: табель Excel, но не временный файл и не отчет"""
+    stem, ext = os.path.splitext(name)
+    if ext.lower() not in EXCEL_EXTENSIONS:
+        return False
+    if name.startswith(('~$', '.', '.~lock')):
+        return False  # Временные файлы Excel и LibreOffice
+    return not (name.startswith(REPORT_PREFIXES) or stem.endswith(HIGHLIGHT_COPY_SUFFIX))
+
+
+def is_complete(file_path):
+    """Файл открывается на чтение и (xlsx/xlsm) является целым zip-архивом.
+
+    У недописанной книги xlsx нет оглавления архива в конце файла.
+    """
+    try:
+        with open(file_path, 'rb'):
+            pass
+        if os.path.splitext(file_path)[1].lower() == '.xls':
+            return True
+        return zipfile.is_zipfile(file_path)
+    except OSError:
+        return False  # Файл заблокирован записывающей программой
+
+
+def init_worker(retain, capacity, use_cache):
+    """Инициализация процесса пула: кэш табелей в памяти на все время работы"""
+    global _worker_cache
+    # Ctrl+C получает только наблюдатель: запущенные сравнения завершаются
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_cache = MemoryTimesheetCache(TimesheetCache() if use_cache else None,
+                                         capacity=capacity, retain=retain)
+
+
+def compare_export(base, compare, month, year, options):
+    """Сравнение выгрузки с базовым табелем в процессе пула"""
+    return run_job([(base, compare, month, year)], cache=_worker_cache, **options)[0]
+
+
+class FolderWatcher:
+    """Наблюдение за каталогом выгрузок и сравнение новых файлов"""
+
+    def __init__(self, watch_dir, rule, month, year, workers=1, max_pending=None,
+                 settle=DEFAULT_SETTLE_SECONDS, keep_bases=DEFAULT_MEMORY_ENTRIES,
+                 use_cache=True, process_existing=False, job_options=None,
+                 on_result=None, on_message=None):
+        self.watch_dir = watch_dir  # Каталог выгрузок
+        self.rule = rule  # Правило сопоставления с базовыми табелями
+        self.month = month  # Период, если он не указан в имени выгрузки
+        self.year = year
+        self.settle = settle  # Время неизменности файла перед сравнением (с)
+        self.max_pending = max_pending or 2 * workers  # Наибольшее число ожидающих сравнений
+        self.job_options = dict(job_options or {})  # Параметры сравнения (см. jobs.run_job)
+        self.on_result = on_result  # Обработчик итога сравнения
+        self.on_message = on_message  # Обработчик сообщений
+        self.processed = {}  # Путь выгрузки -> состояние (размер, время) последней обработки
+        self.changing = {}  # Путь выгрузки -> (состояние, время первого наблюдения)
+        self.running = {}  # Future -> (путь выгрузки, базовый файл)
+        # Процессы пула по одному на группу базовых файлов: выгрузки одного
+        # базового табеля всегда попадают в процесс, где он уже разобран
+        self.executors = [
+            ProcessPoolExecutor(max_workers=1, initializer=init_worker,
+                                initargs=(rule.is_base, keep_bases, use_cache))
+            for _ in range(workers)]
+        if not process_existing:
+            # Уже лежащие в каталоге файлы считаются обработанными
+            for path, state in self.scan():
+                self.processed[path] = state
+
+    def scan(self):
+        """Файлы-кандидаты каталога и их состояние (размер, время изменения)"""
+        files = []
+        try:
+            entries = list(os.scandir(self.watch_dir))
+        except OSError as e:
+            self.log(f"Каталог недоступен: {e}")
+            return files
+        for entry in entries:
+            if not is_candidate(entry.name):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue  # Файл удален или переименован во время просмотра
+            files.append((entry.path, (stat.st_size, stat.st_mtime_ns)))
+        return files
+
+    def ready_files(self):
+        """Новые и измененные выгрузки, запись которых завершена"""
+        now = time.monotonic()
+        busy = {path for path, _ in self.running.values()}
+        present = set()
+        ready = []
+        for path, state in self.scan():
+            present.add(path)
+            if path in busy or self.processed.get(path) == state:
+                continue
+            if self.rule.is_base(path):
+                continue  # Базовый табель в общем каталоге - не выгрузка
+            seen = self.changing.get(path)
+            if seen is None or seen[0] != state:
+                self.changing[path] = (state, now)  # Файл еще записывается
+            elif now - seen[1] >= self.settle and state[0] and is_complete(path):
+                ready.append((seen[1], path, state))
+        # Удаленные файлы больше не отслеживаются
+        for path in [path for path in self.changing if path not in present]:
+            del self.changing[path]
+        return [(path, state) for _, path, state in sorted(ready)]
+
+    def poll(self):
+        """Один шаг наблюдения: итоги завершенных сравнений и запуск новых"""
+        self.collect()
+        for path, state in self.ready_files():
+            if len(self.running) >= self.max_pending:
+                break  # Очередь заполнена: файл будет взят на следующем шаге
+            del self.changing[path]
+            base = self.rule.base_for(path)
+            if base is None:
+                self.processed[path] = state
+                self.log(f"{os.path.basename(path)}: базовый табель не найден, пропуск")
+                continue
+            month, year = sheet_period(os.path.splitext(os.path.basename(path))[0],
+                                       self.month, self.year)
+            executor = self.executors[self.worker_index(base)]
+            future = executor.submit(compare_export, base, path, month, year,
+                                     self.job_options)
+            self.running[future] = (path, base)
+            self.log(f"{os.path.basename(path)} -> {os.path.basename(base)}: "
+                     f"сравнение за {month:02d}.{year}")
+
+    def collect(self, wait=False):
+        """Обработка завершенных сравнений (wait - дождаться всех запущенных)"""
+        for future in list(self.running):
+            if not (wait or future.done()):
+                continue
+            path, base = self.running.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:  # Аварийное завершение процесса пула
+                result = {'base': base, 'compare': path, 'ok': False, 'error': str(e)}
+            # Подсветка изменяет выгрузку: новое состояние не считается новой версией
+            try:
+                stat = os.stat(path)
+                self.processed[path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                self.processed.pop(path, None)
+            if self.on_result is not None:
+                self.on_result(result)
+
+    def worker_index(self, base):
+        """Номер процесса пула для базового файла (постоянный на время работы)"""
+        key = os.path.normcase(os.path.abspath(base))
+        return zlib.crc32(key.encode('utf-8')) % len(self.executors)
+
+    def run(self, poll_interval=DEFAULT_POLL_SECONDS, stop=None):
+        """Наблюдение до прерывания (Ctrl+C) или до истинного значения stop()"""
+        try:
+            while stop is None or not stop():
+                self.poll()
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            self.log("Остановка: ожидание запущенных сравнений...")
+        finally:
+            self.close()
+
+    def close(self):
+        """Завершение запущенных сравнений и процессов пула"""
+        self.collect(wait=True)
+        for executor in self.executors:
+            executor.shutdown()
+
+    def log(self, message):
+        """Передача сообщения обработчику"""
+        if self.on_message is not None:
+            self.on_message(message)